@@ -1,11 +1,18 @@
 import asyncio
 from collections.abc import MutableMapping
+import io
+import math
+import os
 import urllib.parse
 
+from .cache import PacketCache  # noqa
+from .options import MAX_TIMEOUT, MIN_TIMEOUT
 from .packet import Mode, Opcode, Request
+from .pool import EndpointPool  # noqa
 from .protocol import InboundDataProtocol, OutboundDataProtocol
 from .response import FileResponse, Response, StreamResponse  # noqa
 from .server import RequestHandler
+from .shaping import Pacer, Shaper, TokenBucket  # noqa
 from .streams import StreamReader
 
 
@@ -35,11 +42,42 @@ class Server(MutableMapping):
         return len(self._state)
 
 
+def _client_options(blksize=None, windowsize=None, timeout=None,
+                    tsize=None):
+    options = {}
+    if blksize is not None:
+        options['blksize'] = blksize
+    if windowsize is not None:
+        options['windowsize'] = windowsize
+    if timeout is not None:
+        # The option only carries whole seconds
+        options['timeout'] = min(max(math.ceil(timeout), MIN_TIMEOUT),
+                                 MAX_TIMEOUT)
+    if tsize is not None:
+        options['tsize'] = tsize
+    return options
+
+
+def _data_size(data):
+    if isinstance(data, memoryview):
+        return data.nbytes
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+
+    try:
+        return os.fstat(data.fileno()).st_size - data.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
 class _Request:
-    def __init__(self, resource, local_addr=None, *, loop=None):
+    def __init__(self, resource, local_addr=None, *, blksize=None,
+                 windowsize=None, timeout=None, tsize=False, loop=None):
         if loop is None:
             loop = asyncio.get_event_loop()
         self._loop = loop
+        self._timeout = timeout
+        self._protocol = None
         self.stream = StreamReader()
 
         url = urllib.parse.urlsplit(resource)
@@ -47,35 +85,46 @@ class _Request:
             raise ValueError('Unsupported scheme')
 
         self.request = Request(
-            Opcode.RRQ, filename=url.path[1:], mode=Mode.OCTET)
+            Opcode.RRQ, filename=url.path[1:], mode=Mode.OCTET,
+            options=_client_options(blksize=blksize, windowsize=windowsize,
+                                    timeout=timeout,
+                                    tsize=0 if tsize else None))
         self.remote_addr = (url.hostname, url.port or 69)
         self.local_addr = local_addr or ('0.0.0.0', 0)
 
     async def __aenter__(self):
         transport, protocol = await self._loop.create_datagram_endpoint(
             lambda: InboundDataProtocol(
-                self.stream, tid=None, loop=self._loop),
+                self.stream, tid=None, requested=self.request.options,
+                timeout=self._timeout, loop=self._loop),
             local_addr=self.local_addr)
 
-        transport.sendto(bytes(self.request), self.remote_addr)
+        self._protocol = protocol
+        protocol.request(self.request, self.remote_addr)
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
         if not exc_type:
             await self.stream.wait_eof()
 
+    @property
+    def size(self):
+        """The size of the file, if requested and the server told us."""
+        if self._protocol is not None:
+            return self._protocol.options.get('tsize')
+
     async def data(self):
-        payload = bytearray()
-        async for chunk in self.stream:
-            payload.extend(chunk)
-        return bytes(payload)
+        """Read the whole file into a ``bytearray``."""
+        # The size, if asked for, comes in the OACK ahead of any data
+        return await self.stream.readall(lambda: self.size)
 
 
 def read(*args, **kwargs):
     return _Request(*args, **kwargs)
 
 
-async def write(resource, data, *, timeout=2.0, local_addr=None, loop=None):
+async def write(resource, data, *, blksize=None, windowsize=None,
+                timeout=None, rate=None, local_addr=None, loop=None):
     if loop is None:
         loop = asyncio.get_event_loop()
 
@@ -86,22 +135,30 @@ async def write(resource, data, *, timeout=2.0, local_addr=None, loop=None):
     remote_addr = (url.hostname, url.port or 69)
     local_addr = local_addr or ('0.0.0.0', 0)
 
+    # rate is in bytes per second
+    pacer = Pacer(TokenBucket(rate)) if rate is not None else None
     transport, protocol = await loop.create_datagram_endpoint(
-        lambda: OutboundDataProtocol(tid=None, timeout=timeout, loop=loop),
+        lambda: OutboundDataProtocol(tid=None, timeout=timeout,
+                                     pacer=pacer, loop=loop),
         local_addr=local_addr)
 
-    await protocol.start(url.path[1:], remote_addr)
+    await protocol.start(url.path[1:], remote_addr,
+                         options=_client_options(blksize=blksize,
+                                                 windowsize=windowsize,
+                                                 timeout=timeout,
+                                                 tsize=_data_size(data)))
 
+    blksize = protocol.blksize
     if isinstance(data, (bytes, bytearray, memoryview)):
-        while True:
-            chunk, data = data[:512], data[512:]
-            await protocol.write(chunk)
-            if len(chunk) < 512:
-                break
+        # Cut blocks from a view; slicing the data itself would copy
+        # everything left on every block
+        view = memoryview(data).cast('B')
+        for offset in range(0, len(view) + 1, blksize):
+            await protocol.write(view[offset:offset + blksize])
 
     else:
         while True:
-            chunk = data.read(512)
+            chunk = data.read(blksize)
             await protocol.write(chunk)
-            if len(chunk) < 512:
+            if len(chunk) < blksize:
                 break
@@ -0,0 +1,139 @@
+"""A cache of files already encoded as DATA packets.
+
+When a fleet of devices boots it asks for the same few files over and
+over. Rather than read and encode them for every transfer, the cache
+keeps each file as the complete list of DATA packets for a block size,
+header included, and every transfer of it sends those same ``bytes``
+objects. Entries are evicted least recently used first once the cache
+holds more than ``max_size`` bytes, and dropped as soon as the file on
+disk is seen to have changed.
+"""
+
+import asyncio
+import collections
+import os
+
+from .fileio import get_executor
+from .packet import encode_data
+
+
+def _identity(stat):
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def encoded_size(size, blksize):
+    """The bytes needed to hold a file of ``size`` as DATA packets."""
+    return size + (size // blksize + 1) * 4
+
+
+class CachedFile:
+    __slots__ = ('identity', 'size', 'packets', 'nbytes')
+
+    def __init__(self, identity, size, packets):
+        self.identity = identity
+        self.size = size
+        self.packets = packets
+        self.nbytes = sum(len(packet) for packet in packets)
+
+
+def _load(path, blksize):
+    with open(path, 'rb') as fobj:
+        identity = _identity(os.fstat(fobj.fileno()))
+        data = memoryview(fobj.read())
+
+    packets = [
+        encode_data((n + 1) & 0xffff, data[offset:offset + blksize])
+        for n, offset in enumerate(range(0, len(data) + 1, blksize))]
+    return CachedFile(identity, len(data), packets)
+
+
+class PacketCache:
+    """Least recently used files, encoded as DATA packets.
+
+    Entries are keyed by path and block size, so a file fetched with two
+    block sizes is cached twice. Files that wouldn't fit in ``max_size``
+    on their own aren't cached at all.
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024, *, executor=None):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._executor = executor
+        self._entries = collections.OrderedDict()
+        self._loading = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    async def get(self, path, blksize, *, loop=None):
+        """Return the :class:`CachedFile` for ``path``, loading it if needed.
+
+        Concurrent misses for the same file share one load. Returns
+        ``None`` for a file too large to cache.
+        """
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        executor = self._executor or get_executor()
+
+        stat = await loop.run_in_executor(executor, os.stat, path)
+        key = (path, blksize)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.identity == _identity(stat):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self._remove(key)
+
+        self.misses += 1
+        if encoded_size(stat.st_size, blksize) > self.max_size:
+            return None
+
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = self._loading[key] = loop.run_in_executor(
+                executor, _load, path, blksize)
+            loading.add_done_callback(
+                lambda future: self._loaded(key, future))
+        return await asyncio.shield(loading)
+
+    def _loaded(self, key, future):
+        del self._loading[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        entry = future.result()
+        if entry.nbytes > self.max_size:
+            return  # grew since it was checked
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self.size += entry.nbytes
+
+        while self.size > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry.nbytes
+
+    def invalidate(self, path=None):
+        """Drop the entries for ``path``, or every entry."""
+        for key in list(self._entries):
+            if path is None or key[0] == path:
+                self._remove(key)
+
+    def clear(self):
+        self.invalidate()
+        self.hits = self.misses = self.evictions = 0
@@ -10,6 +10,7 @@ async def proxy_from_url(request, url):
             if resp.status != 200:
                 raise FileNotFoundError()
 
+            transfer.content_length = resp.content_length
             await transfer.prepare(request)
             while True:
                 chunk = await resp.content.read(8192)
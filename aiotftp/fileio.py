@@ -0,0 +1,241 @@
+"""File reads and writes for transfers, done off the event loop.
+
+A read or write that has to wait on a slow disk or network filesystem
+would stall every session on the loop, so transfers go through a small
+shared thread pool instead. Reads run ahead of the ACK clock and writes
+run behind the incoming data, each by a bounded amount, and use
+``pread``/``pwrite`` at explicit offsets so several can be in flight at
+once without being reordered.
+"""
+
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .helpers import preallocate
+
+MAX_WORKERS = 16
+
+READ_SIZE = 64 * 1024
+DEFAULT_READAHEAD = 256 * 1024
+
+WRITE_SIZE = 64 * 1024
+DEFAULT_WRITE_BEHIND = 1024 * 1024
+
+_executor = None
+
+
+def get_executor():
+    """The thread pool shared by all file I/O in this process.
+
+    It's kept apart from the loop's default executor so that slow disks
+    can't hold up anything else run there, such as name lookups.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(MAX_WORKERS)
+    return _executor
+
+
+def _reset_executor():
+    # The pool's threads don't survive a fork
+    global _executor
+    _executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_executor)
+
+
+def _open_for_reading(path):
+    fobj = open(path, 'rb')
+    try:
+        return fobj, os.fstat(fobj.fileno()).st_size
+    except BaseException:
+        fobj.close()
+        raise
+
+
+def _open_for_writing(path, size):
+    fobj = open(path, 'wb')
+    try:
+        preallocate(fobj, size)
+    except BaseException:
+        fobj.close()
+        raise
+    return fobj
+
+
+def _pwrite(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def _finish(fd, size, fsync):
+    # Drop whatever was preallocated beyond what was actually written
+    os.ftruncate(fd, size)
+    if fsync:
+        os.fsync(fd)
+
+
+class FileReader:
+    """Read a file one block at a time, with reads queued ahead.
+
+    Up to ``readahead`` bytes are read in the executor ahead of the
+    block last returned, so the next blocks are usually in memory by
+    the time the peer acknowledges the current one.
+    """
+
+    def __init__(self, fobj, size, *, readahead=DEFAULT_READAHEAD,
+                 loop=None, executor=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._executor = executor or get_executor()
+        self._fobj = fobj
+        self._readahead = readahead
+
+        self._chunk = None
+        self._pending = deque()
+        self._position = 0
+        self._view = memoryview(b'')
+        self._offset = 0
+        self._eof = False
+
+        self.size = size
+
+    @classmethod
+    async def open(cls, path, *, readahead=DEFAULT_READAHEAD, loop=None,
+                   executor=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        executor = executor or get_executor()
+
+        fobj, size = await loop.run_in_executor(
+            executor, _open_for_reading, path)
+        return cls(fobj, size, readahead=readahead, loop=loop,
+                   executor=executor)
+
+    def _fill(self):
+        # Reads are whole multiples of the block size, so a block never
+        # straddles two of them. Past the size seen when the file was
+        # opened only one read is queued at a time, in case it grew.
+        depth = max(self._readahead // self._chunk, 1)
+        while (not self._eof and len(self._pending) < depth
+               and (self._position < self.size or not self._pending)):
+            self._pending.append(self._loop.run_in_executor(
+                self._executor, os.pread, self._fobj.fileno(),
+                self._chunk, self._position))
+            self._position += self._chunk
+
+    async def read(self, blksize):
+        """Return the next block; one shorter than ``blksize`` is the last.
+
+        ``blksize`` must be the same on every call.
+        """
+        if self._chunk is None:
+            self._chunk = max(READ_SIZE // blksize, 1) * blksize
+
+        if self._offset >= len(self._view) and not self._eof:
+            self._fill()
+            data = await self._pending.popleft()
+            self._eof = len(data) < self._chunk
+            self._view = memoryview(data)
+            self._offset = 0
+            self._fill()
+
+        block = self._view[self._offset:self._offset + blksize]
+        self._offset += blksize
+        return block
+
+    async def close(self):
+        # Let queued reads finish rather than cancel them, as those
+        # already running in the executor would still use the descriptor
+        pending, self._pending = self._pending, deque()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._fobj.close()
+
+
+class FileWriter:
+    """Write a file in the executor, behind the data coming in.
+
+    Writes are batched and handed to the executor; :meth:`write` only
+    waits once more than ``write_behind`` bytes are queued for the disk.
+    """
+
+    def __init__(self, fobj, *, write_behind=DEFAULT_WRITE_BEHIND,
+                 loop=None, executor=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._executor = executor or get_executor()
+        self._fobj = fobj
+        self._write_behind = write_behind
+
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._queued = 0
+
+        self.size = 0
+
+    @classmethod
+    async def open(cls, path, size=None, *,
+                   write_behind=DEFAULT_WRITE_BEHIND, loop=None,
+                   executor=None):
+        """Create ``path``, reserving ``size`` bytes for it if given."""
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        executor = executor or get_executor()
+
+        fobj = await loop.run_in_executor(
+            executor, _open_for_writing, path, size)
+        return cls(fobj, write_behind=write_behind, loop=loop,
+                   executor=executor)
+
+    async def write(self, data):
+        self._buffer.extend(data)
+        if len(self._buffer) >= WRITE_SIZE:
+            self._flush()
+
+        while self._queued > self._write_behind:
+            await self._reap()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+
+        data, self._buffer = self._buffer, bytearray()
+        future = self._loop.run_in_executor(
+            self._executor, _pwrite, self._fobj.fileno(), data, self.size)
+        self._pending.append((future, len(data)))
+        self.size += len(data)
+        self._queued += len(data)
+
+    async def _reap(self):
+        future, length = self._pending.popleft()
+        try:
+            await future
+        finally:
+            self._queued -= length
+
+    async def close(self, *, fsync=True):
+        """Wait for everything to reach the file, then close it.
+
+        Unless ``fsync`` is false the data is flushed to disk as well.
+        """
+        self._flush()
+        try:
+            while self._pending:
+                await self._reap()
+            await self._loop.run_in_executor(
+                self._executor, _finish, self._fobj.fileno(), self.size,
+                fsync)
+        finally:
+            await asyncio.gather(*(future for future, _ in self._pending),
+                                 return_exceptions=True)
+            self._pending.clear()
+            self._fobj.close()
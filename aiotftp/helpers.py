@@ -1,3 +1,8 @@
+import errno
+import os
+import socket
+
+
 def set_result(fut, result):
     if not fut.done():
         fut.set_result(result)
@@ -12,3 +17,32 @@ def get_tid(addr):
     if len(addr) == 4 and addr[2:] != (0, 0):
         raise ValueError("Unsupported IPv6 address type: {}".format(addr))
     return addr[:2]
+
+
+def raw_socket(transport):
+    """The socket under ``transport``, if it can be sent on directly.
+
+    asyncio only hands out a wrapper around the socket, without
+    ``sendmsg``; the selector event loop's wrapper keeps the real socket
+    on it. Other transports give ``None``, as do transports that batch
+    their own sends, which sending around would only defeat.
+    """
+    if getattr(transport, 'batched', False):
+        return None
+
+    sock = transport.get_extra_info('socket')
+    sock = getattr(sock, '_sock', sock)
+    if isinstance(sock, socket.socket) and hasattr(sock, 'sendmsg'):
+        return sock
+
+
+def preallocate(fobj, size):
+    """Reserve space on disk for a file, where the platform supports it."""
+    if not size or not hasattr(os, 'posix_fallocate'):
+        return
+
+    try:
+        os.posix_fallocate(fobj.fileno(), 0, size)
+    except OSError as exc:
+        if exc.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+            raise
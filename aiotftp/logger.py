@@ -1,13 +1,40 @@
+"""The access log, a line per transfer in ``aiotftp.access``.
+
+``AccessLogger`` formats and logs each line as the transfer ends, on
+the event loop. ``QueuedAccessLogger`` only takes down what the line
+needs there, and formats and logs it in batches on a thread of its
+own, so slow handlers can't hold up the loop. ``JSONFormatter`` gives
+each line as a JSON object of its fields instead.
+"""
+
+import collections
 from collections import namedtuple
-import datetime
+import json
 import logging
 import os
 import re
+import threading
+import time as _time
+from typing import Dict, List, Tuple
 
 access_log = logging.getLogger('aiotftp.access')
 
 KeyMethod = namedtuple('KeyMethod', 'key method')
 
+_TIME_FORMAT = '[%d/%b/%Y:%H:%M:%S +0000]'
+_cached_time = (None, None)
+
+
+def _format_time(when):
+    # Lines come in far faster than the second changes
+    global _cached_time
+    second = int(when)
+    cached, text = _cached_time
+    if second != cached:
+        text = _time.strftime(_TIME_FORMAT, _time.gmtime(second))
+        _cached_time = (second, text)
+    return text
+
 
 class AccessLogger:
     LOG_FORMAT_MAP = {
@@ -25,16 +52,17 @@ class AccessLogger:
     LOG_FORMAT = '%a %t %o "%r" %b %T'
     FORMAT_RE = re.compile(r'%([atPorbD]|Tf?)')
     CLEANUP_RE = re.compile(r'(%[^s])')
-    _FORMAT_CACHE = {}  # type: Dict[str, Tuple[str, List[KeyMethod]]]
+    _FORMAT_CACHE: Dict[Tuple[type, str], Tuple[str, List[KeyMethod]]] = {}
 
     def __init__(self, logger, log_format=LOG_FORMAT):
         self.logger = logger
         self.log_format = log_format
 
-        _compiled_format = AccessLogger._FORMAT_CACHE.get(log_format)
+        key = (type(self), log_format)
+        _compiled_format = AccessLogger._FORMAT_CACHE.get(key)
         if not _compiled_format:
             _compiled_format = self.compile_format(log_format)
-            AccessLogger._FORMAT_CACHE[log_format] = _compiled_format
+            AccessLogger._FORMAT_CACHE[key] = _compiled_format
 
         self._log_format, self._methods = _compiled_format
 
@@ -43,7 +71,7 @@ class AccessLogger:
 
         for atom in self.FORMAT_RE.findall(log_format):
             format_key = self.LOG_FORMAT_MAP[atom[0]]
-            m = getattr(AccessLogger, '_format_%s' % atom[0])
+            m = getattr(type(self), '_format_%s' % atom[0])
             methods.append(KeyMethod(format_key, m))
 
         log_format = self.FORMAT_RE.sub(r'%s', log_format)
@@ -59,9 +87,7 @@ class AccessLogger:
 
     @staticmethod
     def _format_t(request, response, time):
-        now = datetime.datetime.utcnow()
-        start_time = now - datetime.timedelta(seconds=time)
-        return start_time.strftime('[%d/%b/%Y:%H:%M:%S +0000]')
+        return _format_time(_time.time() - time)
 
     @staticmethod
     def _format_P(request, response, time):
@@ -102,6 +128,12 @@ class AccessLogger:
                 for key, method in self._methods)
 
     def log(self, request, response, time):
+        self._log(request, response, time)
+
+    def close(self):
+        """Finish logging; there is nothing to finish here."""
+
+    def _log(self, request, response, time):
         try:
             fmt_info = self._format_line(request, response, time)
 
@@ -121,3 +153,93 @@ class AccessLogger:
             self.logger.info(self._log_format % tuple(values), extra=extra)
         except Exception:
             self.logger.exception("Error in logging")
+
+
+_Request = namedtuple('_Request', 'remote method filename ended')
+_Response = namedtuple('_Response', 'length')
+
+
+class QueuedAccessLogger(AccessLogger):
+    """Format and log the access log on a background thread.
+
+    The event loop only queues the fields a line needs. The thread
+    wakes every ``interval`` seconds, or once ``batch_size`` lines are
+    waiting, and logs whatever has been queued, so the loop's cost per
+    line stays the same however far behind the thread falls. Past
+    ``max_queued`` waiting lines, more are counted in ``dropped``
+    rather than queued.
+    """
+
+    def __init__(self, logger, log_format=AccessLogger.LOG_FORMAT, *,
+                 batch_size=256, interval=0.1, max_queued=65536):
+        super().__init__(logger, log_format)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_queued = max_queued
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closing = False
+
+    def log(self, request, response, time):
+        if len(self._queue) >= self.max_queued:
+            self.dropped += 1
+            return
+
+        if request is not None:
+            request = _Request(request.remote, request.method,
+                               request.filename, _time.time())
+        if response:
+            response = _Response(response.length)
+        self._queue.append((request, response, time))
+
+        if self._thread is None:
+            self._closing = False
+            self._thread = threading.Thread(
+                target=self._run, name='aiotftp-access-log', daemon=True)
+            self._thread.start()
+        elif (len(self._queue) >= self.batch_size
+              and not self._wakeup.is_set()):
+            self._wakeup.set()
+
+    def close(self):
+        """Log everything queued, and stop the thread."""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._closing = True
+            self._wakeup.set()
+            thread.join()
+
+    def _run(self):
+        queue = self._queue
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            closing = self._closing
+            while queue:
+                self._log(*queue.popleft())
+            if closing:
+                return
+
+    @staticmethod
+    def _format_t(request, response, time):
+        ended = request.ended if request is not None else _time.time()
+        return _format_time(ended - time)
+
+
+class JSONFormatter(logging.Formatter):
+    """Format access log lines as JSON objects of their fields.
+
+    The fields are those in the access log format, under the names in
+    ``AccessLogger.LOG_FORMAT_MAP``, along with the ``time`` the line
+    was logged.
+    """
+
+    def format(self, record):
+        entry = {'time': record.created}
+        for key in AccessLogger.LOG_FORMAT_MAP.values():
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = None if value == '-' else value
+        return json.dumps(entry)
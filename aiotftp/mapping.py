@@ -0,0 +1,89 @@
+"""Read-only file mappings shared by concurrent transfers.
+
+Serving a file by reading it block by block copies every block out of
+the page cache once per transfer. Mapping it instead lets each block be
+sent straight from a ``memoryview`` slice of the mapping, and transfers
+of the same file at the same time share one mapping rather than each
+reading their own copy. A mapping is refcounted and unmapped when the
+last transfer using it finishes.
+
+Mapped files must be treated as immutable. Unlike a read, which just
+comes up short, touching a page of a mapping past the end of a file
+someone has since truncated raises ``SIGBUS`` in the whole process.
+Files replaced by renaming over them are safe.
+"""
+
+import mmap
+import os
+from typing import Dict, Tuple
+
+# (st_dev, st_ino, st_size, st_mtime_ns) -> MappedFile
+_MAPPINGS: Dict[Tuple[int, int, int, int], 'MappedFile'] = {}
+
+
+class MappedFile:
+    __slots__ = ('key', 'size', 'view', '_mmap', '_refs')
+
+    def __init__(self, key, fobj, size):
+        self.key = key
+        self.size = size
+        self._refs = 0
+
+        if size:
+            self._mmap = mmap.mmap(fobj.fileno(), size,
+                                   access=mmap.ACCESS_READ)
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+            self.view = memoryview(self._mmap)
+        else:
+            # mmap refuses empty files
+            self._mmap = None
+            self.view = memoryview(b'')
+
+    @property
+    def closed(self):
+        return self._refs == 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def acquire(self):
+        self._refs += 1
+        return self
+
+    def release(self):
+        self._refs -= 1
+        if self._refs:
+            return
+
+        if _MAPPINGS.get(self.key) is self:
+            del _MAPPINGS[self.key]
+
+        self.view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A slice is still held somewhere; the mapping goes away
+                # once that is collected.
+                pass
+
+
+def open_mapping(path):
+    """Map ``path``, or share the mapping already open for it.
+
+    A file is identified by device, inode, size and modification time, so
+    a file replaced or rewritten since it was mapped gets a fresh mapping
+    while transfers already under way finish from the old one.
+    """
+    with open(path, 'rb') as fobj:
+        stat = os.fstat(fobj.fileno())
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+        mapping = _MAPPINGS.get(key)
+        if mapping is None:
+            mapping = _MAPPINGS[key] = MappedFile(key, fobj, stat.st_size)
+    return mapping.acquire()
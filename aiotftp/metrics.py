@@ -0,0 +1,181 @@
+"""Counters and histograms describing what the server is doing.
+
+Metrics are plain objects updated in place, so recording one on the
+hot path costs an attribute increment, and a histogram observation a
+bisect into a handful of fixed bounds. ``REGISTRY.expose()`` renders
+all of them in the Prometheus text format, ready to be served from a
+local HTTP endpoint or written out periodically.
+
+Each process keeps its own figures, reset on fork; under
+``aiotftp.runner`` every worker has to be scraped, or dumped,
+separately.
+"""
+
+import bisect
+import math
+import os
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    __slots__ = ('name', 'help', 'value')
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, self.value
+
+
+class Gauge(Counter):
+    __slots__ = ()
+    kind = 'gauge'
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class Histogram:
+    __slots__ = ('name', 'help', 'bounds', 'counts', 'sum')
+    kind = 'histogram'
+
+    def __init__(self, name, help, bounds):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(sorted(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            total += count
+            yield '{}_bucket{{le="{}"}}'.format(
+                self.name, _format_value(float(bound))), total
+        yield self.name + '_sum', self.sum
+        yield self.name + '_count', total
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def __iter__(self):
+        return iter(self._metrics.values())
+
+    def __getitem__(self, name):
+        return self._metrics[name]
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError('Duplicate metric {}'.format(metric.name))
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help):
+        return self._add(Counter(name, help))
+
+    def gauge(self, name, help):
+        return self._add(Gauge(name, help))
+
+    def histogram(self, name, help, bounds):
+        return self._add(Histogram(name, help, bounds))
+
+    def reset(self):
+        """Zero everything, as after forking a worker."""
+        for metric in self._metrics.values():
+            if isinstance(metric, Histogram):
+                metric.counts = [0] * len(metric.counts)
+                metric.sum = 0
+            else:
+                metric.value = 0
+
+    def expose(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for name, value in metric.samples():
+                lines.append('{} {}'.format(name, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+if hasattr(os, 'register_at_fork'):
+    # A worker starts from zero rather than the parent's figures
+    os.register_at_fork(after_in_child=REGISTRY.reset)
+
+_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+            1.0, 2.5, 5.0, 10.0)
+_LONG_SECONDS = (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0,
+                 900.0, 3600.0)
+_RATES = tuple(2 ** n * 1024 for n in range(0, 18, 2))
+
+REQUESTS = REGISTRY.counter(
+    'tftp_requests_total', 'Requests received, including duplicates')
+DUPLICATE_REQUESTS = REGISTRY.counter(
+    'tftp_duplicate_requests_total',
+    'Retransmitted requests dropped while their session was live')
+REJECTED_REQUESTS = REGISTRY.counter(
+    'tftp_rejected_requests_total',
+    'Requests refused because the admission queue was full')
+ACTIVE_SESSIONS = REGISTRY.gauge(
+    'tftp_active_sessions', 'Sessions currently transferring')
+QUEUED_SESSIONS = REGISTRY.gauge(
+    'tftp_queued_sessions', 'Sessions waiting to be admitted')
+FAILED_SESSIONS = REGISTRY.counter(
+    'tftp_failed_sessions_total', 'Sessions ended by an error')
+
+BLOCKS_SENT = REGISTRY.counter(
+    'tftp_blocks_sent_total', 'DATA blocks sent, not counting resends')
+BYTES_SENT = REGISTRY.counter(
+    'tftp_bytes_sent_total', 'Payload bytes sent, not counting resends')
+RETRANSMITS = REGISTRY.counter(
+    'tftp_retransmitted_blocks_total', 'DATA blocks sent again')
+DUPLICATE_ACKS = REGISTRY.counter(
+    'tftp_duplicate_acks_total',
+    'ACKs for blocks that were already acknowledged')
+BLOCKS_RECEIVED = REGISTRY.counter(
+    'tftp_blocks_received_total', 'DATA blocks received in order')
+BYTES_RECEIVED = REGISTRY.counter(
+    'tftp_bytes_received_total', 'Payload bytes received in order')
+OUT_OF_ORDER = REGISTRY.counter(
+    'tftp_out_of_order_blocks_total',
+    'DATA blocks received out of order or duplicated')
+TIMEOUTS = REGISTRY.counter(
+    'tftp_timeouts_total', 'Retransmission timeouts, either direction')
+
+RTT = REGISTRY.histogram(
+    'tftp_rtt_seconds', 'Measured round trip times', _SECONDS)
+FIRST_BLOCK = REGISTRY.histogram(
+    'tftp_first_block_seconds',
+    'From receiving a request to sending its first DATA block', _SECONDS)
+TRANSFER_TIME = REGISTRY.histogram(
+    'tftp_transfer_seconds', 'From request to the end of a transfer',
+    _LONG_SECONDS)
+THROUGHPUT = REGISTRY.histogram(
+    'tftp_transfer_bytes_per_second', 'Average rate of each transfer',
+    _RATES)
@@ -0,0 +1,456 @@
+"""Batched datagram I/O with Linux's ``recvmmsg`` and ``sendmmsg``.
+
+asyncio's datagram transports make one system call and one trip
+through the event loop for every datagram in either direction. Under a
+storm of requests that overhead, rather than the transfers themselves,
+is what limits a server. :class:`MmsgEngine` creates datagram endpoints
+like ``loop.create_datagram_endpoint`` whose transports read everything
+waiting on a socket in batches of ``recvmmsg`` calls, and queue
+outgoing datagrams to send with a single ``sendmmsg`` per socket once
+per loop iteration.
+
+Only available on Linux; ``AVAILABLE`` says whether it can be used.
+"""
+
+import asyncio
+import collections
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import sys
+
+# Python < 3.8 has no asyncio.trsock, and hands out the socket itself
+TransportSocket = getattr(getattr(asyncio, 'trsock', None),
+                          'TransportSocket', lambda sock: sock)
+
+DEFAULT_BATCH = 64
+MAX_DATAGRAM = 65536
+
+# At most this many batches are read per wakeup, so one busy socket
+# can't keep the loop from everything else.
+MAX_READS = 4
+
+MSG_TRUNC = 0x20
+
+_SOCKADDR_SIZE = 128
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _send_iovec(ctypes.Structure):
+    # Pointing a c_char_p at a bytes object doesn't copy it
+    _fields_ = [('iov_base', ctypes.c_char_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+def _mmsghdr(name_type, iovec):
+    class msghdr(ctypes.Structure):
+        _fields_ = [('msg_name', name_type),
+                    ('msg_namelen', ctypes.c_uint32),
+                    ('msg_iov', ctypes.POINTER(iovec)),
+                    ('msg_iovlen', ctypes.c_size_t),
+                    ('msg_control', ctypes.c_void_p),
+                    ('msg_controllen', ctypes.c_size_t),
+                    ('msg_flags', ctypes.c_int)]
+
+    class mmsghdr(ctypes.Structure):
+        _fields_ = [('msg_hdr', msghdr),
+                    ('msg_len', ctypes.c_uint)]
+
+    return mmsghdr
+
+
+_recv_mmsghdr = _mmsghdr(ctypes.c_void_p, _iovec)
+_send_mmsghdr = _mmsghdr(ctypes.c_char_p, _send_iovec)
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        recvmmsg, sendmmsg = libc.recvmmsg, libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_recv_mmsghdr),
+                         ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_send_mmsghdr),
+                         ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return libc
+
+
+_libc = _load_libc()
+AVAILABLE = _libc is not None
+
+
+def decode_sockaddr(raw):
+    family = int.from_bytes(raw[0:2], sys.byteorder)
+    port = int.from_bytes(raw[2:4], 'big')
+    if family == socket.AF_INET:
+        return socket.inet_ntop(socket.AF_INET, raw[4:8]), port
+    if family == socket.AF_INET6:
+        return (socket.inet_ntop(socket.AF_INET6, raw[8:24]), port,
+                int.from_bytes(raw[4:8], 'big'),
+                int.from_bytes(raw[24:28], sys.byteorder))
+    raise ValueError('Unsupported address family {}'.format(family))
+
+
+def encode_sockaddr(addr):
+    host, port = addr[:2]
+    if ':' in host:
+        flowinfo, scope_id = (addr[2:] + (0, 0))[:2]
+        return b''.join((
+            socket.AF_INET6.to_bytes(2, sys.byteorder),
+            port.to_bytes(2, 'big'), flowinfo.to_bytes(4, 'big'),
+            socket.inet_pton(socket.AF_INET6, host),
+            scope_id.to_bytes(4, sys.byteorder)))
+    return b''.join((
+        socket.AF_INET.to_bytes(2, sys.byteorder), port.to_bytes(2, 'big'),
+        socket.inet_pton(socket.AF_INET, host), bytes(8)))
+
+
+def _is_numeric(host):
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+        except (OSError, ValueError):
+            continue
+        return family
+    return None
+
+
+class MmsgDatagramTransport(asyncio.DatagramTransport):
+    # OutboundDataProtocol mustn't send around the batching
+    batched = True
+
+    def __init__(self, engine, sock, protocol, peer=None):
+        super().__init__({
+            'socket': TransportSocket(sock),
+            'sockname': sock.getsockname(),
+            'peername': peer,
+        })
+        self._engine = engine
+        self._loop = engine._loop
+        self._sock = sock
+        self._fileno = sock.fileno()
+        self._protocol = protocol
+        self._peer = peer
+        self._queue = collections.deque()
+        self._buffer_size = 0
+        self._scheduled = False
+        self._writing = False
+        self._closing = False
+
+        self._protocol.connection_made(self)
+        self._loop.add_reader(self._fileno, self._read_ready)
+
+    def get_protocol(self):
+        return self._protocol
+
+    def set_protocol(self, protocol):
+        self._protocol = protocol
+
+    def is_closing(self):
+        return self._closing
+
+    def get_write_buffer_size(self):
+        return self._buffer_size
+
+    def sendto(self, data, addr=None):
+        if self._closing:
+            return
+        if self._peer is not None:
+            if addr is not None and addr[:2] != self._peer[:2]:
+                raise ValueError(
+                    'Invalid address: must be None or {}'.format(self._peer))
+            addr = None
+        elif addr is None:
+            raise ValueError('Unconnected transport needs an address')
+
+        if type(data) is not bytes:
+            data = bytes(data)
+        self._queue.append((data, addr))
+        self._buffer_size += len(data)
+        self._engine._schedule_flush(self)
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fileno)
+        if not self._queue:
+            self._loop.call_soon(self._finish)
+
+    def abort(self):
+        self._queue.clear()
+        self._buffer_size = 0
+        if not self._closing:
+            self._closing = True
+            self._loop.remove_reader(self._fileno)
+        self._loop.call_soon(self._finish)
+
+    def _finish(self):
+        if self._sock is None:
+            return
+        if self._writing:
+            self._loop.remove_writer(self._fileno)
+            self._writing = False
+        try:
+            self._protocol.connection_lost(None)
+        finally:
+            self._sock.close()
+            self._sock = None
+
+    def _read_ready(self):
+        engine = self._engine
+        for _ in range(MAX_READS):
+            if self._closing:
+                return
+            try:
+                received = engine._receive(self._fileno)
+            except OSError as exc:
+                self._protocol.error_received(exc)
+                return
+
+            datagram_received = self._protocol.datagram_received
+            for data, addr in received:
+                datagram_received(data, addr)
+                if self._closing:
+                    return
+            if len(received) < engine.batch:
+                return
+
+    def _write_ready(self):
+        self._loop.remove_writer(self._fileno)
+        self._writing = False
+        self._flush()
+
+    def _flush(self):
+        self._scheduled = False
+        if self._writing or self._sock is None:
+            return
+
+        queue = self._queue
+        while queue:
+            try:
+                sent = self._engine._send(self._fileno, queue)
+            except (BlockingIOError, InterruptedError):
+                self._loop.add_writer(self._fileno, self._write_ready)
+                self._writing = True
+                return
+            except OSError as exc:
+                # Like asyncio, give up on the datagram that failed
+                data, _ = queue.popleft()
+                self._buffer_size -= len(data)
+                self._protocol.error_received(exc)
+                continue
+
+            for _ in range(sent):
+                data, _ = queue.popleft()
+                self._buffer_size -= len(data)
+
+        if self._closing:
+            self._loop.call_soon(self._finish)
+
+
+class MmsgEngine:
+    """Create datagram endpoints with batched transports on ``loop``.
+
+    ``batch`` datagrams are read or written per system call; received
+    datagrams larger than ``max_size`` are dropped. The receive buffers
+    are shared by every endpoint of the engine.
+    """
+
+    def __init__(self, *, batch=DEFAULT_BATCH, max_size=MAX_DATAGRAM,
+                 loop=None):
+        if not AVAILABLE:
+            raise RuntimeError('recvmmsg/sendmmsg are not available')
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self.batch = batch
+        self.max_size = max_size
+
+        self._dirty = []
+        self._flush_scheduled = False
+        self._addresses = {}
+        self._sockaddrs = {}
+        self._received = batch
+
+        self._rbuffer = bytearray(batch * max_size)
+        self._rview = memoryview(self._rbuffer)
+        base = ctypes.addressof(
+            (ctypes.c_char * len(self._rbuffer)).from_buffer(self._rbuffer))
+        self._rnames = ctypes.create_string_buffer(batch * _SOCKADDR_SIZE)
+        names = ctypes.addressof(self._rnames)
+        self._riov = (_iovec * batch)()
+        self._rmsgs = (_recv_mmsghdr * batch)()
+        for n in range(batch):
+            self._riov[n].iov_base = base + n * max_size
+            self._riov[n].iov_len = max_size
+            header = self._rmsgs[n].msg_hdr
+            header.msg_iov = ctypes.pointer(self._riov[n])
+            header.msg_iovlen = 1
+            header.msg_name = names + n * _SOCKADDR_SIZE
+
+        self._siov = (_send_iovec * batch)()
+        self._smsgs = (_send_mmsghdr * batch)()
+        for n in range(batch):
+            header = self._smsgs[n].msg_hdr
+            header.msg_iov = ctypes.pointer(self._siov[n])
+            header.msg_iovlen = 1
+
+    async def create_datagram_endpoint(self, protocol_factory,
+                                       local_addr=None, remote_addr=None,
+                                       *, family=0, reuse_port=None,
+                                       sock=None):
+        """Like ``loop.create_datagram_endpoint``, for a batched transport."""
+        if sock is None:
+            sock = await self._create_socket(local_addr, remote_addr,
+                                             family, reuse_port)
+        sock.setblocking(False)
+
+        try:
+            peer = sock.getpeername()
+        except OSError:
+            peer = None
+
+        protocol = protocol_factory()
+        transport = MmsgDatagramTransport(self, sock, protocol, peer)
+        return transport, protocol
+
+    async def _resolve(self, addr, family):
+        host, port = addr[:2]
+        numeric = _is_numeric(host)
+        if numeric is not None:
+            return numeric, addr
+        infos = await self._loop.getaddrinfo(
+            host, port, family=family, type=socket.SOCK_DGRAM)
+        if not infos:
+            raise OSError('getaddrinfo() returned empty list')
+        family, _, _, _, resolved = infos[0]
+        return family, resolved
+
+    async def _create_socket(self, local_addr, remote_addr, family,
+                             reuse_port):
+        local = remote = None
+        if local_addr is not None:
+            family, local = await self._resolve(local_addr, family)
+        if remote_addr is not None:
+            family, remote = await self._resolve(remote_addr, family)
+
+        sock = socket.socket(family or socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setblocking(False)
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            if local is not None:
+                sock.bind(local)
+            if remote is not None:
+                sock.connect(remote)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _receive(self, fileno):
+        # The kernel only touches the headers it filled in last time
+        msgs = self._rmsgs
+        for n in range(self._received):
+            msgs[n].msg_hdr.msg_namelen = _SOCKADDR_SIZE
+        self._received = 0
+
+        count = _libc.recvmmsg(fileno, msgs, self.batch, socket.MSG_DONTWAIT,
+                               None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return ()
+            raise OSError(err, os.strerror(err))
+
+        self._received = count
+        view = self._rview
+        names = self._rnames.raw
+        max_size = self.max_size
+        addresses = self._addresses
+
+        received = []
+        for n in range(count):
+            msg = msgs[n]
+            header = msg.msg_hdr
+            if header.msg_flags & MSG_TRUNC:
+                continue
+
+            offset = n * max_size
+            data = bytes(view[offset:offset + msg.msg_len])
+
+            start = n * _SOCKADDR_SIZE
+            raw = names[start:start + header.msg_namelen]
+            addr = addresses.get(raw)
+            if addr is None:
+                if len(addresses) > 4096:
+                    addresses.clear()
+                addr = addresses[raw] = decode_sockaddr(raw)
+            received.append((data, addr))
+        return received
+
+    def _sockaddr(self, addr):
+        sockaddr = self._sockaddrs.get(addr)
+        if sockaddr is None:
+            if len(self._sockaddrs) > 4096:
+                self._sockaddrs.clear()
+            sockaddr = self._sockaddrs[addr] = encode_sockaddr(addr)
+        return sockaddr
+
+    def _send(self, fileno, queue):
+        iov = self._siov
+        msgs = self._smsgs
+
+        count = min(len(queue), self.batch)
+        for n in range(count):
+            data, addr = queue[n]
+            iov[n].iov_base = data
+            iov[n].iov_len = len(data)
+
+            header = msgs[n].msg_hdr
+            if addr is None:
+                header.msg_name = None
+                header.msg_namelen = 0
+            else:
+                sockaddr = self._sockaddr(addr)
+                header.msg_name = sockaddr
+                header.msg_namelen = len(sockaddr)
+
+        sent = _libc.sendmmsg(fileno, msgs, count, socket.MSG_DONTWAIT)
+        if sent < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise BlockingIOError(err, os.strerror(err))
+            if err == errno.EINTR:
+                raise InterruptedError(err, os.strerror(err))
+            raise OSError(err, os.strerror(err))
+        return sent
+
+    def _schedule_flush(self, transport):
+        if transport._scheduled or transport._writing:
+            return
+        transport._scheduled = True
+        self._dirty.append(transport)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        dirty, self._dirty = self._dirty, []
+        for transport in dirty:
+            transport._flush()
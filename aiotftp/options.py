@@ -0,0 +1,108 @@
+"""TFTP option extension negotiation (RFC 2347, 2348, 2349 and 7440)."""
+
+DEFAULT_BLKSIZE = 512
+MIN_BLKSIZE = 8
+MAX_BLKSIZE = 65464
+
+DEFAULT_WINDOWSIZE = 1
+MIN_WINDOWSIZE = 1
+MAX_WINDOWSIZE = 65535
+
+DEFAULT_TIMEOUT = 2.0
+MIN_TIMEOUT = 1
+MAX_TIMEOUT = 255
+
+# The largest upload a server accepts by default
+DEFAULT_MAX_TSIZE = 4 * 1024 ** 3
+
+
+class OptionError(ValueError):
+    """The peer asked for, or acknowledged, options we can't accept."""
+
+
+def _parse_int(value, minimum, maximum=None):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    if value < minimum or (maximum is not None and value > maximum):
+        return None
+    return value
+
+
+def normalize(options):
+    return {key.lower(): value for key, value in options.items()}
+
+
+def negotiate(options, *, max_blksize=MAX_BLKSIZE,
+              max_windowsize=MAX_WINDOWSIZE, max_tsize=DEFAULT_MAX_TSIZE):
+    """Return the subset of the requested options the server will honour.
+
+    Unknown or malformed options are silently dropped, as allowed by
+    RFC 2347; an empty result means no OACK should be sent. A ``tsize``
+    past ``max_tsize`` raises ``OptionError``, and the request should be
+    refused with error 8.
+    """
+    requested = normalize(options)
+    accepted = {}
+
+    blksize = _parse_int(requested.get('blksize'), MIN_BLKSIZE)
+    if blksize is not None:
+        accepted['blksize'] = min(blksize, max_blksize, MAX_BLKSIZE)
+
+    windowsize = _parse_int(requested.get('windowsize'), MIN_WINDOWSIZE)
+    if windowsize is not None and max_windowsize:
+        accepted['windowsize'] = min(windowsize, max_windowsize,
+                                     MAX_WINDOWSIZE)
+
+    timeout = _parse_int(requested.get('timeout'), MIN_TIMEOUT, MAX_TIMEOUT)
+    if timeout is not None:
+        accepted['timeout'] = timeout
+
+    # For a WRQ this is the size of the upload; for a RRQ it is a request
+    # for the size of the file, which only the response can answer.
+    tsize = _parse_int(requested.get('tsize'), 0)
+    if tsize is not None:
+        if max_tsize is not None and tsize > max_tsize:
+            raise OptionError('File too large: tsize {} is over {}'.format(
+                tsize, max_tsize))
+        accepted['tsize'] = tsize
+
+    return accepted
+
+
+def accept(requested, offered):
+    """Validate an OACK from the server against what the client asked for."""
+    requested = normalize(requested)
+    accepted = {}
+
+    for key, value in normalize(offered).items():
+        if key not in requested:
+            raise OptionError('Unrequested option {!r}'.format(key))
+
+        if key == 'blksize':
+            blksize = _parse_int(value, MIN_BLKSIZE, int(requested[key]))
+            if blksize is None:
+                raise OptionError('Invalid blksize {!r}'.format(value))
+            accepted[key] = blksize
+
+        elif key == 'windowsize':
+            windowsize = _parse_int(value, MIN_WINDOWSIZE,
+                                    int(requested[key]))
+            if windowsize is None:
+                raise OptionError('Invalid windowsize {!r}'.format(value))
+            accepted[key] = windowsize
+
+        elif key == 'timeout':
+            timeout = _parse_int(value, MIN_TIMEOUT, MAX_TIMEOUT)
+            if timeout != int(requested[key]):
+                raise OptionError('Invalid timeout {!r}'.format(value))
+            accepted[key] = timeout
+
+        elif key == 'tsize':
+            tsize = _parse_int(value, 0)
+            if tsize is None:
+                raise OptionError('Invalid tsize {!r}'.format(value))
+            accepted[key] = tsize
+
+    return accepted
@@ -1,15 +1,46 @@
 import enum
+import struct
+from typing import Any, Dict
+
 import attr
 
+# Integer opcodes, for the hot path where looking up an Opcode is too slow
+RRQ, WRQ, DATA, ACK, ERROR, OACK = range(1, 7)
+
+_USHORT = struct.Struct('!H')
+_HEADER = struct.Struct('!HH')
+
 
 def ushort(n):
-    return int.to_bytes(n, length=2, byteorder='big')
+    return _USHORT.pack(n)
 
 
 def parse_ushort(buf):
     if len(buf) != 2:
         raise ValueError("Requires two bytes")
-    return int.from_bytes(buf, byteorder='big')
+    return _USHORT.unpack(buf)[0]
+
+
+def _parse_blockid(buf):
+    try:
+        return _HEADER.unpack_from(buf)[1]
+    except struct.error:
+        raise ValueError("Packet too short") from None
+
+
+def encode_data(blockid, data):
+    """Encode a DATA packet without building a :class:`Data` first."""
+    return _HEADER.pack(DATA, blockid) + data
+
+
+def pack_data_header(buf, blockid):
+    """Write a DATA header for ``blockid`` into the first four bytes of buf."""
+    _HEADER.pack_into(buf, 0, DATA, blockid)
+
+
+def encode_ack(blockid):
+    """Encode an ACK packet without building an :class:`Ack` first."""
+    return _HEADER.pack(ACK, blockid)
 
 
 def pairwise(data):
@@ -17,12 +48,21 @@ def pairwise(data):
     return dict(zip(it, it))
 
 
+def encode_options(options):
+    for key, value in options.items():
+        yield bytes(key, "ascii")
+        yield b"\x00"
+        yield bytes(str(value), "ascii")
+        yield b"\x00"
+
+
 class Opcode(enum.Enum):
     RRQ = ushort(1)
     WRQ = ushort(2)
     DATA = ushort(3)
     ACK = ushort(4)
     ERROR = ushort(5)
+    OACK = ushort(6)
 
     @property
     def is_request(self):
@@ -48,20 +88,23 @@ class ErrorCode(enum.Enum):
     UNKNOWNID = ushort(5)
     FILEEXISTS = ushort(6)
     NOSUCHUSER = ushort(7)
+    OPTIONNEGOTIATION = ushort(8)
 
 
 class Packet:
+    __slots__ = ()
+
     @property
     def is_request(self):
         return self.opcode.is_request
 
 
-@attr.s
+@attr.s(slots=True)
 class Request(Packet):
     opcode = attr.ib()
     filename = attr.ib()
     mode = attr.ib()
-    options = attr.ib(factory=dict)
+    options: Dict[str, Any] = attr.ib(factory=dict)
 
     @classmethod
     def parse(cls, buf):
@@ -74,10 +117,11 @@ class Request(Packet):
 
     def __bytes__(self):
         return b''.join((self.opcode.value, bytes(self.filename, "ascii"),
-                         b"\x00", self.mode.value, b"\x00"))
+                         b"\x00", self.mode.value, b"\x00",
+                         *encode_options(self.options)))
 
 
-@attr.s
+@attr.s(slots=True)
 class Data(Packet):
     opcode = Opcode.DATA
 
@@ -86,13 +130,13 @@ class Data(Packet):
 
     @classmethod
     def parse(cls, buf):
-        return cls(blockid=parse_ushort(buf[2:4]), data=buf[4:])
+        return cls(_parse_blockid(buf), buf[4:])
 
     def __bytes__(self):
-        return b''.join((self.opcode.value, ushort(self.blockid), self.data))
+        return encode_data(self.blockid, self.data)
 
 
-@attr.s
+@attr.s(slots=True)
 class Ack(Packet):
     opcode = Opcode.ACK
 
@@ -100,13 +144,13 @@ class Ack(Packet):
 
     @classmethod
     def parse(cls, buf):
-        return cls(blockid=parse_ushort(buf[2:4]))
+        return cls(_parse_blockid(buf))
 
     def __bytes__(self):
-        return b''.join((self.opcode.value, ushort(self.blockid)))
+        return encode_ack(self.blockid)
 
 
-@attr.s
+@attr.s(slots=True)
 class Error(Packet):
     opcode = Opcode.ERROR
 
@@ -123,17 +167,48 @@ class Error(Packet):
                          bytes(self.message, "ascii"), b"\x00"))
 
 
+@attr.s(slots=True)
+class OptionAck(Packet):
+    opcode = Opcode.OACK
+
+    options: Dict[str, Any] = attr.ib(factory=dict)
+
+    @classmethod
+    def parse(cls, buf):
+        *extensions, _ = buf[2:].tobytes().split(b'\x00')
+        return cls(
+            options=pairwise(field.decode('ascii') for field in extensions))
+
+    def __bytes__(self):
+        return b''.join((self.opcode.value, *encode_options(self.options)))
+
+
 PACKETS = {
     Opcode.RRQ: Request,
     Opcode.WRQ: Request,
     Opcode.DATA: Data,
     Opcode.ACK: Ack,
     Opcode.ERROR: Error,
+    Opcode.OACK: OptionAck,
+}
+
+
+_PARSERS = {
+    RRQ: Request.parse,
+    WRQ: Request.parse,
+    DATA: Data.parse,
+    ACK: Ack.parse,
+    ERROR: Error.parse,
+    OACK: OptionAck.parse,
 }
 
 
 def parse(data):
     """Return a Packet class appropriate to what's in the buffer."""
-    with memoryview(data) as buf:
-        opcode = Opcode(buf[0:2])
-        return PACKETS[opcode].parse(buf)
+    buf = memoryview(data)
+    try:
+        opcode, = _USHORT.unpack_from(buf)
+        parser = _PARSERS[opcode]
+    except (struct.error, KeyError):
+        raise ValueError("Invalid opcode") from None
+    return parser(buf)
@@ -0,0 +1,217 @@
+"""A pool of pre-bound UDP sockets for transfers to lease.
+
+Creating a fresh datagram endpoint for every transfer costs a socket,
+bind and connect before the first byte moves, and a file descriptor per
+transfer for as long as it runs. A pool binds its sockets ahead of time
+and lets several transfers share each one, demultiplexing incoming
+datagrams by the peer's address. Every pooled socket has its own
+ephemeral port, separate from the listener as RFC 1350 requires, and a
+socket never carries two transfers with the same peer.
+"""
+
+import asyncio
+import logging
+
+from .helpers import get_tid
+
+LOG = logging.getLogger(__name__)
+
+
+class _Endpoint(asyncio.DatagramProtocol):
+    """One pooled socket and the transfers currently leasing it."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.sessions = {}
+        self.transport = None
+        self.idle_since = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.pool._discard(self)
+        for protocol in list(self.sessions.values()):
+            protocol.connection_lost(exc)
+        self.sessions.clear()
+
+    def datagram_received(self, data, addr):
+        protocol = self.sessions.get(get_tid(addr))
+        if protocol is None:
+            LOG.debug('Unsolicited packet from {}'.format(addr))
+            return
+        protocol.datagram_received(data, addr)
+
+    def error_received(self, exc):
+        LOG.debug('Error on pooled endpoint: {}'.format(exc))
+
+
+class LeasedTransport(asyncio.DatagramTransport):
+    """The slice of a pooled socket that belongs to one transfer.
+
+    It behaves like a transport connected to the peer: everything sent
+    goes to the peer, and closing it returns the lease to the pool.
+    """
+
+    def __init__(self, endpoint, tid, protocol):
+        super().__init__()
+        self._endpoint = endpoint
+        self._tid = tid
+        self._protocol = protocol
+        self._closing = False
+
+    def get_extra_info(self, name, default=None):
+        if name == 'peername':
+            return self._tid
+        return self._endpoint.transport.get_extra_info(name, default)
+
+    def get_protocol(self):
+        return self._protocol
+
+    def is_closing(self):
+        return self._closing
+
+    def get_write_buffer_size(self):
+        return self._endpoint.transport.get_write_buffer_size()
+
+    def sendto(self, data, addr=None):
+        if not self._closing:
+            self._endpoint.transport.sendto(data, self._tid)
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._endpoint.pool._release(self._endpoint, self._tid)
+        self._endpoint.pool._loop.call_soon(
+            self._protocol.connection_lost, None)
+
+    def abort(self):
+        self.close()
+
+
+class EndpointPool:
+    """Pre-bound UDP sockets shared between transfers.
+
+    ``min_size`` sockets are bound by :meth:`start` and kept open; more
+    are bound on demand, up to ``size``, whenever every open socket is
+    already carrying ``peers_per_socket`` transfers. Sockets beyond
+    ``min_size`` are closed once they have had no transfers for
+    ``idle_timeout`` seconds.
+
+    Sockets are created with ``engine``, such as an
+    :class:`~aiotftp.mmsg.MmsgEngine`, if one is given.
+    """
+
+    def __init__(self, local_addr=('0.0.0.0', 0), *, size=64, min_size=4,
+                 peers_per_socket=64, idle_timeout=60.0, engine=None,
+                 loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._engine = engine
+        self._endpoints = []
+        self._binding = 0
+        self._sweeper = None
+
+        self.local_addr = local_addr
+        self.size = size
+        self.min_size = min(min_size, size)
+        self.peers_per_socket = peers_per_socket
+        self.idle_timeout = idle_timeout
+
+    def __len__(self):
+        return len(self._endpoints)
+
+    @property
+    def sessions(self):
+        return sum(len(endpoint.sessions) for endpoint in self._endpoints)
+
+    async def start(self):
+        while len(self._endpoints) < self.min_size:
+            await self._bind()
+
+    def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+        for endpoint in list(self._endpoints):
+            endpoint.transport.close()
+
+    async def lease(self, protocol_factory, tid):
+        """Attach a new transfer with ``tid`` to one of the sockets.
+
+        Returns a ``(transport, protocol)`` pair like
+        ``loop.create_datagram_endpoint``; when every socket is already
+        talking to ``tid`` and the pool is full it falls back to exactly
+        that.
+        """
+        endpoint = self._select(tid)
+        if (endpoint is None
+                and len(self._endpoints) + self._binding < self.size):
+            endpoint = await self._bind()
+        if endpoint is None:
+            return await (self._engine or self._loop).create_datagram_endpoint(
+                protocol_factory, remote_addr=tid)
+
+        protocol = protocol_factory()
+        transport = LeasedTransport(endpoint, tid, protocol)
+        endpoint.sessions[tid] = protocol
+        endpoint.idle_since = None
+        protocol.connection_made(transport)
+        return transport, protocol
+
+    def _select(self, tid):
+        candidates = [endpoint for endpoint in self._endpoints
+                      if tid not in endpoint.sessions]
+        if not candidates:
+            return None
+
+        endpoint = min(candidates, key=lambda e: len(e.sessions))
+        if (len(endpoint.sessions) >= self.peers_per_socket
+                and len(self._endpoints) + self._binding < self.size):
+            return None
+        return endpoint
+
+    async def _bind(self):
+        self._binding += 1
+        try:
+            _, endpoint = await (
+                self._engine or self._loop).create_datagram_endpoint(
+                    lambda: _Endpoint(self), local_addr=self.local_addr)
+        finally:
+            self._binding -= 1
+        endpoint.idle_since = self._loop.time()
+        self._endpoints.append(endpoint)
+        self._schedule_sweep()
+        return endpoint
+
+    def _release(self, endpoint, tid):
+        endpoint.sessions.pop(tid, None)
+        if not endpoint.sessions:
+            endpoint.idle_since = self._loop.time()
+            self._schedule_sweep()
+
+    def _discard(self, endpoint):
+        if endpoint in self._endpoints:
+            self._endpoints.remove(endpoint)
+
+    def _schedule_sweep(self):
+        if self._sweeper is None and len(self._endpoints) > self.min_size:
+            self._sweeper = self._loop.call_later(self.idle_timeout,
+                                                  self._sweep)
+
+    def _sweep(self):
+        self._sweeper = None
+
+        cutoff = self._loop.time() - self.idle_timeout
+        idle = [endpoint for endpoint in self._endpoints
+                if endpoint.idle_since is not None
+                and endpoint.idle_since <= cutoff]
+
+        for endpoint in idle[:len(self._endpoints) - self.min_size]:
+            self._endpoints.remove(endpoint)
+            endpoint.transport.close()
+
+        self._schedule_sweep()
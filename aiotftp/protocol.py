@@ -1,28 +1,74 @@
 import asyncio
+import collections
 import logging
 
-from .helpers import get_tid, set_exception, set_result
-from .packet import Ack, Data, Error, Mode, Opcode, Request, parse
+from . import metrics, tracing
+from .helpers import get_tid, raw_socket, set_exception, set_result
+from .options import (DEFAULT_BLKSIZE, DEFAULT_TIMEOUT, DEFAULT_WINDOWSIZE,
+                      OptionError, accept)
+from .packet import (Ack, Data, Error, ErrorCode, Mode, Opcode, OptionAck,
+                     Request, encode_ack, encode_data, pack_data_header,
+                     parse)
+from .rtt import RTTEstimator
+from .timers import get_timer_queue
 
 LOG = logging.getLogger(__name__)
 
 
+def reject_options(transport, tid, exc):
+    packet = Error(ErrorCode.OPTIONNEGOTIATION, message=str(exc))
+    transport.sendto(bytes(packet), tid)
+
+
 class InboundDataProtocol(asyncio.DatagramProtocol):
-    def __init__(self, stream, *, tid, loop=None):
+    """Receive DATA blocks into a stream, acknowledging once per window.
+
+    In-order blocks are acknowledged at the end of every window (RFC 7440)
+    or on the final block; the first out-of-order block in a window asks
+    the sender to go back by acknowledging the last block received in
+    order. If the sender goes quiet the same ACK is sent again, as is
+    the request if the server never answers it.
+
+    While the stream is paused because its reader has fallen behind,
+    ACKs other than the last are held back, so the sender waits rather
+    than the data piling up in memory.
+    """
+
+    def __init__(self, stream, *, tid, requested=None, timeout=None,
+                 rtt=None, trace=None, loop=None):
         if loop is None:
             loop = asyncio.get_event_loop()
         self._loop = loop
-        self._timeout = 2.0
+        self._requested = requested or {}
+        self._last = None
+        self._server = None
+        self._acked_at = None
+        self._received = 0
+        self._nacked = False
+        self._finished = False
+        self._timer = None
+        self._paused = False
+        self._held = None
+        self._trace = trace
 
         self.stream = stream
         self.tid = tid
         self.blockid = 1
-        self.ack_handler = None
+        self.blksize = DEFAULT_BLKSIZE
+        self.windowsize = DEFAULT_WINDOWSIZE
+        self.options = {}
+        self.rtt = rtt or RTTEstimator(timeout or DEFAULT_TIMEOUT)
+
+        stream.set_protocol(self)
 
     def connection_made(self, transport):
         self.transport = transport
 
     def connection_lost(self, exc):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
         if exc:
             return self.stream.set_exception(exc)
         return self.stream.feed_eof()
@@ -37,55 +83,229 @@ class InboundDataProtocol(asyncio.DatagramProtocol):
 
         packet = parse(data)
         if isinstance(packet, Error):
+            if self._timer is not None:
+                self._timer.cancel()
             self.stream.set_exception(FileNotFoundError(packet.message))
 
-        elif isinstance(packet, Data) and packet.blockid == self.blockid:
-            last = len(packet.data) < 512
+        elif isinstance(packet, OptionAck) and self.blockid == 1:
+            try:
+                options = accept(self._requested, packet.options)
+            except OptionError as exc:
+                reject_options(self.transport, self.tid, exc)
+                self.stream.set_exception(exc)
+                return
+
+            self._apply_options(options)
+            self.ack(0, False)
+
+        elif isinstance(packet, Data):
+            if packet.blockid == self.blockid and not self._finished:
+                self._receive(packet)
+            else:
+                self._out_of_order(packet.blockid)
+
+    def request(self, packet, addr):
+        # Sent again, like an ACK, until the server answers
+        self._last = bytes(packet)
+        self._server = addr
+        self._acked_at = self._loop.time()
+        self.transport.sendto(self._last, addr)
+        self._arm()
+
+    def _receive(self, packet):
+        if self._acked_at is not None:
+            self.rtt.sample(self._loop.time() - self._acked_at)
+            self._acked_at = None
+        else:
+            self.rtt.progress()
+
+        last = len(packet.data) < self.blksize
+        metrics.BLOCKS_RECEIVED.value += 1
+        metrics.BYTES_RECEIVED.value += len(packet.data)
+        if self._trace is not None:
+            self._trace.event(tracing.RECEIVED, self._loop.time(),
+                              packet.blockid)
+
+        self.stream.feed_data(packet.data)
+        if last:
+            self.stream.feed_eof()
 
+        self._nacked = False
+        self._received += 1
+        if last or self._received >= self.windowsize:
             self.ack(self.blockid, last)
-            self.stream.feed_data(packet.data)
-            if last:
-                self.stream.feed_eof()
+        else:
+            self._arm()
 
-            self.blockid += 1
-            if self.blockid > 65535:
-                self.blockid = 0
+        self.blockid += 1
+        if self.blockid > 65535:
+            self.blockid = 0
 
-    def ack(self, blockid, last):
-        if self.ack_handler:
-            self.ack_handler.cancel()
-            self.ack_handler = None
+    def _out_of_order(self, blockid):
+        metrics.OUT_OF_ORDER.value += 1
+        if self._finished:
+            # Our final ACK got lost; the sender is retransmitting
+            self.transport.sendto(self._last, self.tid)
+            return
+
+        # Anything behind us is a duplicate of something already acked
+        # and can be dropped. Something ahead means blocks went missing:
+        # ask once for the sender to go back, then wait for progress.
+        ahead = (blockid - self.blockid) % 65536
+        if ahead < self.windowsize and not self._nacked:
+            self._nacked = True
+            self.ack((self.blockid - 1) % 65536, False)
+            self._acked_at = None
 
-        packet = bytes(Ack(blockid))
+    def ack(self, blockid, last):
+        if self._paused and not last:
+            # Anything the sender retransmits meanwhile is a duplicate
+            # and dropped, so there's nothing to time out on either.
+            self._held = blockid
+            self._received = 0
+            if self._timer is not None:
+                self._timer.cancel()
+            return
+        if self._trace is not None:
+            self._trace.event(tracing.ACKED, self._loop.time(), blockid)
+        self._transmit(encode_ack(blockid), last)
+
+    def pause_reading(self):
+        self._paused = True
+
+    def resume_reading(self):
+        self._paused = False
+        if self._held is not None and not self._finished:
+            blockid, self._held = self._held, None
+            self.ack(blockid, False)
+
+    def _transmit(self, packet, last):
+        self._last = packet
+        self._received = 0
+        self._finished = last
+        self.transport.sendto(packet, self.tid)
         if last:
-            return self.transport.sendto(packet, self.tid)
+            # Dally long enough to answer a retransmitted final block,
+            # even from a peer with a more conservative timeout.
+            self._arm(max(2 * self.rtt.rto, DEFAULT_TIMEOUT))
+        else:
+            self._acked_at = self._loop.time()
+            self._arm()
+
+    def _arm(self, timeout=None):
+        deadline = self._loop.time() + (timeout or self.rtt.rto)
+        if self._timer is None:
+            self._timer = get_timer_queue(self._loop).schedule(
+                deadline, self._expired)
+        else:
+            self._timer.reschedule(deadline)
+
+    def _expired(self):
+        if self._finished:
+            # Dallied long enough for a retransmitted final block
+            self.transport.close()
+            return
 
-        async def transmission_loop():
-            while True:
-                self.transport.sendto(packet, self.tid)
-                await asyncio.sleep(self._timeout)
+        metrics.TIMEOUTS.value += 1
+        if self._trace is not None:
+            self._trace.event(tracing.TIMEOUT, self._loop.time())
+        self.rtt.backoff()
+        if self._received:
+            # Timed out part way through a window: acknowledge what we
+            # have so the sender resumes from there.
+            self.ack((self.blockid - 1) % 65536, False)
+        else:
+            self.transport.sendto(self._last, self.tid or self._server)
+            self._arm()
 
-        self.ack_handler = self._loop.create_task(transmission_loop())
+        # Karn's rule: whatever arrives next can't be timed reliably
+        self._acked_at = None
 
-    def start(self):
-        self.ack(0, False)
+    def start(self, options=None):
+        if not options:
+            return self.ack(0, False)
+
+        self._apply_options(options)
+        self._transmit(bytes(OptionAck(options)), False)
+
+    def _apply_options(self, options):
+        self.options = options
+        self.blksize = options.get('blksize', DEFAULT_BLKSIZE)
+        self.windowsize = options.get('windowsize', DEFAULT_WINDOWSIZE)
+        if 'timeout' in options:
+            self.rtt = RTTEstimator.fixed(options['timeout'])
 
 
 class OutboundDataProtocol(asyncio.DatagramProtocol):
-    def __init__(self, *, tid, timeout=None, loop=None):
+    """Send a file as DATA blocks, keeping up to a window of them in flight.
+
+    With the default window of one block this is plain lock-step RFC 1350.
+    Larger windows (RFC 7440) go back to the last acknowledged block on
+    timeout, or when the receiver acknowledges a block short of the end of
+    the window.
+
+    Where the transport's socket can be reached, blocks are sent with
+    ``sendmsg`` from a header buffer reused for every block and the
+    payload as given, so no packet is assembled in memory.
+
+    Given a ``pacer`` (see ``aiotftp.shaping``), new blocks wait for it
+    to have tokens before they're sent; retransmissions go out at once
+    but are charged to it. ``started``, the loop time the request
+    arrived, is used to measure the time to the first block.
+    """
+
+    def __init__(self, *, tid, timeout=None, rtt=None, pacer=None,
+                 started=None, trace=None, loop=None):
         if loop is None:
             loop = asyncio.get_event_loop()
         self._loop = loop
-        self._timeout = 2.0
         self._waiter = None
+        self._exception = None
+        self._requested = {}
+        self._window = collections.deque()
+        self._timer = None
+        self._resent = None
+        self._request = None
+        self._sock = None
+        self._connected = False
+        self._header = bytearray(4)
+        self._pacer = pacer
+        self._pacing = None
+        self._started = started
+        self._trace = trace
 
         self.tid = tid
         self.blockid = 0
-        self.ack_handler = None
+        self.blksize = DEFAULT_BLKSIZE
+        self.windowsize = DEFAULT_WINDOWSIZE
+        self.options = {}
         self.output_size = 0
+        self.rtt = rtt or RTTEstimator(timeout or DEFAULT_TIMEOUT)
 
     def connection_made(self, transport):
         self.transport = transport
+        self._sock = raw_socket(transport)
+        if self._sock is not None:
+            try:
+                self._sock.getpeername()
+            except OSError:
+                pass  # not connected, blocks need the peer's address
+            else:
+                self._connected = True
+
+    def connection_lost(self, exc):
+        self._stop()
+
+    def _stop(self):
+        self._window.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pacing is not None:
+            self._pacing.cancel()
+            self._pacing = None
+        if self._pacer is not None:
+            self._pacer.close()
 
     def datagram_received(self, data, addr):
         tid = get_tid(addr)
@@ -97,43 +317,254 @@ class OutboundDataProtocol(asyncio.DatagramProtocol):
 
         packet = parse(data)
         if isinstance(packet, Error):
+            # The peer has given up on the transfer: send nothing more
+            self._exception = RuntimeError(packet.message)
+            self._stop()
+            self.transport.close()
             waiter = self._waiter
             if waiter is not None:
                 self._waiter = None
-                set_exception(waiter, RuntimeError(packet.message))
+                set_exception(waiter, self._exception)
 
-        elif isinstance(packet, Ack) and packet.blockid == self.blockid:
+        elif isinstance(packet, OptionAck) and self.blockid == 0:
             waiter = self._waiter
-            if waiter is not None:
-                self._waiter = None
+            if waiter is None:
+                return
+
+            self._waiter = None
+            try:
+                self._apply_options(accept(self._requested, packet.options))
+            except OptionError as exc:
+                reject_options(self.transport, self.tid, exc)
+                set_exception(waiter, exc)
+            else:
                 set_result(waiter, False)
 
+        elif isinstance(packet, Ack):
+            self._acknowledge(packet.blockid)
+
     async def write(self, chunk) -> None:
+        await self._next_block(len(chunk) + 4)
+        if self._sock is not None:
+            # Sent as header and payload by _send
+            await self._send_block(chunk, len(chunk), encoded=False)
+        else:
+            await self._send_block(
+                encode_data(self.blockid, chunk), len(chunk))
+
+    async def write_packet(self, packet) -> None:
+        """Send a DATA packet that's already encoded.
+
+        The packet must carry the next block number, and is sent as it
+        is, so one encoding can be shared by any number of transfers.
+        """
+        await self._next_block(len(packet))
+        await self._send_block(packet, len(packet) - 4)
+
+    async def _next_block(self, size):
+        while len(self._window) >= self.windowsize:
+            await self._wait('write')
+        if self._exception is not None:
+            raise self._exception
+        if self._pacer is not None:
+            await self._pace(size)
+
         self.blockid += 1
         if self.blockid > 65535:
             self.blockid = 0
 
-        packet = bytes(Data(blockid=self.blockid, data=chunk))
-
-        async def sendto_forever():
-            self.output_size += len(chunk)
-            while True:
-                self.transport.sendto(packet, self.tid)
-                await asyncio.sleep(self._timeout)
+    async def _send_block(self, packet, length, *, encoded=True):
+        if self._started is not None:
+            metrics.FIRST_BLOCK.observe(self._loop.time() - self._started)
+            self._started = None
+        metrics.BLOCKS_SENT.value += 1
+        metrics.BYTES_SENT.value += length
+        if self._trace is not None:
+            self._trace.event(tracing.SENT, self._loop.time(), self.blockid)
+        self.output_size += length
+        self._push(self.blockid, packet, encoded)
+
+        if length < self.blksize:
+            await self.drain()
+            self.transport.close()
 
-        try:
-            coro = asyncio.ensure_future(sendto_forever())
+    async def _pace(self, size):
+        while True:
+            now = self._loop.time()
+            delay = self._pacer.reserve(size, now)
+            if not delay:
+                return
+
+            if self._pacing is None:
+                self._pacing = get_timer_queue(self._loop).schedule(
+                    now + delay, self._wake)
+            else:
+                self._pacing.reschedule(now + delay)
             await self._wait('write')
+            if self._exception is not None:
+                raise self._exception
+
+    async def drain(self):
+        while self._window:
+            await self._wait('drain')
+        if self._exception is not None:
+            raise self._exception
+
+    async def negotiate(self, options):
+        self._apply_options(options)
+        self._push(self.blockid, bytes(OptionAck(options)))
+        await self.drain()
+
+    async def start(self, filename, remote_addr, options=None):
+        self._requested = options or {}
+        req = Request(Opcode.WRQ, filename=filename, mode=Mode.OCTET,
+                      options=self._requested)
+        packet = bytes(req)
+        self._request = (packet, remote_addr, self._loop.time())
+        self.transport.sendto(packet, remote_addr)
+        self._arm()
+        try:
+            await self._wait('start')
         finally:
-            coro.cancel()
+            _, _, sent_at = self._request
+            self._request = None
+        # Karn's rule: a request sent again can't be timed
+        if sent_at is not None:
+            self.rtt.sample(self._loop.time() - sent_at)
+
+    def _apply_options(self, options):
+        self.options = options
+        self.blksize = options.get('blksize', DEFAULT_BLKSIZE)
+        self.windowsize = options.get('windowsize', DEFAULT_WINDOWSIZE)
+        if 'timeout' in options:
+            self.rtt = RTTEstimator.fixed(options['timeout'])
+
+    def _push(self, blockid, packet, encoded=True):
+        if not self._window:
+            self._arm()
+        self._window.append((blockid, packet, encoded, self._loop.time()))
+        self._send(blockid, packet, encoded)
+
+    def _send(self, blockid, packet, encoded):
+        if encoded:
+            self.transport.sendto(packet, self.tid)
+            return
 
-        if len(chunk) < 512:
-            self.transport.close()
+        # Going around the transport is only safe while it has nothing
+        # queued, or the block could overtake earlier ones.
+        transport = self.transport
+        if not transport.get_write_buffer_size():
+            if transport.is_closing():
+                return
+
+            pack_data_header(self._header, blockid)
+            try:
+                if self._connected:
+                    self._sock.sendmsg((self._header, packet))
+                else:
+                    self._sock.sendmsg((self._header, packet), (), 0,
+                                       self.tid)
+                return
+            except (BlockingIOError, InterruptedError):
+                pass  # let the transport queue it
+            except OSError as exc:
+                self.error_received(exc)
+                return
+
+        transport.sendto(encode_data(blockid, packet), self.tid)
+
+    def _acknowledge(self, blockid):
+        if not self._window:
+            # The handshake: ACK 0 in response to our WRQ
+            if blockid == self.blockid:
+                self._wake()
+            return
+
+        for acked, (pending, _, _, sent_at) in enumerate(self._window, 1):
+            if pending == blockid:
+                break
+        else:
+            # The receiver is still asking for the first block of the
+            # window: everything we sent since got lost or reordered. In
+            # lock-step mode this is just a duplicate, and answering it
+            # would set off the Sorcerer's Apprentice syndrome.
+            metrics.DUPLICATE_ACKS.value += 1
+            if (self.windowsize > 1
+                    and blockid == (self._window[0][0] - 1) % 65536):
+                self._go_back(blockid)
+            return
+
+        for _ in range(acked):
+            self._window.popleft()
+        if self._trace is not None:
+            self._trace.event(tracing.ACKED, self._loop.time(), blockid)
+
+        # Karn's rule: only time blocks that were sent exactly once
+        if sent_at is not None:
+            self.rtt.sample(self._loop.time() - sent_at)
+        else:
+            self.rtt.progress()
+
+        if self._window:
+            self._go_back(blockid)
+        self._wake()
+
+    def _go_back(self, blockid):
+        # Only answer the first of any duplicate ACKs, otherwise every
+        # copy would trigger another full resend of the window.
+        if self._resent == blockid:
+            return
+        self._resent = blockid
+        self._retransmit()
+
+    def _retransmit(self):
+        self._arm()
+        window = self._window
+        self._window = collections.deque()
+        metrics.RETRANSMITS.value += len(window)
+        trace = self._trace
+        size = 0
+        for blockid, packet, encoded, _ in window:
+            self._window.append((blockid, packet, encoded, None))
+            self._send(blockid, packet, encoded)
+            if trace is not None:
+                trace.event(tracing.RESENT, self._loop.time(), blockid)
+            size += len(packet) if encoded else len(packet) + 4
+        if self._pacer is not None:
+            self._pacer.charge(size, self._loop.time())
+
+    def _arm(self):
+        deadline = self._loop.time() + self.rtt.rto
+        if self._timer is None:
+            self._timer = get_timer_queue(self._loop).schedule(
+                deadline, self._expired)
+        else:
+            self._timer.reschedule(deadline)
+
+    def _expired(self):
+        if not self._window:
+            if self._request is not None:
+                # No answer to our WRQ yet: it or the answer got lost
+                packet, remote_addr, _ = self._request
+                self._request = (packet, remote_addr, None)
+                metrics.TIMEOUTS.value += 1
+                self.rtt.backoff()
+                self.transport.sendto(packet, remote_addr)
+                self._arm()
+            return
+
+        self._resent = None
+        metrics.TIMEOUTS.value += 1
+        if self._trace is not None:
+            self._trace.event(tracing.TIMEOUT, self._loop.time())
+        self.rtt.backoff()
+        self._retransmit()
 
-    async def start(self, filename, remote_addr):
-        req = Request(Opcode.WRQ, filename=filename, mode=Mode.OCTET)
-        self.transport.sendto(bytes(req), remote_addr)
-        await self._wait('start')
+    def _wake(self):
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            set_result(waiter, False)
 
     async def _wait(self, func_name):
         if self._waiter is not None:
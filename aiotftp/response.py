@@ -1,5 +1,8 @@
 import asyncio
 
+from . import tracing
+from .fileio import DEFAULT_READAHEAD, FileReader
+from .mapping import open_mapping
 from .protocol import OutboundDataProtocol
 
 
@@ -10,10 +13,13 @@ class StreamResponse:
         self._loop = loop
         self._writer = None
         self._buffer = bytearray()
+        self._body = b''
         self._eof_sent = False
         self._timeout = 2.0
+        self.transport = None
 
         self.length = None
+        self.content_length = None
 
     async def prepare(self, request):
         if self._eof_sent:
@@ -21,14 +27,34 @@ class StreamResponse:
         if self._writer is not None:
             return self._writer
 
-        transport, protocol = await self._loop.create_datagram_endpoint(
-            lambda: OutboundDataProtocol(tid=request.tid, timeout=request.timeout, loop=self._loop),
-            remote_addr=request.tid)
+        transport, protocol = await request.create_endpoint(
+            lambda: OutboundDataProtocol(tid=request.tid,
+                                         rtt=request.rtt_estimator(),
+                                         pacer=request.pacer(),
+                                         started=request.started,
+                                         trace=request.trace,
+                                         loop=self._loop))
+        if request.trace is not None:
+            request.trace.event(tracing.ENDPOINT, self._loop.time())
 
         self.transport = transport
         self._writer = protocol
+
+        options = self._negotiate(request.options)
+        if options:
+            await protocol.negotiate(options)
         return protocol
 
+    def _negotiate(self, options):
+        # tsize can only be answered if we know up front how much we'll send
+        if 'tsize' in options:
+            options = dict(options)
+            if self.content_length is None:
+                del options['tsize']
+            else:
+                options['tsize'] = self.content_length
+        return options
+
     async def write(self, data):
         assert isinstance(data, (bytes, bytearray, memoryview)), \
             "data argument must be byte-ish (%r)" % type(data)
@@ -38,11 +64,7 @@ class StreamResponse:
         if self._writer is None:
             raise RuntimeError("Cannot call write() before prepare()")
 
-        self._buffer.extend(data)
-
-        while len(self._buffer) >= 512:
-            chunk, self._buffer = self._buffer[:512], self._buffer[512:]
-            await self._writer.write(chunk)
+        await self._write_blocks(data)
 
     async def write_eof(self):
         if self._eof_sent:
@@ -50,15 +72,46 @@ class StreamResponse:
         if self._writer is None:
             raise RuntimeError("Cannot call write_eof() before prepare()")
 
-        while len(self._buffer) >= 512:
-            chunk, self._buffer = self._buffer[:512], self._buffer[512:]
-            await self._writer.write(chunk)
-        await self._writer.write(self._buffer)
-
-        self.length = self._writer.output_size
-        self._eof_sent = True
-        self._writer = None
-        self.transport.close()
+        try:
+            await self._write_blocks(self._body, last=True)
+            self.length = self._writer.output_size
+        finally:
+            self._eof_sent = True
+            self._writer = None
+            self.transport.close()
+
+    async def _write_blocks(self, data, last=False):
+        """Send ``data`` in whole blocks, buffering what's left over.
+
+        Blocks are cut from ``data`` as it stands, so each byte is copied
+        at most once whatever the size. With ``last`` whatever remains
+        goes out as the final, short block.
+        """
+        blksize = self._writer.blksize
+        view = memoryview(data).cast('B')
+        offset = 0
+
+        if self._buffer:
+            # Top up the block left over from the previous write first
+            offset = min(blksize - len(self._buffer), len(view))
+            self._buffer += view[:offset]
+            if len(self._buffer) == blksize:
+                block, self._buffer = self._buffer, bytearray()
+                await self._writer.write(block)
+
+        # Blocks stay in the send window until acknowledged, so anything
+        # the caller might change under us is copied
+        readonly = view.readonly
+        while len(view) - offset >= blksize:
+            block = view[offset:offset + blksize]
+            await self._writer.write(block if readonly else bytes(block))
+            offset += blksize
+
+        if offset < len(view):
+            self._buffer += view[offset:]
+        if last:
+            block, self._buffer = self._buffer, bytearray()
+            await self._writer.write(block)
 
 
 class Response(StreamResponse):
@@ -67,29 +120,95 @@ class Response(StreamResponse):
 
         assert isinstance(data, (bytes, bytearray, memoryview)), \
             "data argument must be byte-ish (%r)" % type(data)
-        self._buffer = data
+        self._body = data
+        self.content_length = memoryview(data).nbytes
 
 
 class FileResponse(StreamResponse):
-    def __init__(self, path):
+    """Send a file from disk.
+
+    The file is read in a thread pool, up to ``readahead`` bytes ahead of
+    what the client has acknowledged, so a slow disk doesn't hold up the
+    event loop; ``executor`` replaces the shared pool.
+
+    With ``mmap=True`` the file is mapped rather than read, each block is
+    sent from a slice of the mapping, and concurrent transfers of the
+    same file share one mapping. The file must then not be modified in
+    place while it's served: reading a block past the end of a file
+    truncated under its mapping raises ``SIGBUS`` and kills the process.
+    Replace files by renaming a new one over them instead.
+
+    Given a :class:`~aiotftp.cache.PacketCache`, files small enough to
+    cache are sent from it as pre-encoded DATA packets instead.
+    """
+
+    def __init__(self, path, *, mmap=False, readahead=DEFAULT_READAHEAD,
+                 executor=None, cache=None):
         super().__init__()
 
         self._path = path
+        self._mmap = mmap
+        self._readahead = readahead
+        self._executor = executor
+        self._cache = cache
 
     async def prepare(self, request):
-        response = await super().prepare(request)
-
-        with open(self._path, 'rb') as fobj:
+        if self._cache is not None:
+            cached = await self._cache.get(
+                self._path, request.chunk_size, loop=self._loop)
+            if cached is not None:
+                return await self._prepare_cached(request, cached)
+
+        if self._mmap:
+            return await self._prepare_mapped(request)
+
+        reader = await FileReader.open(
+            self._path, readahead=self._readahead, loop=self._loop,
+            executor=self._executor)
+        try:
+            self.content_length = reader.size
+            response = await super().prepare(request)
             while True:
-                chunk = fobj.read(request.chunk_size)
-                await response.write(chunk)
-                if len(chunk) < 512:
+                block = await reader.read(response.blksize)
+                await response.write(block)
+                if len(block) < response.blksize:
                     break
+        finally:
+            await reader.close()
+
+        self.length = response.output_size
+        self._eof_sent = True
+        return response
+
+    async def _prepare_cached(self, request, cached):
+        self.content_length = cached.size
+        response = await super().prepare(request)
+
+        for packet in cached.packets:
+            await response.write_packet(packet)
+
+        self.length = response.output_size
+        self._eof_sent = True
+        return response
+
+    async def _prepare_mapped(self, request):
+        with open_mapping(self._path) as mapping:
+            self.content_length = mapping.size
+            response = await super().prepare(request)
+
+            view = mapping.view
+            blksize = response.blksize
+            # One past the end, so a file that's a multiple of blksize
+            # still ends with an empty block
+            for offset in range(0, mapping.size + 1, blksize):
+                await response.write(view[offset:offset + blksize])
 
         self.length = response.output_size
         self._eof_sent = True
         return response
 
     async def write_eof(self):
+        # Nothing to close if the file couldn't be opened
         self._writer = None
-        self.transport.close()
+        if self.transport is not None:
+            self.transport.close()
@@ -0,0 +1,60 @@
+"""Adaptive retransmission timeout, after Jacobson/Karels (RFC 6298)."""
+
+from . import metrics
+from .options import DEFAULT_TIMEOUT
+
+MIN_RTO = 0.1
+MAX_RTO = 10.0
+
+
+class RTTEstimator:
+    """Track the smoothed round trip time of a session.
+
+    The caller is responsible for Karn's rule: round trips involving a
+    retransmitted packet are ambiguous and must not be sampled. They do
+    however show the path is alive again, so any exponential backoff is
+    undone on progress.
+    """
+
+    alpha = 1 / 8
+    beta = 1 / 4
+    k = 4
+
+    def __init__(self, initial=DEFAULT_TIMEOUT, *, minimum=MIN_RTO,
+                 maximum=MAX_RTO):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.srtt = None
+        self.rttvar = None
+        self._rto = self._clamp(initial)
+        self._backoff = 1
+
+    @classmethod
+    def fixed(cls, timeout):
+        return cls(timeout, minimum=timeout, maximum=timeout)
+
+    @property
+    def rto(self):
+        return min(self._rto * self._backoff, self.maximum)
+
+    def _clamp(self, rto):
+        return min(max(rto, self.minimum), self.maximum)
+
+    def sample(self, rtt):
+        metrics.RTT.observe(rtt)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += self.beta * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self.alpha * (rtt - self.srtt)
+
+        self._rto = self._clamp(self.srtt + self.k * self.rttvar)
+        self._backoff = 1
+
+    def backoff(self):
+        if self.rto < self.maximum:
+            self._backoff *= 2
+
+    def progress(self):
+        self._backoff = 1
@@ -0,0 +1,196 @@
+"""Run a server across several worker processes sharing one port.
+
+Each worker binds its own listening socket with ``SO_REUSEPORT`` and the
+kernel spreads incoming requests across them, so every worker runs a
+single-threaded event loop with no coordination between them. The
+parent process only supervises: it restarts workers that die and
+writes the access log records they send it, so all workers share one
+log.
+"""
+
+import asyncio
+import logging
+import logging.handlers
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import time
+
+from .logger import access_log
+
+LOG = logging.getLogger(__name__)
+
+# A worker that dies sooner than this after starting is restarted with
+# an increasing delay, rather than in a tight loop.
+RESTART_GRACE = 1.0
+MAX_RESTART_DELAY = 30.0
+
+
+def reuseport_socket(host, port):
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise RuntimeError('SO_REUSEPORT is not supported on this platform')
+
+    family, type_, proto, _, addr = socket.getaddrinfo(
+        host, port, type=socket.SOCK_DGRAM)[0]
+    sock = socket.socket(family, type_, proto)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(addr)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+async def _serve(app_factory, host, port, loop):
+    server = app_factory()
+    if asyncio.iscoroutine(server):
+        server = await server
+
+    sock = reuseport_socket(host, port)
+    _, handler = await loop.create_datagram_endpoint(server, sock=sock)
+
+    stopping = loop.create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set_result, None)
+
+    await stopping
+    await handler.shutdown()
+
+
+def _worker(app_factory, host, port, log_queue):
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_DFL)
+
+    # Hand access log records to the supervisor instead of writing them
+    # through whatever handlers were inherited across the fork.
+    access_log.handlers = [logging.handlers.QueueHandler(log_queue)]
+    access_log.propagate = False
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_serve(app_factory, host, port, loop))
+    finally:
+        loop.close()
+
+
+class Supervisor:
+    """Fork ``workers`` processes, each serving ``app_factory()``.
+
+    ``app_factory`` is called in every worker after the fork, and may be
+    a coroutine function, so each worker builds its own ``Server`` and
+    state. The supervisor keeps the configured number of workers alive
+    until it's asked to stop.
+    """
+
+    def __init__(self, app_factory, host='0.0.0.0', port=69, *,
+                 workers=None):
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+
+        self._context = multiprocessing.get_context('fork')
+        self._processes = {}
+        self._log_queue = None
+        self._listener = None
+        self._stopping = False
+
+    @property
+    def pids(self):
+        return [process.pid for process, _ in self._processes.values()]
+
+    def _spawn(self, slot):
+        process = self._context.Process(
+            target=_worker,
+            args=(self.app_factory, self.host, self.port, self._log_queue),
+            name='aiotftp-worker-{}'.format(slot),
+            daemon=True)
+        process.start()
+        self._processes[slot] = (process, time.monotonic())
+        LOG.info('Started worker %d (pid %d)', slot, process.pid)
+
+    def interrupt(self, *args):
+        """Ask :meth:`supervise` to return; safe from a signal handler."""
+        self._stopping = True
+
+    def start(self):
+        # Bind once up front so a bad address fails here, not in every
+        # worker over and over.
+        reuseport_socket(self.host, self.port).close()
+
+        self._log_queue = self._context.Queue()
+        handlers = access_log.handlers or logging.getLogger().handlers
+        self._listener = logging.handlers.QueueListener(
+            self._log_queue, *handlers, respect_handler_level=True)
+        self._listener.start()
+
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+    def stop(self, timeout=15.0):
+        self._stopping = True
+        for process, _ in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + timeout
+        for process, _ in self._processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self._processes.clear()
+
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+            self._log_queue.close()
+
+    def supervise(self):
+        delays = {}
+        while not self._stopping:
+            sentinels = {process.sentinel: slot for slot, (process, _)
+                         in self._processes.items()}
+            ready = multiprocessing.connection.wait(list(sentinels),
+                                                    timeout=0.5)
+
+            for sentinel in ready:
+                if self._stopping:
+                    break
+
+                slot = sentinels[sentinel]
+                process, started = self._processes[slot]
+                process.join()
+                LOG.warning('Worker %d (pid %d) exited with %s',
+                            slot, process.pid, process.exitcode)
+
+                if time.monotonic() - started < RESTART_GRACE:
+                    delay = min(delays.get(slot, 0.5) * 2, MAX_RESTART_DELAY)
+                    delays[slot] = delay
+                    time.sleep(delay)
+                    if self._stopping:
+                        break
+                else:
+                    delays.pop(slot, None)
+                self._spawn(slot)
+
+    def run(self):
+        previous = {signum: signal.signal(signum, self.interrupt)
+                    for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            self.start()
+            self.supervise()
+        finally:
+            self.stop()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+
+def run(app_factory, host='0.0.0.0', port=69, *, workers=None):
+    """Serve ``app_factory()`` from ``workers`` processes until signalled."""
+    Supervisor(app_factory, host, port, workers=workers).run()
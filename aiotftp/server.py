@@ -1,27 +1,35 @@
 import asyncio
+import functools
 import logging
 import traceback
 from contextlib import suppress
+from typing import Any, Dict
 
 import async_timeout
 import attr
 
+from . import metrics, tracing
+from .fileio import FileWriter
 from .helpers import get_tid
 from .logger import AccessLogger, access_log
+from .options import (DEFAULT_BLKSIZE, DEFAULT_MAX_TSIZE, DEFAULT_TIMEOUT,
+                      MAX_BLKSIZE, OptionError, negotiate)
 from .protocol import InboundDataProtocol
+from .rtt import MAX_RTO, MIN_RTO, RTTEstimator
 from .packet import Error, ErrorCode, Mode, Opcode, parse
-from .streams import StreamReader
+from .sessions import DEFAULT_MAX_QUEUED, Session, SessionTable
+from .streams import DEFAULT_LIMIT, StreamReader
 
 LOG = logging.getLogger(__name__)
 
 OPCODE_ERR = bytes(Error(ErrorCode.NOTDEFINED, message="invalid opcode"))
 MODE_ERR = bytes(Error(ErrorCode.NOTDEFINED, message="OCTET mode only"))
+BUSY_ERR = bytes(Error(ErrorCode.NOTDEFINED, message="Server busy"))
 
 
 @attr.s
 class Request:
-    chunk_size = 512
-    timeout = 2.0
+    timeout = DEFAULT_TIMEOUT
 
     app = attr.ib()
     tid = attr.ib()
@@ -31,24 +39,90 @@ class Request:
 
     _loop = attr.ib()
 
+    options: Dict[str, Any] = attr.ib(factory=dict)
+    min_rto = attr.ib(default=MIN_RTO)
+    max_rto = attr.ib(default=MAX_RTO)
+    pool = attr.ib(default=None)
+    engine = attr.ib(default=None)
+    buffer_limit = attr.ib(default=DEFAULT_LIMIT)
+    shaper = attr.ib(default=None)
+    started = attr.ib(default=None)
+    trace = attr.ib(default=None)
+
     @_loop.default
     def _get_event_loop(self):
         return asyncio.get_event_loop()
 
-    async def accept(self):
-        transfer = StreamReader(loop=self._loop)
-        transport, protocol = await self._loop.create_datagram_endpoint(
-            lambda: InboundDataProtocol(transfer, tid=self.tid, loop=self._loop),
-            remote_addr=self.tid)
+    def __attrs_post_init__(self):
+        if self.started is None:
+            self.started = self._loop.time()
+        if 'timeout' in self.options:
+            self.timeout = self.options['timeout']
+
+    @property
+    def chunk_size(self):
+        return self.options.get('blksize', DEFAULT_BLKSIZE)
+
+    @property
+    def size(self):
+        """The size of the upload, if the client announced it."""
+        if self.method == Opcode.WRQ:
+            return self.options.get('tsize')
+
+    def rtt_estimator(self):
+        # A timeout negotiated with the client is taken literally
+        if 'timeout' in self.options:
+            return RTTEstimator.fixed(self.timeout)
+        return RTTEstimator(
+            self.timeout, minimum=self.min_rto, maximum=self.max_rto)
+
+    def pacer(self):
+        """Pacing for this transfer's blocks, if the server shapes them."""
+        if self.shaper is not None:
+            return self.shaper.session(self.tid)
+
+    async def create_endpoint(self, protocol_factory):
+        """Create the transport for this transfer, from the pool if any."""
+        if self.pool is not None:
+            return await self.pool.lease(protocol_factory, self.tid)
+        return await (self.engine or self._loop).create_datagram_endpoint(
+            protocol_factory, remote_addr=self.tid)
 
-        protocol.start()
+    async def accept(self):
+        transfer = StreamReader(limit=self.buffer_limit, loop=self._loop)
+        transport, protocol = await self.create_endpoint(
+            lambda: InboundDataProtocol(transfer, tid=self.tid,
+                                        rtt=self.rtt_estimator(),
+                                        trace=self.trace,
+                                        loop=self._loop))
+        if self.trace is not None:
+            self.trace.event(tracing.ENDPOINT, self._loop.time())
+
+        protocol.start(self.options)
         return transfer
 
     async def read(self):
-        payload = bytearray()
-        async for chunk in await self.accept():
-            payload.extend(chunk)
-        return bytes(payload)
+        """Accept the upload and read all of it into a ``bytearray``."""
+        transfer = await self.accept()
+        # The announced size is only a hint, and only trusted as far as
+        # the buffer limit until the data actually arrives
+        return await transfer.readall(min(self.size or 0, self.buffer_limit))
+
+    async def save(self, path, *, fsync=True):
+        """Store the upload in a file.
+
+        When the client announced the size of the upload the space is
+        reserved before the transfer is accepted, so running out of disk
+        is reported before any data moves. Writes, and the final
+        ``fsync`` unless disabled, happen in a thread pool so the upload
+        never waits on the disk.
+        """
+        writer = await FileWriter.open(path, self.size, loop=self._loop)
+        try:
+            transfer = await self.accept()
+            await transfer.copy_to(writer)
+        finally:
+            await writer.close(fsync=fsync)
 
 
 class RequestHandler(asyncio.DatagramProtocol):
@@ -62,11 +136,38 @@ class RequestHandler(asyncio.DatagramProtocol):
                  loop=None,
                  access_log_class=AccessLogger,
                  access_log=access_log,
-                 access_log_format=AccessLogger.LOG_FORMAT) -> None:
+                 access_log_format=AccessLogger.LOG_FORMAT,
+                 max_blksize=MAX_BLKSIZE,
+                 max_windowsize=64,
+                 max_tsize=DEFAULT_MAX_TSIZE,
+                 min_rto=MIN_RTO,
+                 max_rto=MAX_RTO,
+                 endpoint_pool=None,
+                 io_engine=None,
+                 buffer_limit=DEFAULT_LIMIT,
+                 max_sessions=None,
+                 max_sessions_per_client=None,
+                 max_queued=DEFAULT_MAX_QUEUED,
+                 priority=None,
+                 shaper=None,
+                 tracer=None) -> None:
         if loop is None:
             loop = asyncio.get_event_loop()
         self._loop = loop
-        self._task_handler = None
+        self.sessions = SessionTable(
+            max_sessions=max_sessions,
+            max_per_client=max_sessions_per_client,
+            max_queued=max_queued, priority=priority, loop=loop)
+        self.max_blksize = max_blksize
+        self.max_windowsize = max_windowsize
+        self.max_tsize = max_tsize
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.endpoint_pool = endpoint_pool
+        self.io_engine = io_engine
+        self.buffer_limit = buffer_limit
+        self.shaper = shaper
+        self.tracer = tracer
 
         self._app = app
         self.read = read
@@ -83,9 +184,9 @@ class RequestHandler(asyncio.DatagramProtocol):
         self.transport = transport
 
     def connection_lost(self, exc):
-        if self._task_handler is not None:
-            self._task_handler.cancel()
-        self._task_handler = None
+        self.sessions.cancel_queued()
+        for task in self.sessions.tasks():
+            task.cancel()
 
     def datagram_received(self, data, addr):
         packet = parse(data)
@@ -94,26 +195,75 @@ class RequestHandler(asyncio.DatagramProtocol):
         elif packet.mode != Mode.OCTET:
             self.transport.sendto(MODE_ERR)
         else:
-            self._task_handler = self._loop.create_task(
-                self.start(packet, addr))
+            metrics.REQUESTS.value += 1
+            session = Session(tid=get_tid(addr), opcode=packet.opcode,
+                              filename=packet.filename,
+                              started=self._loop.time())
+            if not self.sessions.add(session):
+                LOG.debug('Duplicate request from {}'.format(addr))
+                return
+            if not self.sessions.submit(
+                    session, functools.partial(self.start, packet, addr,
+                                               session.started)):
+                LOG.debug('Too busy for request from {}'.format(addr))
+                self.transport.sendto(BUSY_ERR, addr)
 
     def send(self, packet, addr=None):
         self.transport.sendto(packet, addr)
 
-    async def start(self, packet, addr):
+    async def start(self, packet, addr, started=None):
         tid = get_tid(addr)
+        if started is None:
+            started = self._loop.time()
+        trace = None
+        if self.tracer is not None:
+            trace = self.tracer.start(tid, packet.opcode, packet.filename,
+                                      started)
+            trace.event(tracing.START, self._loop.time())
+        try:
+            options, refused = self.negotiate(packet), None
+        except OptionError as exc:
+            options, refused = {}, exc
         request = Request(
             app=self._app,
             filename=packet.filename,
             remote=addr,
             method=packet.opcode,
-            tid=tid)
-
-        if packet.opcode == Opcode.RRQ:
-            await self._start_rrq(request, packet, tid)
+            tid=tid,
+            options=options,
+            min_rto=self.min_rto,
+            max_rto=self.max_rto,
+            pool=self.endpoint_pool,
+            engine=self.io_engine,
+            buffer_limit=self.buffer_limit,
+            shaper=self.shaper,
+            started=started,
+            trace=trace)
+
+        if refused is not None:
+            self._fail(request, Error(ErrorCode.OPTIONNEGOTIATION,
+                                      message=str(refused)))
+            return
 
-        elif packet.opcode == Opcode.WRQ:
-            await self._start_wrq(request, packet, tid)
+        try:
+            if packet.opcode == Opcode.RRQ:
+                await self._start_rrq(request, packet, tid)
+
+            elif packet.opcode == Opcode.WRQ:
+                await self._start_wrq(request, packet, tid)
+        except BaseException:
+            # Anything not already answered with an error: the client
+            # gave up, the transfer timed out, or we're shutting down
+            metrics.FAILED_SESSIONS.value += 1
+            if trace is not None:
+                trace.event(tracing.ABORTED, self._loop.time())
+            raise
+
+    def negotiate(self, packet):
+        return negotiate(packet.options,
+                         max_blksize=self.max_blksize,
+                         max_windowsize=self.max_windowsize,
+                         max_tsize=self.max_tsize)
 
     async def _start_rrq(self, request, packet, tid):
         if self.access_log:
@@ -122,27 +272,30 @@ class RequestHandler(asyncio.DatagramProtocol):
         if self.read is None:
             packet = Error(
                 ErrorCode.ACCESSVIOLATION, message="Permission denied")
-            self.transport.sendto(bytes(packet), tid)
+            self._fail(request, packet)
             return
 
         try:
             response = await self.read(request)
+            if request.trace is not None:
+                request.trace.event(tracing.HANDLER, self._loop.time())
         except Exception:
             LOG.exception("RRQ failed")
             formatted_lines = traceback.format_exc().splitlines()
             packet = Error(ErrorCode.NOTDEFINED, message=formatted_lines[-1])
-            self.transport.sendto(bytes(packet), tid)
+            self._fail(request, packet)
             return
 
         try:
             await response.prepare(request)
         except FileNotFoundError:
             packet = Error(ErrorCode.FILENOTFOUND, message="File not found")
-            self.transport.sendto(bytes(packet), tid)
+            self._fail(request, packet)
             return
         finally:
             await response.write_eof()
 
+        self._record(request, response)
         if self.access_log:
             self.log_access(request, response, self._loop.time() - now)
 
@@ -153,7 +306,7 @@ class RequestHandler(asyncio.DatagramProtocol):
         if self.write is None:
             packet = Error(
                 ErrorCode.ACCESSVIOLATION, message="Permission denied")
-            self.transport.sendto(bytes(packet), tid)
+            self._fail(request, packet)
             return
 
         try:
@@ -162,30 +315,53 @@ class RequestHandler(asyncio.DatagramProtocol):
             LOG.exception("WWQ failed")
             formatted_lines = traceback.format_exc().splitlines()
             packet = Error(ErrorCode.NOTDEFINED, message=formatted_lines[-1])
-            self.transport.sendto(bytes(packet), tid)
+            self._fail(request, packet)
             return
         except FileNotFoundError:
             packet = Error(ErrorCode.FILENOTFOUND, message="File not found")
-            self.transport.sendto(bytes(packet), tid)
+            self._fail(request, packet)
             return
 
+        self._record(request, None)
         if self.access_log:
             self.log_access(request, None, self._loop.time() - now)
 
+    def _fail(self, request, packet):
+        metrics.FAILED_SESSIONS.value += 1
+        if request.trace is not None:
+            request.trace.event(tracing.ERROR, self._loop.time(),
+                                int.from_bytes(packet.code.value, 'big'))
+        self.transport.sendto(bytes(packet), request.tid)
+
+    def _record(self, request, response):
+        if request.trace is not None:
+            request.trace.event(tracing.COMPLETE, self._loop.time(),
+                                response.length if response else 0)
+        elapsed = self._loop.time() - request.started
+        metrics.TRANSFER_TIME.observe(elapsed)
+        if response is not None and response.length and elapsed > 0:
+            metrics.THROUGHPUT.observe(response.length / elapsed)
+
     async def shutdown(self, timeout=15.0):
+        self.sessions.cancel_queued()
+        tasks = self.sessions.tasks()
         with suppress(asyncio.CancelledError, asyncio.TimeoutError):
             with async_timeout.timeout(timeout, loop=self._loop):
-                if (self._task_handler is not None
-                        and not self._task_handler.done()):
-                    await self._task_handler
+                if tasks:
+                    await asyncio.wait(tasks)
 
-        if self._task_handler is not None:
-            self._task_handler.cancel()
+        for task in tasks:
+            task.cancel()
 
         if self.transport is not None:
             self.transport.close()
             self.transport = None
 
+        # Access loggers written before close() existed may not have one
+        close = getattr(self.access_logger, 'close', None)
+        if close is not None:
+            close()
+
     def log_access(self, request, response, time):
         if self.access_logger is not None:
             self.access_logger.log(request, response, time)
@@ -0,0 +1,171 @@
+"""Transfers in progress on a listener, keyed by the client's TID.
+
+A client that hears nothing back soon enough resends its RRQ or WRQ,
+from the same address and port. Starting a transfer for every copy
+would leave the client with several competing transfers, each running
+the handler and reading or writing the file. Until a transfer has
+finished, further requests from its TID are recognised as duplicates
+and dropped.
+
+The table also decides when a transfer may start. Past ``max_sessions``
+running at once, or ``max_per_client`` from one host, requests wait in
+a bounded queue, in the order given by the ``priority`` policy, and are
+started as running transfers finish. Running everything at once under
+a mass reboot only makes every transfer slow enough for its client to
+give up and retry; a client told the server is busy retries later
+without having cost anything.
+"""
+
+import asyncio
+import collections
+import heapq
+import itertools
+
+import attr
+
+from . import metrics
+
+DEFAULT_MAX_QUEUED = 1024
+
+
+@attr.s(slots=True)
+class Session:
+    tid = attr.ib()
+    opcode = attr.ib()
+    filename = attr.ib()
+    started = attr.ib()
+    task = attr.ib(default=None, repr=False)
+
+    @property
+    def host(self):
+        return self.tid[0]
+
+    @property
+    def queued(self):
+        return self.task is None
+
+
+def _fifo(session):
+    return 0
+
+
+class SessionTable:
+    def __init__(self, *, max_sessions=None, max_per_client=None,
+                 max_queued=DEFAULT_MAX_QUEUED, priority=None, loop=None):
+        self.max_sessions = max_sessions
+        self.max_per_client = max_per_client
+        self.max_queued = max_queued
+        self.priority = priority or _fifo
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._sessions = {}
+        self._clients = collections.Counter()
+        self._queue = []
+        self._counter = itertools.count()
+        self.running = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def __contains__(self, tid):
+        return tid in self._sessions
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def get(self, tid):
+        return self._sessions.get(tid)
+
+    def add(self, session):
+        """Track ``session``, or return False if its TID already has one."""
+        if session.tid in self._sessions:
+            self.duplicates += 1
+            metrics.DUPLICATE_REQUESTS.value += 1
+            return False
+
+        self._sessions[session.tid] = session
+        return True
+
+    def submit(self, session, start):
+        """Start the session now, or queue it until there's room.
+
+        ``start`` is called with no arguments to get the coroutine to
+        run. Returns False, and forgets the session, if the queue is
+        already full.
+        """
+        if self._has_room(session):
+            self._run(session, start)
+            return True
+
+        if len(self._queue) >= self.max_queued:
+            self.rejected += 1
+            metrics.REJECTED_REQUESTS.value += 1
+            self.discard(session)
+            return False
+
+        key = self.priority(session)
+        heapq.heappush(self._queue,
+                       (key, next(self._counter), session, start))
+        metrics.QUEUED_SESSIONS.value += 1
+        return True
+
+    def discard(self, session):
+        if self._sessions.get(session.tid) is session:
+            del self._sessions[session.tid]
+
+    def tasks(self):
+        return [session.task for session in self._sessions.values()
+                if session.task is not None]
+
+    def cancel_queued(self):
+        """Forget every session still waiting to start."""
+        for entry in self._queue:
+            self.discard(entry[2])
+        metrics.QUEUED_SESSIONS.value -= len(self._queue)
+        self._queue.clear()
+
+    def _has_room(self, session):
+        if self.max_sessions is not None \
+                and self.running >= self.max_sessions:
+            return False
+        return self.max_per_client is None \
+            or self._clients[session.host] < self.max_per_client
+
+    def _run(self, session, start):
+        metrics.ACTIVE_SESSIONS.value += 1
+        self.running += 1
+        self._clients[session.host] += 1
+        session.task = self._loop.create_task(start())
+        session.task.add_done_callback(lambda _: self._finished(session))
+
+    def _finished(self, session):
+        metrics.ACTIVE_SESSIONS.value -= 1
+        self.running -= 1
+        self._clients[session.host] -= 1
+        if not self._clients[session.host]:
+            del self._clients[session.host]
+        self.discard(session)
+        self._admit()
+
+    def _admit(self):
+        # Start the most urgent queued sessions that fit, passing over
+        # any held back by their own client's limit
+        waiting = []
+        while self._queue and (self.max_sessions is None
+                               or self.running < self.max_sessions):
+            entry = heapq.heappop(self._queue)
+            if self._has_room(entry[2]):
+                metrics.QUEUED_SESSIONS.value -= 1
+                self._run(entry[2], entry[3])
+            else:
+                waiting.append(entry)
+
+        for entry in waiting:
+            heapq.heappush(self._queue, entry)
@@ -0,0 +1,201 @@
+"""Token-bucket pacing of outbound transfers.
+
+Left alone a transfer sends as fast as ACKs come back, which on a
+shared uplink means a fleet pulling firmware crowds out everything
+else. A ``Shaper`` holds a bucket of tokens, in bytes, for the whole
+process, one for each client prefix and one for each session; a block
+goes out only once every bucket it draws on has tokens left.
+
+Buckets are allowed to go into debt by a block, and a sender that
+finds one in debt waits, on the loop's shared timer queue, until it
+has refilled by a few milliseconds' worth. At high rates that sends
+blocks in small bursts rather than arming a timer for every block,
+while the long-run rate stays exact. Rates can be changed at any time
+and take effect from the next block.
+"""
+
+import ipaddress
+import weakref
+
+# How far a bucket in debt refills before sending resumes
+QUANTUM = 0.002
+# Default burst, as the time it takes to send at the bucket's rate
+BURST = 0.02
+
+
+def _check_rate(rate):
+    if rate is not None and not rate > 0:
+        raise ValueError('Rate must be positive or None: {!r}'.format(rate))
+    return rate
+
+
+class TokenBucket:
+    """Bytes per second, with up to ``burst`` bytes sent back to back.
+
+    A ``rate`` of None is unlimited; otherwise it must be positive.
+    """
+
+    __slots__ = ('_rate', '_burst', '_tokens', '_updated')
+
+    def __init__(self, rate=None, burst=None):
+        self._rate = None
+        self._burst = None
+        self._tokens = 0.0
+        self._updated = None
+        self.set_rate(rate, burst)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        self.set_rate(rate)
+
+    @property
+    def burst(self):
+        return self._burst
+
+    def set_rate(self, rate, burst=None):
+        self._rate = _check_rate(rate)
+        if rate is None:
+            self._burst = None
+        else:
+            self._burst = burst if burst is not None else rate * BURST
+            self._tokens = min(self._tokens, self._burst)
+
+    def _refill(self, now):
+        if self._updated is None:
+            self._tokens = self._burst
+        else:
+            self._tokens = min(
+                self._tokens + (now - self._updated) * self._rate,
+                self._burst)
+        self._updated = now
+
+    def delay(self, now):
+        """How long until the bucket may send, 0 if it may now."""
+        if self._rate is None:
+            return 0
+        self._refill(now)
+        if self._tokens >= 0:
+            return 0
+        resume = min(self._burst, self._rate * QUANTUM)
+        return (resume - self._tokens) / self._rate
+
+    def take(self, nbytes, now):
+        if self._rate is not None:
+            self._refill(now)
+            self._tokens -= nbytes
+
+
+class Pacer:
+    """The buckets one session draws on."""
+
+    __slots__ = ('bucket', '_shared', '_release', '__weakref__')
+
+    def __init__(self, bucket, shared=(), release=None):
+        self.bucket = bucket
+        self._shared = shared
+        self._release = release
+
+    def reserve(self, nbytes, now):
+        """Take ``nbytes`` if every bucket allows, else return the delay."""
+        delay = self.bucket.delay(now)
+        for bucket in self._shared:
+            delay = max(delay, bucket.delay(now))
+        if delay:
+            return delay
+
+        self.charge(nbytes, now)
+        return 0
+
+    def charge(self, nbytes, now):
+        """Take ``nbytes`` regardless, as for a retransmission."""
+        self.bucket.take(nbytes, now)
+        for bucket in self._shared:
+            bucket.take(nbytes, now)
+
+    def close(self):
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+
+class Shaper:
+    """Rate limits, in bytes per second, shared by a server's transfers.
+
+    ``rate`` caps the process, ``per_client`` each client prefix (an
+    IPv4 /``prefixlen`` or IPv6 /``prefixlen6``) and ``per_session``
+    each transfer. Any of them may be None for no limit, and assigned
+    to at runtime; a rate of zero or less raises ``ValueError``.
+    """
+
+    def __init__(self, *, rate=None, per_client=None, per_session=None,
+                 prefixlen=24, prefixlen6=64):
+        self.prefixlen = prefixlen
+        self.prefixlen6 = prefixlen6
+        self._bucket = TokenBucket(rate)
+        self._per_client = _check_rate(per_client)
+        self._per_session = _check_rate(per_session)
+        self._clients = {}
+        self._pacers = weakref.WeakSet()
+
+    @property
+    def rate(self):
+        return self._bucket.rate
+
+    @rate.setter
+    def rate(self, rate):
+        self._bucket.rate = rate
+
+    @property
+    def per_client(self):
+        return self._per_client
+
+    @per_client.setter
+    def per_client(self, rate):
+        self._per_client = _check_rate(rate)
+        for bucket, _ in self._clients.values():
+            bucket.rate = rate
+
+    @property
+    def per_session(self):
+        return self._per_session
+
+    @per_session.setter
+    def per_session(self, rate):
+        self._per_session = _check_rate(rate)
+        for pacer in self._pacers:
+            pacer.bucket.rate = rate
+
+    def prefix(self, host):
+        address = ipaddress.ip_address(host)
+        prefixlen = self.prefixlen if address.version == 4 \
+            else self.prefixlen6
+        return ipaddress.ip_network((address, prefixlen), strict=False)
+
+    def client(self, host):
+        """The bucket shared by ``host``'s prefix, if it has one yet."""
+        entry = self._clients.get(self.prefix(host))
+        return entry[0] if entry is not None else None
+
+    def session(self, tid):
+        """A pacer for a new transfer with ``tid``; close it when done."""
+        prefix = self.prefix(tid[0])
+        bucket, count = self._clients.get(prefix, (None, 0))
+        if bucket is None:
+            bucket = TokenBucket(self._per_client)
+        self._clients[prefix] = (bucket, count + 1)
+
+        def release():
+            bucket, count = self._clients[prefix]
+            if count > 1:
+                self._clients[prefix] = (bucket, count - 1)
+            else:
+                del self._clients[prefix]
+
+        pacer = Pacer(TokenBucket(self._per_session),
+                      (bucket, self._bucket), release)
+        self._pacers.add(pacer)
+        return pacer
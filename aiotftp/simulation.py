@@ -0,0 +1,268 @@
+"""A simulated network, on a virtual clock, for testing and tuning.
+
+``SimulatedLoop`` is an event loop whose clock only moves when there is
+nothing left to do but wait for a timer, and then jumps straight to it,
+so a transfer that would take an hour of timeouts runs in as long as
+its packets take to process. Its ``create_datagram_endpoint`` creates
+endpoints on a ``Network`` rather than real sockets, so a server, its
+transfers and any clients running on the loop all talk over the
+simulated network without changes.
+
+Each datagram crossing the network can be lost, duplicated, held back
+to arrive out of order, delayed with jitter, and queued behind others
+on a link with limited bandwidth, as set by a ``Profile``. All of it
+is driven by one seeded random number generator, so a run can be
+repeated exactly::
+
+    loop = SimulatedLoop(Profile(loss=0.02, delay=0.05, jitter=0.01,
+                                 bandwidth=1024 * 1024), seed=1)
+    asyncio.set_event_loop(loop)
+
+Work handed to a thread pool with ``run_in_executor``, as files are
+read and written, takes no virtual time: the clock stands still until
+it finishes, however long that really takes.
+"""
+
+import asyncio
+import random
+import selectors
+
+import attr
+
+LOCALHOST = '127.0.0.1'
+_ANY = ('0.0.0.0', '::', '')
+
+
+@attr.s(slots=True)
+class Profile:
+    """How datagrams are treated on their way across a link.
+
+    ``loss``, ``duplicate`` and ``reorder`` are probabilities; a
+    reordered datagram is held back by ``reorder_delay``. ``delay`` is
+    the one-way latency in seconds, with up to ``jitter`` added at
+    random. ``bandwidth``, in bytes per second, serialises datagrams on
+    the link, and once ``buffer`` bytes are queued more are dropped.
+    """
+
+    loss = attr.ib(default=0.0)
+    duplicate = attr.ib(default=0.0)
+    reorder = attr.ib(default=0.0)
+    reorder_delay = attr.ib(default=0.01)
+    delay = attr.ib(default=0.0)
+    jitter = attr.ib(default=0.0)
+    bandwidth = attr.ib(default=None)
+    buffer = attr.ib(default=None)
+
+
+class _Link:
+    __slots__ = ('busy_until',)
+
+    def __init__(self):
+        self.busy_until = 0.0
+
+
+class Network:
+    """Datagram endpoints connected by links with a ``Profile``.
+
+    ``profile`` applies to every link unless ``links`` has one for the
+    pair of hosts, as ``links[src_host, dst_host] = Profile(...)``.
+    Both can be changed at any time. Endpoints bound to no address, or
+    the wildcard, are on ``address``. ``sent``, ``delivered``,
+    ``dropped`` and ``duplicated`` count datagrams.
+    """
+
+    def __init__(self, loop, profile=None, *, seed=0, address=LOCALHOST):
+        self._loop = loop
+        self.address = address
+        self.profile = profile or Profile()
+        self.links = {}
+        self.random = random.Random(seed)
+        self._state = {}
+        self._endpoints = {}
+        self._next_port = 49152
+        self.sent = self.delivered = self.dropped = self.duplicated = 0
+
+    def _bind(self, host, port):
+        if host in _ANY:
+            host = self.address
+        if not port:
+            while (host, self._next_port) in self._endpoints:
+                self._next_port += 1
+            port = self._next_port
+            self._next_port += 1
+        elif (host, port) in self._endpoints:
+            raise OSError(98, 'Address already in use')
+        return host, port
+
+    async def create_datagram_endpoint(self, protocol_factory,
+                                       local_addr=None, remote_addr=None,
+                                       **kwargs):
+        host, port = local_addr[:2] if local_addr else ('', 0)
+        sockname = self._bind(host, port)
+        protocol = protocol_factory()
+        transport = SimulatedTransport(self, sockname, remote_addr,
+                                       protocol)
+        self._endpoints[sockname] = transport
+        protocol.connection_made(transport)
+        return transport, protocol
+
+    def _unbind(self, transport):
+        if self._endpoints.get(transport._sockname) is transport:
+            del self._endpoints[transport._sockname]
+
+    def _send(self, data, src, dst):
+        self.sent += 1
+        profile = self.links.get((src[0], dst[0]), self.profile)
+        rng = self.random
+        if profile.loss and rng.random() < profile.loss:
+            self.dropped += 1
+            return
+
+        now = self._loop.time()
+        departs = now
+        if profile.bandwidth:
+            link = self._state.get((src[0], dst[0]))
+            if link is None:
+                link = self._state[src[0], dst[0]] = _Link()
+            start = max(now, link.busy_until)
+            if (profile.buffer is not None
+                    and (start - now) * profile.bandwidth > profile.buffer):
+                self.dropped += 1
+                return
+            departs = link.busy_until = start + len(data) / profile.bandwidth
+
+        arrives = departs + profile.delay
+        if profile.jitter:
+            arrives += rng.uniform(0, profile.jitter)
+        if profile.reorder and rng.random() < profile.reorder:
+            arrives += profile.reorder_delay
+
+        data = bytes(data)
+        self._loop.call_at(arrives, self._deliver, data, src, dst)
+        if profile.duplicate and rng.random() < profile.duplicate:
+            self.duplicated += 1
+            self._loop.call_at(arrives + rng.uniform(0, profile.jitter),
+                               self._deliver, data, src, dst)
+
+    def _deliver(self, data, src, dst):
+        transport = self._endpoints.get(dst)
+        if transport is None or not transport._accepts(src):
+            self.dropped += 1
+            return
+        self.delivered += 1
+        transport._protocol.datagram_received(data, src)
+
+
+class SimulatedTransport(asyncio.DatagramTransport):
+    def __init__(self, network, sockname, peername, protocol):
+        super().__init__()
+        self._network = network
+        self._sockname = sockname
+        self._peername = tuple(peername[:2]) if peername else None
+        self._protocol = protocol
+        self._closing = False
+
+    def get_extra_info(self, name, default=None):
+        if name == 'sockname':
+            return self._sockname
+        if name == 'peername':
+            return self._peername
+        return default
+
+    def get_protocol(self):
+        return self._protocol
+
+    def set_protocol(self, protocol):
+        self._protocol = protocol
+
+    def is_closing(self):
+        return self._closing
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def _accepts(self, src):
+        return not self._closing and (self._peername is None
+                                      or src == self._peername)
+
+    def sendto(self, data, addr=None):
+        if self._closing:
+            return
+        if addr is None:
+            addr = self._peername
+        elif self._peername is not None and \
+                tuple(addr[:2]) != self._peername:
+            raise ValueError('Invalid address: must be None or {}'.format(
+                self._peername))
+        self._network._send(data, self._sockname, tuple(addr[:2]))
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._network._unbind(self)
+        self._network._loop.call_soon(self._protocol.connection_lost, None)
+
+    def abort(self):
+        self.close()
+
+
+class _VirtualSelector(selectors.BaseSelector):
+    """Wait on real file descriptors without blocking, moving the clock
+    forward by however long the loop would otherwise have slept."""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self):
+        self._selector.close()
+
+    def select(self, timeout=None):
+        ready = self._selector.select(0)
+        if ready or timeout == 0:
+            return ready
+        if timeout is None or self._loop._executor_work:
+            # No timers at all, or work still in a thread pool: only
+            # real I/O, like the pool finishing, can wake the loop
+            return self._selector.select(None)
+        self._loop._now += timeout
+        return []
+
+
+class SimulatedLoop(asyncio.SelectorEventLoop):
+    """An event loop on a virtual clock, with a simulated ``network``."""
+
+    def __init__(self, profile=None, *, seed=0):
+        self._now = 0.0
+        self._executor_work = set()
+        super().__init__(_VirtualSelector(self))
+        self.network = Network(self, profile, seed=seed)
+
+    def time(self):
+        return self._now
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self._executor_work.add(future)
+        future.add_done_callback(self._executor_work.discard)
+        return future
+
+    async def create_datagram_endpoint(self, protocol_factory,
+                                       local_addr=None, remote_addr=None,
+                                       **kwargs):
+        return await self.network.create_datagram_endpoint(
+            protocol_factory, local_addr=local_addr,
+            remote_addr=remote_addr, **kwargs)
@@ -1,9 +1,20 @@
 import asyncio
 import collections
-from typing import Optional
+import functools
+import inspect
+import os
+from typing import List, Optional
 
 from .helpers import set_result, set_exception
 
+DEFAULT_LIMIT = 256 * 1024
+
+
+def _write_fd(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
 
 class AsyncStreamIterator:
     def __init__(self, read_func) -> None:
@@ -20,12 +31,23 @@ class AsyncStreamIterator:
 
 
 class StreamReader:
+    """Data received by a transfer, waiting to be read.
+
+    Once more than twice ``limit`` bytes are waiting the protocol feeding
+    the stream is asked to pause, which holds back its ACKs and so the
+    sender, until reading brings it down to ``limit`` again.
+    """
+
     total_bytes = 0
 
-    def __init__(self, *, timer=None, loop=None):
+    def __init__(self, *, limit=DEFAULT_LIMIT, timer=None, loop=None):
         if loop is None:
             loop = asyncio.get_event_loop()
         self._loop = loop
+        self._protocol = None
+        self._paused = False
+        self._low_water = limit
+        self._high_water = limit * 2
         self._size = 0
         self._cursor = 0
         self._buffer = collections.deque()
@@ -36,6 +58,10 @@ class StreamReader:
         self._exception = None
         self._timer = timer
 
+    def set_protocol(self, protocol) -> None:
+        """Have ``protocol`` paused and resumed as the buffer fills."""
+        self._protocol = protocol
+
     def exception(self) -> Optional[BaseException]:
         return self._exception
 
@@ -92,19 +118,135 @@ class StreamReader:
         self._buffer.append(data)
         self.total_bytes += len(data)
 
+        if (self._size > self._high_water and not self._paused
+                and self._protocol is not None):
+            self._paused = True
+            self._protocol.pause_reading()
+
         waiter = self._waiter
         if waiter is not None:
             self._waiter = None
             set_result(waiter, False)
 
     async def read(self, n: int = -1) -> bytes:
+        """Read up to ``n`` bytes, or everything buffered if ``n`` is -1.
+
+        Waits only if nothing is buffered yet; returns ``b''`` at EOF.
+        """
         if self._exception is not None:
             raise self._exception
 
+        if not n:
+            return b''
+
         if not self._buffer and not self._eof:
-            await self._wait('readany')
+            await self._wait('read')
 
-        return self._read_nowait(-1)
+        return self._read_nowait(n)
+
+    async def readexactly(self, n: int) -> bytes:
+        """Read exactly ``n`` bytes.
+
+        Raises ``asyncio.IncompleteReadError``, carrying what was read,
+        if the stream ends first.
+        """
+        if self._exception is not None:
+            raise self._exception
+
+        chunks: List[bytes] = []
+        while n > 0:
+            chunk = await self.read(n)
+            if not chunk:
+                partial = b''.join(chunks)
+                raise asyncio.IncompleteReadError(partial,
+                                                  len(partial) + n)
+            chunks.append(chunk)
+            n -= len(chunk)
+
+        return b''.join(chunks)
+
+    async def readinto(self, buffer) -> int:
+        """Copy buffered data into ``buffer``, returning how much.
+
+        Like ``read``, waits only if nothing is buffered yet, and
+        returns 0 at EOF.
+        """
+        if self._exception is not None:
+            raise self._exception
+
+        with memoryview(buffer) as view, view.cast('B') as view:
+            if not view:
+                return 0
+
+            if not self._buffer and not self._eof:
+                await self._wait('readinto')
+
+            offset = 0
+            while self._buffer and offset < len(view):
+                chunk = self._read_nowait_chunk(len(view) - offset)
+                view[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+            return offset
+
+    async def readall(self, sizehint=0) -> bytearray:
+        """Read until EOF into a single ``bytearray``.
+
+        ``sizehint``, or a function returning it that is called once the
+        first data has arrived, is the expected size: up to the stream's
+        limit of it is allocated up front and filled in place, rather
+        than growing the buffer block by block. The hint usually comes
+        from the peer, so past the limit the buffer only grows as the
+        data arrives.
+        """
+        payload = bytearray()
+        offset = 0
+        while True:
+            if offset < len(payload):
+                with memoryview(payload)[offset:] as view:
+                    n = await self.readinto(view)
+                if not n:
+                    break
+                offset += n
+                continue
+
+            chunk = await self.read()
+            if not chunk:
+                break
+            if not offset:
+                size = sizehint() if callable(sizehint) else sizehint
+                payload = bytearray(
+                    max(min(size or 0, self._low_water), len(chunk)))
+                payload[:len(chunk)] = chunk
+            else:
+                payload += chunk
+            offset += len(chunk)
+
+        del payload[offset:]
+        return payload
+
+    async def copy_to(self, sink) -> int:
+        """Write everything left in the stream to ``sink``.
+
+        ``sink`` is a file descriptor or anything with a ``write``
+        method; if ``write`` returns an awaitable, such as
+        ``FileWriter.write``, it's awaited before reading on. Returns
+        the number of bytes copied.
+        """
+        if isinstance(sink, int):
+            write = functools.partial(_write_fd, sink)
+        else:
+            write = sink.write
+
+        copied = 0
+        while True:
+            chunk = await self.read()
+            if not chunk:
+                return copied
+
+            result = write(chunk)
+            if inspect.isawaitable(result):
+                await result
+            copied += len(chunk)
 
     def read_nowait(self) -> bytes:
         if self._exception is not None:
@@ -133,6 +275,10 @@ class StreamReader:
 
         self._size -= len(data)
         self._cursor += len(data)
+
+        if self._paused and self._size <= self._low_water:
+            self._paused = False
+            self._protocol.resume_reading()
         return data
 
     def _read_nowait(self, n):
@@ -0,0 +1,114 @@
+"""Retransmission timers shared by every session on an event loop.
+
+Each transfer needs a single deadline which moves forward on almost
+every packet. Scheduling that with a task, or even a fresh loop timer
+handle, per packet adds up quickly with thousands of sessions. Instead
+all sessions on a loop share one heap of deadlines and one loop timer
+for the earliest of them. Pushing a deadline further out, the common
+case, only updates the timer in place; the heap entry is corrected
+lazily when it comes due.
+"""
+
+import heapq
+import itertools
+import time
+
+# The same slack the event loop allows when deciding a timer is due
+_RESOLUTION = time.get_clock_info('monotonic').resolution
+
+
+class Timer:
+    __slots__ = ('deadline', 'callback', '_queue', '_when')
+
+    def __init__(self, queue, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+        self._queue = queue
+        self._when = None
+
+    @property
+    def active(self):
+        return self._when is not None
+
+    def reschedule(self, deadline):
+        self.deadline = deadline
+        if self._when is None or deadline < self._when:
+            self._queue._push(self)
+
+    def cancel(self):
+        self._when = None
+
+
+class TimerQueue:
+    def __init__(self, loop):
+        self._loop = loop
+        self._heap = []
+        self._counter = itertools.count()
+        self._handle = None
+        self._handle_when = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, deadline, callback):
+        timer = Timer(self, deadline, callback)
+        self._push(timer)
+        return timer
+
+    def _push(self, timer):
+        when = timer._when = timer.deadline
+        heapq.heappush(self._heap, (when, next(self._counter), timer))
+
+        if self._handle_when is None or when < self._handle_when:
+            if self._handle is not None:
+                self._handle.cancel()
+            self._handle_when = when
+            self._handle = self._loop.call_at(when, self._run)
+
+    def _run(self):
+        self._handle = self._handle_when = None
+
+        heap = self._heap
+        now = self._loop.time()
+        end = now + _RESOLUTION
+
+        while heap and heap[0][0] <= end:
+            when, _, timer = heapq.heappop(heap)
+            if timer._when != when:
+                continue  # cancelled or superseded by an earlier entry
+
+            if timer.deadline > end:
+                # Pushed back since it was queued
+                timer._when = timer.deadline
+                heapq.heappush(heap, (timer.deadline, next(self._counter),
+                                      timer))
+                continue
+
+            timer._when = None
+            try:
+                timer.callback()
+            except Exception as exc:
+                self._loop.call_exception_handler({
+                    'message': 'Exception in timer callback',
+                    'exception': exc,
+                })
+
+        # Callbacks that pushed a deadline have already scheduled the
+        # next run; only replace that if something is due sooner
+        if heap and (self._handle_when is None
+                     or heap[0][0] < self._handle_when):
+            if self._handle is not None:
+                self._handle.cancel()
+            self._handle_when = heap[0][0]
+            self._handle = self._loop.call_at(self._handle_when, self._run)
+
+
+def get_timer_queue(loop):
+    # Kept on the loop itself: the queue, and the loop timer it holds,
+    # refer back to the loop, so a table keyed by loops would keep every
+    # one of them alive
+    try:
+        return loop._aiotftp_timers
+    except AttributeError:
+        queue = loop._aiotftp_timers = TimerQueue(loop)
+        return queue
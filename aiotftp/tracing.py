@@ -0,0 +1,253 @@
+"""Per-session event tracing, to find out where a slow transfer's time went.
+
+A server given a ``tracer`` asks it for a trace when each session
+starts, and reports the session's progress to that trace as events,
+each with the loop time it happened and a value:
+
+- ``REQUEST`` when the request arrived, with the opcode
+- ``START`` when the session was admitted and its handler called
+- ``HANDLER`` when a read handler returned its response
+- ``ENDPOINT`` once the transfer's socket was ready
+- ``SENT``, ``RESENT``, ``RECEIVED`` and ``ACKED`` for each block, with
+  its block number
+- ``TIMEOUT`` when a retransmission timer fired
+- ``ERROR``, with the TFTP error code, or ``COMPLETE``, with the bytes
+  sent if known
+- ``ABORTED`` when the session ended any other way, such as the client
+  sending an error, the transfer timing out or the server shutting down
+
+Without a tracer every hook is a single ``is not None`` test.
+
+``RingTracer`` records events into a fixed-size binary ring buffer,
+keeping the most recent, and can dump it to a file. Running this
+module on a dump summarises where the wall-clock time of the slowest
+sessions went::
+
+    python -m aiotftp.tracing trace.bin --slowest 20
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import struct
+
+REQUEST = 0
+START = 1
+HANDLER = 2
+ENDPOINT = 3
+SENT = 4
+RESENT = 5
+RECEIVED = 6
+ACKED = 7
+TIMEOUT = 8
+ERROR = 9
+COMPLETE = 10
+ABORTED = 11
+
+EVENT_NAMES = ('request', 'start', 'handler', 'endpoint', 'sent', 'resent',
+               'received', 'acked', 'timeout', 'error', 'complete',
+               'aborted')
+
+# Session id, loop time, event, value
+RECORD = struct.Struct('<IdBI')
+_MAGIC = b'ATFT\x01'
+_HEADER = struct.Struct('<5sQ')
+
+
+class Trace:
+    """The events of one session; the base class discards them."""
+
+    __slots__ = ()
+
+    def event(self, kind, time, value=0):
+        pass
+
+
+class Tracer:
+    """Hands out a trace for each session; subclass to collect them."""
+
+    def start(self, tid, opcode, filename, time):
+        """Begin tracing a session whose request arrived at ``time``."""
+        return Trace()
+
+
+class _RingTrace(Trace):
+    __slots__ = ('_tracer', '_id')
+
+    def __init__(self, tracer, session_id):
+        self._tracer = tracer
+        self._id = session_id
+
+    def event(self, kind, time, value=0):
+        self._tracer._record(self._id, kind, time, value)
+
+
+class RingTracer(Tracer):
+    """Record events of every session into a ring of ``capacity`` events.
+
+    Each event takes ``RECORD.size`` bytes. Details of the sessions are
+    kept for the most recent ``max_sessions`` of them.
+    """
+
+    def __init__(self, capacity=1 << 20, *, max_sessions=65536):
+        self.capacity = capacity
+        self.max_sessions = max_sessions
+        self._buffer = bytearray(capacity * RECORD.size)
+        self._written = 0
+        self._ids = itertools.count()
+        self.sessions = collections.OrderedDict()
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    def start(self, tid, opcode, filename, time):
+        session_id = next(self._ids) & 0xffffffff
+        self.sessions[session_id] = {
+            'host': tid[0], 'port': tid[1], 'filename': filename,
+            'opcode': opcode.name if hasattr(opcode, 'name') else opcode,
+        }
+        if len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+
+        trace = _RingTrace(self, session_id)
+        trace.event(REQUEST, time)
+        return trace
+
+    def _record(self, session_id, kind, time, value):
+        offset = (self._written % self.capacity) * RECORD.size
+        RECORD.pack_into(self._buffer, offset, session_id, time, kind,
+                         value & 0xffffffff)
+        self._written += 1
+
+    def records(self):
+        """Every event still in the ring, oldest first."""
+        count = len(self)
+        first = self._written - count
+        for n in range(first, first + count):
+            yield RECORD.unpack_from(self._buffer,
+                                     (n % self.capacity) * RECORD.size)
+
+    def dump(self, path):
+        with open(path, 'wb') as fobj:
+            fobj.write(_HEADER.pack(_MAGIC, len(self)))
+            for record in self.records():
+                fobj.write(RECORD.pack(*record))
+            fobj.write(json.dumps(
+                {str(key): value for key, value in self.sessions.items()}
+            ).encode())
+
+
+def load(path):
+    """Read a dump back as its records and session details."""
+    with open(path, 'rb') as fobj:
+        magic, count = _HEADER.unpack(fobj.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError('Not a trace dump: {}'.format(path))
+        records = list(RECORD.iter_unpack(fobj.read(count * RECORD.size)))
+        sessions = {int(key): value
+                    for key, value in json.loads(fobj.read() or b'{}')
+                    .items()}
+    return records, sessions
+
+
+def summarize(records):
+    """Split each session's wall-clock time into where it went.
+
+    Returns a dict per session id with the time ``queued`` before
+    admission, spent in the ``handler``, setting up the ``endpoint``,
+    ``negotiating`` until the first block moved, and ``transferring``,
+    of which ``stalled`` is waiting for retransmission timeouts; with
+    counts of blocks, resends and timeouts and the final ``status``.
+    """
+    events = collections.defaultdict(list)
+    for session_id, time, kind, value in records:
+        events[session_id].append((time, kind, value))
+
+    summaries = {}
+    for session_id, timeline in events.items():
+        timeline.sort(key=lambda event: event[0])
+        first = {}
+        counts = collections.Counter()
+        stalled = 0
+        previous = None
+        for time, kind, value in timeline:
+            first.setdefault(kind, time)
+            counts[kind] += 1
+            if kind == TIMEOUT and previous is not None:
+                stalled += time - previous
+            previous = time
+
+        begin = first.get(REQUEST, timeline[0][0])
+        end = timeline[-1][0]
+        start = first.get(START, begin)
+        ready = first.get(ENDPOINT)
+        handled = first.get(HANDLER, ready)
+        moving = min((first[kind] for kind in (SENT, RECEIVED)
+                      if kind in first), default=None)
+
+        summary = {
+            'total': end - begin,
+            'queued': start - begin,
+            'handler': (handled if handled is not None else end) - start,
+            'endpoint': 0.0,
+            'negotiating': 0.0,
+            'transferring': 0.0,
+            'stalled': stalled,
+            'blocks': counts[SENT] + counts[RECEIVED],
+            'resent': counts[RESENT],
+            'timeouts': counts[TIMEOUT],
+            'status': ('error' if ERROR in first else
+                       'aborted' if ABORTED in first else
+                       'complete' if COMPLETE in first else 'incomplete'),
+        }
+        if ready is not None:
+            if handled is not None and handled < ready:
+                summary['endpoint'] = ready - handled
+            summary['negotiating'] = (moving if moving is not None
+                                      else end) - ready
+        if moving is not None:
+            summary['transferring'] = end - moving
+        summaries[session_id] = summary
+
+    return summaries
+
+
+_COLUMNS = ('total', 'queued', 'handler', 'endpoint', 'negotiating',
+            'transferring', 'stalled')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Summarise where the time of the slowest sessions '
+                    'in a trace dump went.')
+    parser.add_argument('path')
+    parser.add_argument('--slowest', type=int, default=20)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    records, sessions = load(args.path)
+    summaries = summarize(records)
+    slowest = sorted(summaries.items(), key=lambda item: -item[1]['total'])
+    slowest = slowest[:args.slowest]
+
+    if args.json:
+        print(json.dumps([dict(sessions.get(session_id, {}), **summary)
+                          for session_id, summary in slowest], indent=2))
+        return
+
+    columns = ''.join('{:>13}'.format(column) for column in _COLUMNS)
+    print('{:<30}{}{:>8}{:>8} {}'.format('session', columns, 'blocks',
+                                         'resent', 'status'))
+    for session_id, summary in slowest:
+        details = sessions.get(session_id)
+        name = ('{host}:{port} {filename}'.format(**details)
+                if details else str(session_id))
+        times = ''.join('{:>13.4f}'.format(summary[column])
+                        for column in _COLUMNS)
+        print('{:<30}{}{blocks:>8}{resent:>8} {status}'.format(
+            name[:29], times, **summary))
+
+
+if __name__ == '__main__':
+    main()
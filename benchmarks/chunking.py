@@ -0,0 +1,132 @@
+"""Time to cut a payload into blocks, by payload size.
+
+Feeds ``Response`` and ``StreamResponse`` a payload and collects the
+blocks they produce, with no network involved. ``legacy`` is the
+original approach of slicing the head off the buffer for every block,
+which copies everything left each time; it's quadratic, so only run up
+to ``--legacy-max`` bytes.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from aiotftp.response import Response, StreamResponse
+
+MB = 1024 * 1024
+
+
+class Writer:
+    def __init__(self, blksize):
+        self.blksize = blksize
+        self.output_size = 0
+
+    async def write(self, chunk):
+        self.output_size += len(chunk)
+
+
+class Transport:
+    def close(self):
+        pass
+
+
+async def legacy(data, blksize):
+    writer = Writer(blksize)
+    buffer = data
+    while True:
+        chunk, buffer = buffer[:blksize], buffer[blksize:]
+        await writer.write(chunk)
+        if len(chunk) < blksize:
+            break
+    return writer.output_size
+
+
+async def response(data, blksize):
+    resp = Response(data)
+    resp._writer = Writer(blksize)
+    resp.transport = Transport()
+    await resp.write_eof()
+    return resp.length
+
+
+async def stream(data, blksize, piece=64 * 1024):
+    resp = StreamResponse()
+    resp._writer = Writer(blksize)
+    resp.transport = Transport()
+    view = memoryview(data)
+    for offset in range(0, len(view), piece):
+        await resp.write(view[offset:offset + piece])
+    await resp.write_eof()
+    return resp.length
+
+
+STRATEGIES = {
+    'legacy': legacy,
+    'response': response,
+    'stream': stream,
+}
+
+
+def run(strategy, data, blksize, trace):
+    loop = asyncio.new_event_loop()
+    try:
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        length = loop.run_until_complete(
+            STRATEGIES[strategy](data, blksize))
+        elapsed = time.perf_counter() - start
+        peak = None
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        loop.close()
+
+    assert length == len(data)
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=float, nargs='+',
+                        default=[1, 10, 100, 500], help='payloads in MB')
+    parser.add_argument('--blksize', type=int, default=512)
+    parser.add_argument('--legacy-max', type=float, default=10,
+                        help='largest payload in MB to run legacy on')
+    parser.add_argument('--memory', action='store_true',
+                        help='also report peak extra memory (slower)')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        data = bytes(int(size * MB))
+        for strategy in STRATEGIES:
+            if strategy == 'legacy' and size > args.legacy_max:
+                continue
+            elapsed, peak = run(strategy, data, args.blksize, args.memory)
+            results.append({
+                'strategy': strategy,
+                'size_mb': size,
+                'seconds': round(elapsed, 3),
+                'mb_per_sec': round(size / elapsed, 1),
+                'peak_extra_bytes': peak,
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{:>9} {:>8} {:>9} {:>9} {:>12}'.format(
+        'strategy', 'MB', 'seconds', 'MB/s', 'peak bytes'))
+    for result in results:
+        print('{strategy:>9} {size_mb:>8} {seconds:>9} {mb_per_sec:>9} '
+              '{peak:>12}'.format(peak=str(result['peak_extra_bytes']),
+                                  **result))
+
+
+if __name__ == '__main__':
+    main()
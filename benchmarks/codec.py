@@ -0,0 +1,98 @@
+"""Packets per second one core can parse and encode.
+
+Compares the codec in ``aiotftp.packet`` against a copy of the original
+one, which looked up every opcode in an Enum and built the header with
+``int.to_bytes`` and ``b''.join``, for the DATA and ACK packets that
+make up nearly all of the traffic.
+"""
+
+import argparse
+import json
+import timeit
+
+from aiotftp import packet
+from aiotftp.packet import Ack, Data, Opcode, encode_ack, encode_data
+
+
+def legacy_ushort(n):
+    return int.to_bytes(n, length=2, byteorder='big')
+
+
+def legacy_parse_ushort(buf):
+    if len(buf) != 2:
+        raise ValueError("Requires two bytes")
+    return int.from_bytes(buf, byteorder='big')
+
+
+def legacy_parse(data):
+    with memoryview(data) as buf:
+        opcode = Opcode(buf[0:2])
+        if opcode == Opcode.DATA:
+            return (legacy_parse_ushort(buf[2:4]), buf[4:])
+        return (legacy_parse_ushort(buf[2:4]),)
+
+
+def legacy_encode_data(blockid, data):
+    return b''.join((Opcode.DATA.value, legacy_ushort(blockid), data))
+
+
+def legacy_encode_ack(blockid):
+    return b''.join((Opcode.ACK.value, legacy_ushort(blockid)))
+
+
+def cases(blksize):
+    payload = b'x' * blksize
+    data = encode_data(1234, payload)
+    ack = encode_ack(1234)
+
+    return {
+        'legacy': {
+            'parse DATA': lambda: legacy_parse(data),
+            'parse ACK': lambda: legacy_parse(ack),
+            'encode DATA': lambda: legacy_encode_data(1234, payload),
+            'encode ACK': lambda: legacy_encode_ack(1234),
+        },
+        'packet': {
+            'parse DATA': lambda: packet.parse(data),
+            'parse ACK': lambda: packet.parse(ack),
+            'encode DATA': lambda: bytes(Data(1234, payload)),
+            'encode ACK': lambda: bytes(Ack(1234)),
+        },
+        'encode_*': {
+            'encode DATA': lambda: encode_data(1234, payload),
+            'encode ACK': lambda: encode_ack(1234),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--blksize', type=int, default=512)
+    parser.add_argument('--number', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = []
+    for codec, operations in cases(args.blksize).items():
+        for operation, func in operations.items():
+            best = min(timeit.repeat(func, number=args.number,
+                                     repeat=args.repeat))
+            results.append({
+                'codec': codec,
+                'operation': operation,
+                'packets_per_sec': round(args.number / best),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{:>8} {:>12} {:>14}'.format('codec', 'operation', 'packets/s'))
+    for result in results:
+        print('{codec:>8} {operation:>12} {packets_per_sec:>14}'.format(
+            **result))
+
+
+if __name__ == '__main__':
+    main()
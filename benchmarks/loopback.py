@@ -0,0 +1,210 @@
+"""End-to-end transfers over loopback, by size, settings, load and loss.
+
+Every case starts a ``Server`` on loopback in a fresh process and has
+a number of concurrent clients in the same event loop transfer files
+of one size, downloading (``rrq``) or uploading (``wrq``), with one
+blksize and window size. A loss profile drops that fraction of the
+datagrams arriving at the server's transfer sockets, which costs
+retransmissions in either direction.
+
+For each case it reports the aggregate throughput, the median and 99th
+percentile time per transfer, CPU seconds per MB moved (client and
+server together, since they share the process) and the process's peak
+RSS. ``--json`` output, or ``--output``, is meant to be kept and
+compared between releases.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import time
+
+import aiotftp
+
+HOST = '127.0.0.1'
+KB = 1024
+MB = 1024 * KB
+
+
+def parse_size(text):
+    units = {'K': KB, 'M': MB, 'G': 1024 * MB}
+    text = text.upper().rstrip('B')
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+class LossyEngine:
+    """Create transfer endpoints that drop a fraction of what arrives."""
+
+    def __init__(self, loss, *, seed=0, loop):
+        self.loss = loss
+        self._random = random.Random(seed)
+        self._loop = loop
+
+    async def create_datagram_endpoint(self, protocol_factory, **kwargs):
+        def factory():
+            protocol = protocol_factory()
+            received = protocol.datagram_received
+
+            def datagram_received(data, addr):
+                if self._random.random() >= self.loss:
+                    received(data, addr)
+
+            protocol.datagram_received = datagram_received
+            return protocol
+
+        return await self._loop.create_datagram_endpoint(factory, **kwargs)
+
+
+class Discard:
+    def write(self, data):
+        pass
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def download(url, options, loop):
+    received = 0
+    async with aiotftp.read(url, loop=loop, **options) as response:
+        async for chunk in response.stream:
+            received += len(chunk)
+    return received
+
+
+async def upload(url, payload, options, loop):
+    await aiotftp.write(url, data=payload, loop=loop, **options)
+    return len(payload)
+
+
+async def run_case(case, loop):
+    payload = bytes(case['size'])
+
+    async def rrq(request):
+        return aiotftp.Response(payload)
+
+    async def wrq(request):
+        transfer = await request.accept()
+        await transfer.copy_to(Discard())
+
+    engine = LossyEngine(case['loss'], loop=loop) if case['loss'] else None
+    server = aiotftp.Server(rrq, wrq, access_log=None, io_engine=engine)
+    listener, handler = await loop.create_datagram_endpoint(
+        server, local_addr=(HOST, 0))
+    url = 'tftp://{}:{}/file'.format(*listener.get_extra_info('sockname'))
+    options = {'blksize': case['blksize'], 'windowsize': case['windowsize']}
+
+    times = []
+
+    async def client():
+        moved = 0
+        for _ in range(case['transfers']):
+            start = time.perf_counter()
+            if case['op'] == 'rrq':
+                moved += await download(url, options, loop)
+            else:
+                moved += await upload(url, payload, options, loop)
+            times.append(time.perf_counter() - start)
+        return moved
+
+    try:
+        wall, cpu = time.perf_counter(), time.process_time()
+        moved = sum(await asyncio.gather(
+            *(client() for _ in range(case['clients']))))
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+    finally:
+        await handler.shutdown(timeout=1)
+
+    return dict(
+        case,
+        mb_per_sec=round(moved / MB / wall, 2),
+        p50_seconds=round(percentile(times, 0.5), 4),
+        p99_seconds=round(percentile(times, 0.99), 4),
+        cpu_seconds_per_mb=round(cpu / (moved / MB), 4),
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    )
+
+
+def run_in_process(case):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(run_case(case, loop))
+    finally:
+        loop.close()
+
+
+def cases(args):
+    for op, size, blksize, windowsize, clients, loss in itertools.product(
+            args.ops, args.sizes, args.blksizes, args.windowsizes,
+            args.clients, args.loss):
+        # Keep the bytes moved per case roughly bounded
+        transfers = max(1, min(args.transfers,
+                               args.budget // (size * clients)))
+        yield {
+            'op': op, 'size': size, 'blksize': blksize,
+            'windowsize': windowsize, 'clients': clients, 'loss': loss,
+            'transfers': transfers,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ops', nargs='+', default=['rrq', 'wrq'],
+                        choices=['rrq', 'wrq'])
+    parser.add_argument('--sizes', type=parse_size, nargs='+',
+                        default=[KB, 64 * KB, MB, 16 * MB],
+                        help='file sizes, e.g. 1K 64K 1M 1G')
+    parser.add_argument('--blksizes', type=int, nargs='+',
+                        default=[512, 1428])
+    parser.add_argument('--windowsizes', type=int, nargs='+',
+                        default=[1, 16])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--loss', type=float, nargs='+', default=[0.0],
+                        help='fractions of datagrams to drop, e.g. 0 0.01')
+    parser.add_argument('--transfers', type=int, default=8,
+                        help='most transfers per client')
+    parser.add_argument('--budget', type=parse_size, default=256 * MB,
+                        help='fewer transfers per client past this total')
+    parser.add_argument('--json', action='store_true')
+    parser.add_argument('--output', help='also write the JSON here')
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for case in cases(args):
+        # A process per case, so peak RSS belongs to that case alone
+        with concurrent.futures.ProcessPoolExecutor(
+                1, mp_context=context) as executor:
+            results.append(executor.submit(run_in_process, case).result())
+        if not args.json:
+            print('{op} {size:>10} blk={blksize:<5} win={windowsize:<3} '
+                  'clients={clients:<4} loss={loss:<5} '
+                  '{mb_per_sec:>8} MB/s p50={p50_seconds:<8} '
+                  'p99={p99_seconds:<8} cpu/MB={cpu_seconds_per_mb:<7} '
+                  'rss={peak_rss_kb}K'.format(**results[-1]), flush=True)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(report, fobj, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
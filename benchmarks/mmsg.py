@@ -0,0 +1,114 @@
+"""Loopback datagrams per second, asyncio transports against MmsgEngine.
+
+An echo server answers every datagram, ACK sized by default, while a
+set of client sockets each keep a number of datagrams in flight. Both
+ends use the transport under test, in one process, so the figure is
+round trips per second on one core including both sides' overhead.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from aiotftp.mmsg import AVAILABLE, MmsgEngine
+
+HOST = '127.0.0.1'
+
+
+class Echo(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data, addr)
+
+
+class Client(asyncio.DatagramProtocol):
+    def __init__(self, payload, inflight):
+        self.payload = payload
+        self.inflight = inflight
+        self.received = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        for _ in range(self.inflight):
+            transport.sendto(self.payload)
+
+    def datagram_received(self, data, addr):
+        self.received += 1
+        self.transport.sendto(self.payload)
+
+
+async def measure(engine, args, loop):
+    factory = engine or loop
+    server, _ = await factory.create_datagram_endpoint(
+        Echo, local_addr=(HOST, 0))
+    addr = server.get_extra_info('sockname')
+
+    payload = b'\x00\x04\x00\x01' + b'x' * (args.size - 4)
+    clients = []
+    for _ in range(args.clients):
+        _, client = await factory.create_datagram_endpoint(
+            lambda: Client(payload, args.inflight), remote_addr=addr)
+        clients.append(client)
+
+    await asyncio.sleep(0.2)  # warm up
+    start_count = sum(client.received for client in clients)
+    start = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    count = sum(client.received for client in clients) - start_count
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        client.transport.close()
+    server.close()
+    await asyncio.sleep(0.1)
+    return count / elapsed
+
+
+def run(name, args):
+    loop = asyncio.new_event_loop()
+    try:
+        engine = MmsgEngine(batch=args.batch, loop=loop) \
+            if name == 'mmsg' else None
+        return loop.run_until_complete(measure(engine, args, loop))
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, nargs='+',
+                        default=[1, 16, 64])
+    parser.add_argument('--inflight', type=int, default=8,
+                        help='datagrams each client keeps in flight')
+    parser.add_argument('--size', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    engines = ['asyncio', 'mmsg'] if AVAILABLE else ['asyncio']
+    clients = args.clients
+    results = []
+    for args.clients in clients:
+        for name in engines:
+            results.append({
+                'engine': name,
+                'clients': args.clients,
+                'packets_per_sec': round(run(name, args)),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{:>8} {:>8} {:>12}'.format('engine', 'clients', 'packets/s'))
+    for result in results:
+        print('{engine:>8} {clients:>8} {packets_per_sec:>12}'.format(
+            **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Loopback request rate of the multi-process runner by worker count.
+
+For each worker count a Supervisor is started on loopback and a set of
+client processes fetch a small file as fast as they can for a fixed
+time. Scaling is only meaningful when there are enough cores for both
+the workers and the clients.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+
+import aiotftp
+from aiotftp.runner import run
+
+HOST = '127.0.0.1'
+PAYLOAD = b'x' * 1000
+
+
+def make_server():
+    async def rrq(request):
+        return aiotftp.Response(PAYLOAD)
+
+    return aiotftp.Server(rrq, None, access_log=None)
+
+
+def serve(port, workers):
+    run(make_server, HOST, port, workers=workers)
+
+
+async def fetch_forever(url, deadline, loop):
+    completed = 0
+    while time.monotonic() < deadline:
+        try:
+            response = aiotftp.read(url, loop=loop)
+            async with response:
+                await asyncio.wait_for(response.data(), 5)
+        except asyncio.TimeoutError:
+            continue
+        completed += 1
+    return completed
+
+
+def client(port, concurrency, duration, results):
+    url = 'tftp://{}:{}/file'.format(HOST, port)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    deadline = time.monotonic() + duration
+    counts = loop.run_until_complete(asyncio.gather(
+        *(fetch_forever(url, deadline, loop) for _ in range(concurrency))))
+    results.put(sum(counts))
+    loop.close()
+
+
+def measure(workers, args):
+    context = multiprocessing.get_context('fork')
+    server = context.Process(target=serve, args=(args.port, workers))
+    server.start()
+    time.sleep(1.0)
+
+    results = context.Queue()
+    clients = [context.Process(target=client,
+                               args=(args.port, args.concurrency,
+                                     args.duration, results))
+               for _ in range(args.clients)]
+    for process in clients:
+        process.start()
+
+    total = sum(results.get() for _ in clients)
+    for process in clients:
+        process.join()
+
+    os.kill(server.pid, signal.SIGTERM)
+    server.join()
+    return total / args.duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    parser.add_argument('--clients', type=int,
+                        default=os.cpu_count() or 1,
+                        help='client processes')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='concurrent transfers per client process')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=16969)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        rate = measure(workers, args)
+        results.append({'workers': workers,
+                        'transfers_per_sec': round(rate, 1)})
+
+    base = results[0]['transfers_per_sec'] / results[0]['workers'] or 1
+    for result in results:
+        result['scaling'] = round(
+            result['transfers_per_sec'] / base / result['workers'], 2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{:>8} {:>16} {:>10}'.format('workers', 'transfers/s',
+                                       'efficiency'))
+    for result in results:
+        print('{workers:>8} {transfers_per_sec:>16} {scaling:>10}'.format(
+            **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Accuracy and CPU cost of pacing a transfer to a target rate.
+
+Serves a file over loopback from a ``Shaper`` capped to each target
+rate, and downloads it in the same process with small blocks so the
+packet rate is high. Reports the rate achieved against the target and
+the CPU time spent per second of transfer, which for a well-behaved
+pacer stays close to what the same packet rate costs unshaped.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import aiotftp
+
+HOST = '127.0.0.1'
+MB = 1024 * 1024
+
+
+async def measure(rate, args, loop):
+    size = int((rate or 50 * MB) * args.duration)
+    payload = bytes(size)
+
+    async def rrq(request):
+        return aiotftp.Response(payload)
+
+    server = aiotftp.Server(rrq, None, access_log=None,
+                            shaper=aiotftp.Shaper(rate=rate))
+    transport, _ = await loop.create_datagram_endpoint(
+        server, local_addr=(HOST, 0))
+    url = 'tftp://{}:{}/file'.format(*transport.get_extra_info('sockname'))
+
+    try:
+        wall, cpu = time.perf_counter(), time.process_time()
+        async with aiotftp.read(url, blksize=args.blksize,
+                                windowsize=args.windowsize,
+                                loop=loop) as response:
+            length = len(await response.data())
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+    finally:
+        transport.close()
+
+    assert length == size
+    return size / wall, cpu / wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rates', type=float, nargs='+',
+                        default=[1, 5, 10, 20], help='targets in MB/s')
+    parser.add_argument('--blksize', type=int, default=512)
+    parser.add_argument('--windowsize', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = []
+    for target in [None] + args.rates:
+        loop = asyncio.new_event_loop()
+        try:
+            achieved, cpu = loop.run_until_complete(
+                measure(target and int(target * MB), args, loop))
+        finally:
+            loop.close()
+        results.append({
+            'target_mb_per_sec': target,
+            'mb_per_sec': round(achieved / MB, 2),
+            'packets_per_sec': round(achieved / (args.blksize + 4)),
+            'cpu_per_sec': round(cpu, 3),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{:>8} {:>9} {:>10} {:>8}'.format(
+        'target', 'MB/s', 'packets/s', 'cpu/s'))
+    for result in results:
+        print('{target:>8} {mb_per_sec:>9} {packets_per_sec:>10} '
+              '{cpu_per_sec:>8}'.format(
+                  target=str(result['target_mb_per_sec'] or 'none'),
+                  **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Cost of keeping a retransmission timer per session.
+
+Every packet a session handles pushes its retransmission deadline out.
+This compares the ways of doing that:
+
+- ``task``: cancel the previous retransmission task and start a new
+  one, as the protocols originally did for every block and ACK
+- ``handle``: cancel and recreate a loop timer handle
+- ``queue``: reschedule a timer on the shared per-loop TimerQueue
+
+and reports how many packets per second one core can push through
+the timer bookkeeping alone, and so how many sessions it could carry
+at a given per-session packet rate.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from aiotftp.timers import get_timer_queue
+
+TIMEOUT = 2.0
+
+
+class TaskSession:
+    def __init__(self, loop):
+        self._loop = loop
+        self._task = None
+
+    async def _retransmit(self):
+        while True:
+            await asyncio.sleep(TIMEOUT)
+
+    def packet(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._task = self._loop.create_task(self._retransmit())
+
+    def close(self):
+        self._task.cancel()
+
+
+class HandleSession:
+    def __init__(self, loop):
+        self._loop = loop
+        self._handle = None
+
+    def _expired(self):
+        pass
+
+    def packet(self):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = self._loop.call_later(TIMEOUT, self._expired)
+
+    def close(self):
+        self._handle.cancel()
+
+
+class QueueSession:
+    def __init__(self, loop):
+        self._loop = loop
+        self._timer = None
+
+    def _expired(self):
+        pass
+
+    def packet(self):
+        deadline = self._loop.time() + TIMEOUT
+        if self._timer is None:
+            self._timer = get_timer_queue(self._loop).schedule(
+                deadline, self._expired)
+        else:
+            self._timer.reschedule(deadline)
+
+    def close(self):
+        self._timer.cancel()
+
+
+STRATEGIES = {
+    'task': TaskSession,
+    'handle': HandleSession,
+    'queue': QueueSession,
+}
+
+
+async def drive(factory, sessions, packets, loop):
+    active = [factory(loop) for _ in range(sessions)]
+
+    start = time.process_time()
+    for n in range(packets):
+        active[n % sessions].packet()
+        # Yield once per round so scheduled work actually runs, as it
+        # would between datagrams on a real server.
+        if n % sessions == sessions - 1:
+            await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    elapsed = time.process_time() - start
+
+    for session in active:
+        session.close()
+    return elapsed
+
+
+def run(strategy, sessions, packets):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            drive(STRATEGIES[strategy], sessions, packets, loop))
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sessions', type=int, nargs='+',
+                        default=[100, 1000, 5000])
+    parser.add_argument('--packets', type=int, default=200000)
+    parser.add_argument('--rate', type=int, default=100,
+                        help='packets per second per session')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = []
+    for sessions in args.sessions:
+        for strategy in STRATEGIES:
+            elapsed = run(strategy, sessions, args.packets)
+            pps = args.packets / elapsed
+            results.append({
+                'strategy': strategy,
+                'sessions': sessions,
+                'packets_per_sec': round(pps),
+                'sessions_per_core': int(pps / args.rate),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{:>8} {:>8} {:>12} {:>18}'.format(
+        'strategy', 'sessions', 'packets/s', 'sessions/core'))
+    for result in results:
+        print('{strategy:>8} {sessions:>8} {packets_per_sec:>12} '
+              '{sessions_per_core:>18}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
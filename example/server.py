@@ -11,9 +11,7 @@ async def read(request):
 
 
 async def write(request):
-    with open(request.filename, 'wb') as fp:
-        async for chunk in await request.accept():
-            fp.write(chunk)
+    await request.save(request.filename)
 
 
 async def main(loop):
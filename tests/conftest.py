@@ -39,8 +39,10 @@ async def server(event_loop):
         def __init__(self):
             self.rrq_files = {filename: asyncio.Future() for filename in FILES}
             self.wrq_files = {filename: asyncio.Future() for filename in FILES}
+            self.requests = []
 
         async def rrq(self, request):
+            self.requests.append(request)
             try:
                 contents = FILES[request.filename]
             except KeyError:
@@ -50,6 +52,7 @@ async def server(event_loop):
             return Response(data=contents)
 
         async def wrq(self, request):
+            self.requests.append(request)
             try:
                 future = self.wrq_files[request.filename]
             except KeyError:
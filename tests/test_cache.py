@@ -0,0 +1,163 @@
+import asyncio
+import os
+
+import aiotftp
+from aiotftp.cache import PacketCache, encoded_size
+from aiotftp.packet import Data, parse
+from async_generator import yield_, async_generator
+import pytest
+
+
+def write_file(tmp_path, name, contents):
+    path = tmp_path / name
+    path.write_bytes(contents)
+    return str(path)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('size', [0, 1000, 1024])
+async def test_cache_packets(size, tmp_path, event_loop):
+    contents = os.urandom(size)
+    path = write_file(tmp_path, 'file', contents)
+    cache = PacketCache()
+
+    cached = await cache.get(path, 512, loop=event_loop)
+    assert cached.size == size
+    assert cached.nbytes == encoded_size(size, 512) == cache.size
+
+    packets = [parse(packet) for packet in cached.packets]
+    assert all(isinstance(packet, Data) for packet in packets)
+    assert [packet.blockid for packet in packets] == \
+        list(range(1, len(packets) + 1))
+    assert b''.join(packet.data for packet in packets) == contents
+    assert len(packets[-1].data) < 512
+
+
+@pytest.mark.asyncio
+async def test_cache_hits(tmp_path, event_loop):
+    path = write_file(tmp_path, 'file', b'x' * 1000)
+    cache = PacketCache()
+
+    first = await cache.get(path, 512, loop=event_loop)
+    second = await cache.get(path, 512, loop=event_loop)
+    assert first is second
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A different block size is a different entry
+    await cache.get(path, 100, loop=event_loop)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert len(cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_concurrent_misses(tmp_path, event_loop):
+    path = write_file(tmp_path, 'file', b'x' * 1000)
+    cache = PacketCache()
+
+    entries = await asyncio.gather(
+        *(cache.get(path, 512, loop=event_loop) for _ in range(5)))
+    assert all(entry is entries[0] for entry in entries)
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidated_on_change(tmp_path, event_loop):
+    path = write_file(tmp_path, 'file', b'old')
+    cache = PacketCache()
+
+    await cache.get(path, 512, loop=event_loop)
+    write_file(tmp_path, 'file', b'new contents')
+    os.utime(path, ns=(0, 0))
+
+    cached = await cache.get(path, 512, loop=event_loop)
+    assert parse(cached.packets[0]).data == b'new contents'
+    assert cache.misses == 2
+    assert cache.size == cached.nbytes
+
+
+@pytest.mark.asyncio
+async def test_cache_eviction(tmp_path, event_loop):
+    paths = [write_file(tmp_path, str(n), b'x' * 1000) for n in range(3)]
+    cache = PacketCache(max_size=2 * encoded_size(1000, 512))
+
+    await cache.get(paths[0], 512, loop=event_loop)
+    await cache.get(paths[1], 512, loop=event_loop)
+    await cache.get(paths[0], 512, loop=event_loop)
+    await cache.get(paths[2], 512, loop=event_loop)
+
+    # The least recently used is the one to go
+    assert (paths[1], 512) not in cache
+    assert (paths[0], 512) in cache
+    assert (paths[2], 512) in cache
+    assert cache.evictions == 1
+    assert cache.size <= cache.max_size
+
+
+@pytest.mark.asyncio
+async def test_cache_too_large(tmp_path, event_loop):
+    path = write_file(tmp_path, 'file', b'x' * 1000)
+    cache = PacketCache(max_size=500)
+
+    assert await cache.get(path, 512, loop=event_loop) is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidate(tmp_path, event_loop):
+    first = write_file(tmp_path, 'first', b'x')
+    second = write_file(tmp_path, 'second', b'y')
+    cache = PacketCache()
+
+    await cache.get(first, 512, loop=event_loop)
+    await cache.get(second, 512, loop=event_loop)
+
+    cache.invalidate(first)
+    assert len(cache) == 1
+    cache.invalidate()
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+@pytest.fixture
+@async_generator
+async def cached_server(tmp_path, event_loop):
+    cache = PacketCache()
+
+    async def rrq(request):
+        return aiotftp.FileResponse(str(tmp_path / request.filename),
+                                    cache=cache)
+
+    server = aiotftp.Server(rrq, None)
+    transport, _ = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1075))
+
+    await yield_((tmp_path, cache))
+    transport.close()
+
+
+async def fetch(filename, loop, **kwargs):
+    url = 'tftp://127.0.0.1:1075/{}'.format(filename)
+    async with aiotftp.read(url, loop=loop, **kwargs) as response:
+        return await response.data()
+
+
+@pytest.mark.asyncio
+async def test_cached_file_response(cached_server, event_loop):
+    tmp_path, cache = cached_server
+    contents = os.urandom(5000)
+    (tmp_path / 'file').write_bytes(contents)
+
+    results = await asyncio.gather(
+        *(fetch('file', event_loop, windowsize=4) for _ in range(5)))
+    assert results == [contents] * 5
+    assert await fetch('file', event_loop, tsize=True) == contents
+
+    assert cache.hits + cache.misses == 6
+    assert cache.hits >= 1
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_file_response_missing(cached_server, event_loop):
+    with pytest.raises(FileNotFoundError):
+        await fetch('missing', event_loop)
@@ -29,9 +29,83 @@ async def test_write(filename, contents, server, event_loop):
     assert await server.wrq_files[filename] == contents
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize('wrap', [bytearray, memoryview])
+async def test_write_buffer(wrap, filename, contents, server, event_loop):
+    url = 'tftp://127.0.0.1:1069/{}'.format(filename)
+
+    await aiotftp.write(url, data=wrap(contents), loop=event_loop)
+    assert await server.wrq_files[filename] == contents
+
+
 @pytest.mark.asyncio
 async def test_write_notfound(server, event_loop):
     url = 'tftp://127.0.0.1:1069/notfound'
 
     with pytest.raises(RuntimeError):
         await aiotftp.write(url, data=b'hello', loop=event_loop)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('blksize', [8, 1428])
+async def test_read_blksize(filename, contents, blksize, server, event_loop):
+    url = 'tftp://127.0.0.1:1069/{}'.format(filename)
+
+    response = aiotftp.read(url, blksize=blksize, loop=event_loop)
+    async with response:
+        assert await response.data() == contents
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('blksize', [8, 1428])
+async def test_write_blksize(filename, contents, blksize, server, event_loop):
+    url = 'tftp://127.0.0.1:1069/{}'.format(filename)
+
+    await aiotftp.write(url, data=contents, blksize=blksize, loop=event_loop)
+    assert await server.wrq_files[filename] == contents
+
+
+@pytest.mark.asyncio
+async def test_read_tsize(filename, contents, server, event_loop):
+    url = 'tftp://127.0.0.1:1069/{}'.format(filename)
+
+    response = aiotftp.read(url, tsize=True, timeout=1, loop=event_loop)
+    async with response:
+        assert await response.data() == contents
+        assert response.size == len(contents)
+
+    request, = server.requests
+    assert request.timeout == 1
+
+
+@pytest.mark.asyncio
+async def test_write_tsize(filename, contents, server, event_loop):
+    url = 'tftp://127.0.0.1:1069/{}'.format(filename)
+
+    await aiotftp.write(url, data=contents, timeout=1, loop=event_loop)
+    assert await server.wrq_files[filename] == contents
+
+    request, = server.requests
+    assert request.size == len(contents)
+    assert request.timeout == 1
+
+
+@pytest.mark.asyncio
+async def test_write_save(tmpdir, filename, contents, event_loop):
+    async def wrq(request):
+        await request.save(str(tmpdir.join(request.filename)))
+        done.set_result(request)
+
+    done = event_loop.create_future()
+    server = aiotftp.Server(None, wrq)
+    transport, _ = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1070))
+
+    try:
+        url = 'tftp://127.0.0.1:1070/{}'.format(filename)
+        await aiotftp.write(url, data=contents, loop=event_loop)
+        await done
+    finally:
+        transport.close()
+
+    assert tmpdir.join(filename).read_binary() == contents
@@ -1,15 +1,21 @@
 import asyncio
 import random
 
+import aiotftp
 from aiotftp.packet import Ack, Mode, Opcode, parse, Request
+from async_generator import yield_, async_generator
 import pytest
 
+from .conftest import FILES
+
 
 class DelayedAckClient(asyncio.DatagramProtocol):
     """Let each packet go unACKed at least twice before ACKing."""
 
-    def __init__(self, request, loop):
+    def __init__(self, request, loop, seed=0, port=1069):
         self.request = request
+        self.port = port
+        self.random = random.Random(seed)
         self.received = bytearray()
         self.acked = []
         self.ack_next = []
@@ -17,7 +23,7 @@ class DelayedAckClient(asyncio.DatagramProtocol):
 
     def connection_made(self, transport):
         self.transport = transport
-        transport.sendto(bytes(self.request), ('127.0.0.1', 1069))
+        transport.sendto(bytes(self.request), ('127.0.0.1', self.port))
 
     def datagram_received(self, data, addr):
         try:
@@ -33,7 +39,7 @@ class DelayedAckClient(asyncio.DatagramProtocol):
                         self._waiter.set_result(self.received)
                         self.transport.close()
                 else:
-                    if random.choice(["ack next", "don't"]) == "ack next":
+                    if self.random.choice(["ack next", "don't"]) == "ack next":
                         self.ack_next.append(packet.blockid)
         except Exception as exc:
             self._waiter.set_exception(exc)
@@ -47,10 +53,26 @@ class DelayedAckClient(asyncio.DatagramProtocol):
         return await self._waiter
 
 
+@pytest.fixture
+@async_generator
+async def server(event_loop):
+    async def rrq(request):
+        return aiotftp.Response(FILES[request.filename])
+
+    # Every block times out at least once, so keep the backoff short
+    server = aiotftp.Server(rrq, None, min_rto=0.05, max_rto=0.1)
+    _, handler = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1084))
+
+    await yield_(handler)
+    await handler.shutdown(timeout=1)
+
+
 @pytest.mark.asyncio
 async def test_read_delayed(filename, contents, server, event_loop):
     rrq = Request(Opcode.RRQ, filename=filename, mode=Mode.OCTET)
     _, protocol = await event_loop.create_datagram_endpoint(
-        lambda: DelayedAckClient(rrq, event_loop), local_addr=('127.0.0.1', 0))
+        lambda: DelayedAckClient(rrq, event_loop, port=1084),
+        local_addr=('127.0.0.1', 0))
 
     assert await protocol.wait() == contents
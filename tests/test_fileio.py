@@ -0,0 +1,115 @@
+import os
+
+import aiotftp
+from aiotftp import fileio
+from aiotftp.fileio import FileReader, FileWriter
+from async_generator import yield_, async_generator
+import pytest
+
+
+async def read_all(path, blksize, loop, **kwargs):
+    reader = await FileReader.open(path, loop=loop, **kwargs)
+    blocks = []
+    try:
+        while True:
+            block = await reader.read(blksize)
+            blocks.append(bytes(block))
+            if len(block) < blksize:
+                break
+    finally:
+        await reader.close()
+    return reader, blocks
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('size', [0, 100, 512, 1000, 4096, 10000])
+async def test_reader_blocks(size, tmp_path, event_loop, monkeypatch):
+    monkeypatch.setattr(fileio, 'READ_SIZE', 2048)
+    contents = os.urandom(size)
+    path = tmp_path / 'file'
+    path.write_bytes(contents)
+
+    reader, blocks = await read_all(str(path), 512, event_loop,
+                                    readahead=4096)
+
+    assert reader.size == size
+    assert b''.join(blocks) == contents
+    assert all(len(block) == 512 for block in blocks[:-1])
+    assert len(blocks[-1]) < 512
+    assert len(blocks) == size // 512 + 1
+
+
+@pytest.mark.asyncio
+async def test_reader_queues_ahead(tmp_path, event_loop, monkeypatch):
+    monkeypatch.setattr(fileio, 'READ_SIZE', 1024)
+    path = tmp_path / 'file'
+    path.write_bytes(b'x' * 10000)
+
+    reader = await FileReader.open(str(path), readahead=4096,
+                                   loop=event_loop)
+    try:
+        await reader.read(512)
+        assert len(reader._pending) == 4
+    finally:
+        await reader.close()
+
+
+@pytest.mark.asyncio
+async def test_reader_missing(tmp_path, event_loop):
+    with pytest.raises(FileNotFoundError):
+        await FileReader.open(str(tmp_path / 'missing'), loop=event_loop)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('fsync', [True, False])
+async def test_writer(fsync, tmp_path, event_loop, monkeypatch):
+    monkeypatch.setattr(fileio, 'WRITE_SIZE', 1000)
+    contents = os.urandom(10000)
+    path = tmp_path / 'file'
+
+    # Reserve more than is written; the excess is dropped on close
+    writer = await FileWriter.open(str(path), 20000, write_behind=2000,
+                                   loop=event_loop)
+    for offset in range(0, len(contents), 300):
+        await writer.write(contents[offset:offset + 300])
+        assert writer._queued <= 2000 + 1200
+    await writer.close(fsync=fsync)
+
+    assert writer.size == len(contents)
+    assert path.read_bytes() == contents
+
+
+@pytest.fixture
+@async_generator
+async def file_server(tmp_path, event_loop):
+    async def rrq(request):
+        return aiotftp.FileResponse(str(tmp_path / request.filename))
+
+    async def wrq(request):
+        await request.save(str(tmp_path / request.filename))
+
+    server = aiotftp.Server(rrq, wrq)
+    transport, _ = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1074))
+
+    await yield_(tmp_path)
+    transport.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('size', [0, 1000, 1024, 300000])
+async def test_file_response(size, file_server, event_loop):
+    contents = os.urandom(size)
+    (file_server / 'file').write_bytes(contents)
+
+    url = 'tftp://127.0.0.1:1074/file'
+    async with aiotftp.read(url, windowsize=8, loop=event_loop) as response:
+        assert await response.data() == contents
+
+
+@pytest.mark.asyncio
+async def test_file_response_missing(file_server, event_loop):
+    url = 'tftp://127.0.0.1:1074/missing'
+    with pytest.raises(FileNotFoundError):
+        async with aiotftp.read(url, loop=event_loop) as response:
+            await response.data()
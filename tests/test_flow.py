@@ -0,0 +1,157 @@
+import asyncio
+
+from aiotftp.packet import Ack
+from aiotftp.protocol import InboundDataProtocol, OutboundDataProtocol
+from aiotftp.streams import StreamReader
+import pytest
+
+from .test_window import PEER, RecordingTransport, feed
+
+SERVER = ('127.0.0.1', 1069)
+
+
+class Link:
+    """Half of an in-process datagram link between two protocols."""
+
+    def __init__(self, loop, local, protocol):
+        self._loop = loop
+        self._local = local
+        self._protocol = protocol
+        self._closing = False
+        self.peer = None
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return self._closing
+
+    def sendto(self, data, addr=None):
+        if not self._closing:
+            self._loop.call_soon(self.peer.datagram_received, bytes(data),
+                                 self._local)
+
+    def close(self):
+        if not self._closing:
+            self._closing = True
+            self._loop.call_soon(self._protocol.connection_lost, None)
+
+
+def connect(loop, sender, receiver):
+    sending = Link(loop, PEER, sender)
+    receiving = Link(loop, SERVER, receiver)
+    sending.peer, receiving.peer = receiver, sender
+    sender.connection_made(sending)
+    receiver.connection_made(receiving)
+
+
+class Pausable:
+    def __init__(self):
+        self.calls = []
+
+    def pause_reading(self):
+        self.calls.append('pause')
+
+    def resume_reading(self):
+        self.calls.append('resume')
+
+
+@pytest.mark.asyncio
+async def test_stream_watermarks(event_loop):
+    stream = StreamReader(limit=100, loop=event_loop)
+    protocol = Pausable()
+    stream.set_protocol(protocol)
+
+    stream.feed_data(b'x' * 150)
+    stream.feed_data(b'x' * 50)
+    assert protocol.calls == []
+    stream.feed_data(b'x' * 50)
+    stream.feed_data(b'x' * 50)
+    assert protocol.calls == ['pause']
+
+    assert await stream.read() == b'x' * 300
+    assert protocol.calls == ['pause', 'resume']
+
+
+@pytest.fixture
+def receiver(event_loop):
+    stream = StreamReader(limit=8, loop=event_loop)
+    protocol = InboundDataProtocol(stream, tid=PEER, loop=event_loop)
+    protocol.connection_made(RecordingTransport())
+    protocol.start({'blksize': 8, 'windowsize': 2})
+    return protocol
+
+
+def test_receiver_holds_ack(receiver):
+    feed(receiver, 1, 2, 3, 4)
+    assert receiver.transport.sent[1:] == [Ack(2)]
+
+    # Retransmissions while paused are duplicates
+    feed(receiver, 3, 4)
+    assert receiver.transport.sent[1:] == [Ack(2)]
+
+    receiver.stream.read_nowait()
+    assert receiver.transport.sent[1:] == [Ack(2), Ack(4)]
+
+
+def test_receiver_sends_final_ack_while_paused(receiver):
+    feed(receiver, 1, 2, 3)
+    feed(receiver, 4, size=0)
+    assert receiver.transport.sent[1:] == [Ack(2), Ack(4)]
+    assert receiver.stream.is_eof()
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_large_upload(event_loop):
+    size = 1024 ** 3
+    blksize = 65464
+    windowsize = 16
+    limit = 1024 * 1024
+
+    stream = StreamReader(limit=limit, loop=event_loop)
+    receiver = InboundDataProtocol(stream, tid=PEER, loop=event_loop)
+    sender = OutboundDataProtocol(tid=SERVER, loop=event_loop)
+    connect(event_loop, sender, receiver)
+
+    pauses = []
+    pause_reading = receiver.pause_reading
+
+    def counting_pause():
+        pauses.append(stream._size)
+        pause_reading()
+
+    receiver.pause_reading = counting_pause
+
+    async def upload():
+        options = {'blksize': blksize, 'windowsize': windowsize}
+        starting = event_loop.create_task(
+            sender.start('upload', SERVER, options))
+        await asyncio.sleep(0)
+        receiver.start(options)
+        await starting
+
+        block = memoryview(bytes(blksize))
+        for offset in range(0, size, blksize):
+            await sender.write(block[:min(blksize, size - offset)])
+        if size % blksize == 0:
+            await sender.write(b'')
+
+    async def consume():
+        received = peak = 0
+        async for chunk in stream:
+            received += len(chunk)
+            peak = max(peak, stream._size + len(chunk))
+            # Slower than the sender: let a few windows arrive per read
+            for _ in range(32):
+                await asyncio.sleep(0)
+        return received, peak
+
+    received, peak = (await asyncio.gather(consume(), upload()))[0]
+
+    assert received == size
+    assert pauses
+    # Never more than the high water mark plus the window in flight
+    assert peak <= 2 * limit + windowsize * blksize
@@ -0,0 +1,140 @@
+import collections
+import json
+import logging
+import time
+
+import aiotftp
+from aiotftp.logger import AccessLogger, JSONFormatter, QueuedAccessLogger
+from aiotftp.packet import Opcode
+import pytest
+
+Request = collections.namedtuple('Request', 'remote method filename')
+Response = collections.namedtuple('Response', 'length')
+
+FORMAT = '%a %t %o "%r" %b %D'
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def records():
+    logger = logging.getLogger('aiotftp.access.test')
+    handler = Records()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    yield handler.records
+    logger.removeHandler(handler)
+
+
+@pytest.fixture
+def logger(records):
+    return logging.getLogger('aiotftp.access.test')
+
+
+def start_time(when):
+    return time.strftime('[%d/%b/%Y:%H:%M:%S +0000]', time.gmtime(when))
+
+
+def test_start_time(logger, records):
+    before = time.time() - 2.5
+    AccessLogger(logger, FORMAT).log(
+        Request(('10.0.0.1', 1000), Opcode.RRQ, 'boot.cfg'),
+        Response(1000), 2.5)
+    after = time.time() - 2.5
+
+    record, = records
+    assert record.request_start_time in {start_time(before),
+                                         start_time(after)}
+    assert record.getMessage() == (
+        '10.0.0.1 {} RRQ "boot.cfg" 1000 2500000'.format(
+            record.request_start_time))
+
+
+def test_queued(logger, records):
+    access_logger = QueuedAccessLogger(logger, FORMAT, interval=60,
+                                       max_queued=3)
+    for n in range(5):
+        access_logger.log(
+            Request(('10.0.0.1', 1000 + n), Opcode.WRQ, str(n)), None, n)
+    assert access_logger.dropped == 2
+
+    access_logger.close()
+    assert [record.request for record in records] == ['0', '1', '2']
+    assert {record.threadName for record in records} == {
+        'aiotftp-access-log'}
+    assert records[2].response_size == '-'
+    assert records[2].request_time_micro == 2000000
+
+    # Logging again starts another thread
+    access_logger.log(Request(('10.0.0.1', 1000), Opcode.RRQ, 'again'),
+                      Response(10), 0.5)
+    access_logger.close()
+    assert records[-1].request == 'again'
+
+
+def test_json(logger, records):
+    AccessLogger(logger, FORMAT).log(
+        Request(('10.0.0.1', 1000), Opcode.WRQ, 'upload'), None, 0.25)
+
+    entry = json.loads(JSONFormatter().format(records[0]))
+    assert entry.pop('time') == records[0].created
+    assert entry.pop('request_start_time').startswith('[')
+    assert entry == {
+        'remote_address': '10.0.0.1',
+        'operation': 'WRQ',
+        'request': 'upload',
+        'response_size': None,
+        'request_time_micro': 250000,
+    }
+
+
+@pytest.mark.asyncio
+async def test_server_queued_log(logger, records, event_loop):
+    async def rrq(request):
+        return aiotftp.Response(b'x' * 1000)
+
+    server = aiotftp.Server(rrq, None, access_log=logger,
+                            access_log_class=QueuedAccessLogger)
+    _, handler = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1081))
+    try:
+        for _ in range(3):
+            async with aiotftp.read('tftp://127.0.0.1:1081/file',
+                                    loop=event_loop) as response:
+                await response.data()
+    finally:
+        await handler.shutdown(timeout=1)
+
+    assert [(record.request, record.response_size)
+            for record in records] == [('file', 1000)] * 3
+
+
+@pytest.mark.asyncio
+async def test_logger_without_close(event_loop):
+    class Logger:
+        def __init__(self, logger, log_format):
+            self.lines = []
+
+        def log(self, request, response, time):
+            self.lines.append(request.filename)
+
+    async def rrq(request):
+        return aiotftp.Response(b'x')
+
+    server = aiotftp.Server(rrq, None, access_log_class=Logger)
+    _, handler = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1081))
+    async with aiotftp.read('tftp://127.0.0.1:1081/file',
+                            loop=event_loop) as response:
+        await response.data()
+    await handler.shutdown(timeout=1)
+
+    assert handler.access_logger.lines == ['file']
@@ -0,0 +1,105 @@
+import asyncio
+import os
+
+import aiotftp
+from aiotftp.mapping import _MAPPINGS, open_mapping
+from async_generator import yield_, async_generator
+from async_timeout import timeout
+import pytest
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / 'image.bin'
+    path.write_bytes(bytes(range(256)) * 20)
+    return str(path)
+
+
+def test_mapping_shared(image):
+    with open_mapping(image) as first, open_mapping(image) as second:
+        assert first is second
+        assert first.size == os.path.getsize(image)
+        with open(image, 'rb') as fobj:
+            assert first.view[100:612] == fobj.read()[100:612]
+
+        assert not first.closed
+    assert first.closed
+    assert first.key not in _MAPPINGS
+
+
+def test_mapping_released_with_slice_held(image):
+    with open_mapping(image) as mapping:
+        block = mapping.view[:512]
+    assert mapping.closed
+    assert bytes(block) == bytes(range(256)) * 2
+
+
+def test_mapping_replaced_file(image):
+    with open_mapping(image) as first:
+        with open(image, 'wb') as fobj:
+            fobj.write(b'new')
+        os.utime(image, ns=(0, 0))
+
+        with open_mapping(image) as second:
+            assert second is not first
+            assert second.view == b'new'
+
+
+def test_mapping_empty_file(tmp_path):
+    path = tmp_path / 'empty'
+    path.write_bytes(b'')
+
+    with open_mapping(str(path)) as mapping:
+        assert mapping.size == 0
+        assert mapping.view == b''
+
+
+@pytest.fixture
+@async_generator
+async def mapped_server(tmp_path, event_loop):
+    async def rrq(request):
+        return aiotftp.FileResponse(str(tmp_path / request.filename),
+                                    mmap=True)
+
+    server = aiotftp.Server(rrq, None)
+    transport, _ = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1073))
+
+    await yield_(tmp_path)
+    transport.close()
+
+
+async def unmapped():
+    # The server finishes up just after the client has its data
+    async with timeout(1):
+        while _MAPPINGS:
+            await asyncio.sleep(0.01)
+
+
+async def fetch(filename, loop, **kwargs):
+    url = 'tftp://127.0.0.1:1073/{}'.format(filename)
+    async with aiotftp.read(url, loop=loop, **kwargs) as response:
+        return await response.data()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('size', [0, 1000, 1024])
+async def test_mapped_file_response(size, mapped_server, event_loop):
+    contents = os.urandom(size)
+    (mapped_server / 'file').write_bytes(contents)
+
+    assert await fetch('file', event_loop) == contents
+    assert await fetch('file', event_loop, blksize=100,
+                       tsize=True) == contents
+    await unmapped()
+
+
+@pytest.mark.asyncio
+async def test_mapped_file_response_concurrent(mapped_server, event_loop):
+    contents = os.urandom(5000)
+    (mapped_server / 'file').write_bytes(contents)
+
+    results = await asyncio.gather(
+        *(fetch('file', event_loop) for _ in range(5)))
+    assert results == [contents] * 5
+    await unmapped()
@@ -0,0 +1,69 @@
+import aiotftp
+from aiotftp import metrics
+from aiotftp.metrics import Registry
+import pytest
+
+
+def test_exposition():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests received')
+    active = registry.gauge('active', 'Sessions running')
+    rtt = registry.histogram('rtt_seconds', 'Round trips', [0.1, 0.01, 1])
+
+    requests.inc()
+    requests.value += 2
+    active.inc(5)
+    active.dec()
+    for value in (0.005, 0.01, 0.5, 2):
+        rtt.observe(value)
+
+    assert rtt.count == 4
+    assert registry.expose() == '\n'.join([
+        '# HELP requests_total Requests received',
+        '# TYPE requests_total counter',
+        'requests_total 3',
+        '# HELP active Sessions running',
+        '# TYPE active gauge',
+        'active 4',
+        '# HELP rtt_seconds Round trips',
+        '# TYPE rtt_seconds histogram',
+        'rtt_seconds_bucket{le="0.01"} 2',
+        'rtt_seconds_bucket{le="0.1"} 2',
+        'rtt_seconds_bucket{le="1"} 3',
+        'rtt_seconds_bucket{le="+Inf"} 4',
+        'rtt_seconds_sum 2.515',
+        'rtt_seconds_count 4',
+    ]) + '\n'
+
+    registry.reset()
+    assert requests.value == 0
+    assert rtt.count == 0
+
+    with pytest.raises(ValueError):
+        registry.counter('active', 'Again')
+
+
+@pytest.mark.asyncio
+async def test_transfer_metrics(server, event_loop):
+    def snapshot():
+        return {metric.name: (metric.count if hasattr(metric, 'counts')
+                              else metric.value)
+                for metric in metrics.REGISTRY}
+
+    before = snapshot()
+    url = 'tftp://127.0.0.1:1069/large_file'
+    async with aiotftp.read(url, loop=event_loop) as response:
+        assert len(await response.data()) == 1000
+    await aiotftp.write(url, data=b'x' * 1000, loop=event_loop)
+    await server.wrq_files['large_file']
+
+    after = snapshot()
+    delta = {name: after[name] - before[name] for name in after}
+    assert delta['tftp_requests_total'] == 2
+    assert delta['tftp_blocks_sent_total'] >= 2
+    assert delta['tftp_bytes_sent_total'] >= 1000
+    assert delta['tftp_blocks_received_total'] >= 2
+    assert delta['tftp_bytes_received_total'] >= 1000
+    assert delta['tftp_first_block_seconds'] == 1
+    assert delta['tftp_transfer_seconds'] >= 1
+    assert delta['tftp_rtt_seconds'] >= 2
@@ -0,0 +1,165 @@
+import asyncio
+import socket
+
+import aiotftp
+from aiotftp import mmsg
+from aiotftp.helpers import raw_socket
+from aiotftp.pool import EndpointPool
+from async_generator import yield_, async_generator
+from async_timeout import timeout
+import pytest
+
+from .conftest import FILES
+
+pytestmark = pytest.mark.skipif(not mmsg.AVAILABLE,
+                                reason='recvmmsg/sendmmsg not available')
+
+
+@pytest.mark.parametrize('addr', [
+    ('127.0.0.1', 69),
+    ('10.1.2.3', 65535),
+    ('::1', 6969, 0, 0),
+    ('fe80::1', 1, 5, 2),
+])
+def test_sockaddr(addr):
+    assert mmsg.decode_sockaddr(mmsg.encode_sockaddr(addr)) == addr
+
+
+class Recorder(asyncio.DatagramProtocol):
+    def __init__(self, loop):
+        self.received = []
+        self.lost = loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.received.append((data, addr))
+
+    def connection_lost(self, exc):
+        self.lost.set_result(exc)
+
+
+@pytest.fixture
+def engine(event_loop):
+    return mmsg.MmsgEngine(batch=8, loop=event_loop)
+
+
+@pytest.mark.asyncio
+async def test_batched_send(engine, event_loop, monkeypatch):
+    calls = []
+    send = engine._send
+
+    def counting_send(fileno, queue):
+        sent = send(fileno, queue)
+        calls.append(sent)
+        return sent
+
+    monkeypatch.setattr(engine, '_send', counting_send)
+
+    receiver, server = await engine.create_datagram_endpoint(
+        lambda: Recorder(event_loop), local_addr=('127.0.0.1', 0))
+    sender, client = await engine.create_datagram_endpoint(
+        lambda: Recorder(event_loop), local_addr=('127.0.0.1', 0))
+    addr = receiver.get_extra_info('sockname')
+
+    try:
+        assert raw_socket(sender) is None
+
+        for n in range(20):
+            sender.sendto(bytes([n]) * 10, addr)
+        assert sender.get_write_buffer_size() == 200
+
+        await asyncio.sleep(0.05)
+        assert calls == [8, 8, 4]
+        assert sender.get_write_buffer_size() == 0
+
+        local = sender.get_extra_info('sockname')
+        assert server.received == [(bytes([n]) * 10, local)
+                                   for n in range(20)]
+    finally:
+        receiver.close()
+        sender.close()
+
+
+@pytest.mark.asyncio
+async def test_connected_endpoint(engine, event_loop):
+    receiver, server = await engine.create_datagram_endpoint(
+        lambda: Recorder(event_loop), local_addr=('127.0.0.1', 0))
+    addr = receiver.get_extra_info('sockname')
+    sender, _ = await engine.create_datagram_endpoint(
+        lambda: Recorder(event_loop), remote_addr=addr)
+
+    try:
+        assert sender.get_extra_info('peername') == addr
+        sender.sendto(b'one')
+        sender.sendto(b'two', addr)
+        with pytest.raises(ValueError):
+            sender.sendto(b'three', ('127.0.0.1', 1))
+
+        await asyncio.sleep(0.05)
+        assert [data for data, _ in server.received] == [b'one', b'two']
+    finally:
+        receiver.close()
+        sender.close()
+
+
+@pytest.mark.asyncio
+async def test_close_flushes(engine, event_loop):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(1)
+
+    sender, client = await engine.create_datagram_endpoint(
+        lambda: Recorder(event_loop),
+        remote_addr=receiver.getsockname())
+    sender.sendto(b'queued')
+    sender.close()
+
+    assert await client.lost is None
+    assert receiver.recv(100) == b'queued'
+    receiver.close()
+
+
+@pytest.fixture
+@async_generator
+async def mmsg_server(engine, event_loop):
+    async def rrq(request):
+        return aiotftp.Response(FILES[request.filename])
+
+    async def wrq(request):
+        uploads[request.filename] = await request.read()
+
+    uploads = {}
+    pool = EndpointPool(('127.0.0.1', 0), size=2, min_size=1,
+                        engine=engine, loop=event_loop)
+    await pool.start()
+
+    plain = aiotftp.Server(rrq, wrq, io_engine=engine)
+    pooled = aiotftp.Server(rrq, wrq, io_engine=engine, endpoint_pool=pool)
+    transports = [
+        (await engine.create_datagram_endpoint(
+            server, local_addr=('127.0.0.1', port)))[0]
+        for server, port in ((plain, 1076), (pooled, 1077))]
+
+    await yield_(uploads)
+    for transport in transports:
+        transport.close()
+    pool.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('port', [1076, 1077])
+async def test_mmsg_server(port, filename, contents, mmsg_server,
+                           event_loop):
+    url = 'tftp://127.0.0.1:{}/{}'.format(port, filename)
+
+    async with aiotftp.read(url, windowsize=4, loop=event_loop) as response:
+        assert await response.data() == contents
+
+    await aiotftp.write(url, data=contents, windowsize=4, loop=event_loop)
+    # The handler finishes just after the client has its last ACK
+    async with timeout(1):
+        while filename not in mmsg_server:
+            await asyncio.sleep(0.01)
+    assert mmsg_server[filename] == contents
@@ -0,0 +1,103 @@
+import asyncio
+
+from aiotftp import options
+from aiotftp.packet import Error, ErrorCode, Mode, Opcode, parse, Request
+import pytest
+
+
+@pytest.mark.parametrize("requested,expected", [
+    ({}, {}),
+    ({'blksize': '1428'}, {'blksize': 1428}),
+    ({'BLKSIZE': '8'}, {'blksize': 8}),
+    ({'blksize': '100000'}, {'blksize': options.MAX_BLKSIZE}),
+    ({'blksize': '7'}, {}),
+    ({'blksize': 'lots'}, {}),
+    ({'unknown': '1'}, {}),
+    ({'windowsize': '16'}, {'windowsize': 16}),
+    ({'windowsize': '0'}, {}),
+    ({'timeout': '5'}, {'timeout': 5}),
+    ({'timeout': '0'}, {}),
+    ({'timeout': '256'}, {}),
+    ({'tsize': '0'}, {'tsize': 0}),
+    ({'tsize': '1048576'}, {'tsize': 1048576}),
+    ({'tsize': '-1'}, {}),
+])
+def test_negotiate(requested, expected):
+    assert options.negotiate(requested) == expected
+
+
+def test_negotiate_max_blksize():
+    negotiated = options.negotiate({'blksize': '8192'}, max_blksize=1428)
+    assert negotiated == {'blksize': 1428}
+
+
+def test_negotiate_max_windowsize():
+    negotiated = options.negotiate({'windowsize': '128'}, max_windowsize=64)
+    assert negotiated == {'windowsize': 64}
+
+    negotiated = options.negotiate({'windowsize': '128'}, max_windowsize=None)
+    assert negotiated == {}
+
+
+def test_negotiate_max_tsize():
+    negotiated = options.negotiate({'tsize': '1000'}, max_tsize=1000)
+    assert negotiated == {'tsize': 1000}
+
+    with pytest.raises(options.OptionError):
+        options.negotiate({'tsize': '1001'}, max_tsize=1000)
+    with pytest.raises(options.OptionError):
+        options.negotiate({'tsize': str(10 ** 10)})
+
+    negotiated = options.negotiate({'tsize': str(10 ** 10)}, max_tsize=None)
+    assert negotiated == {'tsize': 10 ** 10}
+
+
+class Received(asyncio.DatagramProtocol):
+    def __init__(self, loop):
+        self.received = loop.create_future()
+
+    def datagram_received(self, data, addr):
+        if not self.received.done():
+            self.received.set_result(data)
+
+
+@pytest.mark.asyncio
+async def test_refuse_large_upload(server, event_loop):
+    client, protocol = await event_loop.create_datagram_endpoint(
+        lambda: Received(event_loop), local_addr=('127.0.0.1', 0))
+    try:
+        request = Request(Opcode.WRQ, filename='large_file', mode=Mode.OCTET,
+                          options={'tsize': str(10 ** 10)})
+        client.sendto(bytes(request), ('127.0.0.1', 1069))
+        packet = parse(await protocol.received)
+    finally:
+        client.close()
+
+    assert isinstance(packet, Error)
+    assert packet.code == ErrorCode.OPTIONNEGOTIATION
+    assert server.requests == []
+
+
+def test_accept():
+    accepted = options.accept({'blksize': 8192}, {'blksize': '1428'})
+    assert accepted == {'blksize': 1428}
+
+
+@pytest.mark.parametrize("offered", [
+    {'blksize': '8193'},
+    {'blksize': '4'},
+    {'tsize': '12'},
+    {'windowsize': '2'},
+])
+def test_accept_invalid(offered):
+    with pytest.raises(options.OptionError):
+        options.accept({'blksize': 8192}, offered)
+
+
+def test_accept_timeout_tsize():
+    requested = {'timeout': 3, 'tsize': 0}
+    accepted = options.accept(requested, {'timeout': '3', 'tsize': '1234'})
+    assert accepted == {'timeout': 3, 'tsize': 1234}
+
+    with pytest.raises(options.OptionError):
+        options.accept(requested, {'timeout': '4'})
@@ -3,6 +3,7 @@ import string
 
 from aiotftp import packet
 from aiotftp.packet import ushort, parse_ushort
+import attr
 from hypothesis import given
 import hypothesis.strategies as st
 import pytest
@@ -25,6 +26,8 @@ def test_parse_valid_packet(buf):
     b"\x04\x08filename.txt\x00NETASCII\x00",
     b"\x00\x02file\x00Ocet\x00",
     b"\x00\x04\x01",
+    b"\x00\x03\x00",
+    b"\x00",
     b"",
     b"\x00\x05\x00\x0Fno such user\x00",
 ], ids=unicode_escape)
@@ -64,6 +67,25 @@ def test_data_packets(pkt):
     assert packet.parse(data) == pkt
 
 
+@given(ushorts, st.binary(max_size=512))
+def test_encode_data(blockid, data):
+    assert packet.encode_data(blockid, data) == \
+        b''.join((packet.Opcode.DATA.value, ushort(blockid), data))
+    assert packet.encode_data(blockid, memoryview(data)) == \
+        bytes(packet.Data(blockid, data))
+
+
+@given(ushorts)
+def test_encode_ack(blockid):
+    assert packet.encode_ack(blockid) == \
+        packet.Opcode.ACK.value + ushort(blockid)
+
+
+def test_packets_have_slots():
+    for cls in set(packet.PACKETS.values()):
+        assert not hasattr(cls(*[None] * len(attr.fields(cls))), '__dict__')
+
+
 ack_packets = st.builds(packet.Ack, blockid=ushorts)
 
 
@@ -81,3 +103,26 @@ error_packets = st.builds(packet.Error, code=error_codes, message=ascii_text)
 def test_error_packets(pkt):
     data = bytes(pkt)
     assert packet.parse(data) == pkt
+
+
+options = st.dictionaries(
+    st.text(alphabet=string.ascii_lowercase, min_size=1),
+    st.text(alphabet=string.digits, min_size=1))
+option_request_packets = st.builds(
+    packet.Request, opcode=opcodes, filename=ascii_text, mode=modes,
+    options=options)
+
+
+@given(option_request_packets)
+def test_request_packets_with_options(pkt):
+    data = bytes(pkt)
+    assert packet.parse(data) == pkt
+
+
+oack_packets = st.builds(packet.OptionAck, options=options)
+
+
+@given(oack_packets)
+def test_oack_packets(pkt):
+    data = bytes(pkt)
+    assert packet.parse(data) == pkt
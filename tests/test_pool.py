@@ -0,0 +1,91 @@
+import asyncio
+
+import aiotftp
+from aiotftp.pool import EndpointPool, LeasedTransport
+from async_generator import yield_, async_generator
+import pytest
+
+from .conftest import FILES
+
+
+@pytest.fixture
+@async_generator
+async def pool(event_loop):
+    pool = EndpointPool(('127.0.0.1', 0), size=2, min_size=1,
+                        peers_per_socket=2, idle_timeout=0.2,
+                        loop=event_loop)
+    await pool.start()
+    await yield_(pool)
+    pool.close()
+
+
+@pytest.fixture
+@async_generator
+async def pooled_server(pool, event_loop):
+    async def rrq(request):
+        return aiotftp.Response(FILES[request.filename])
+
+    async def wrq(request):
+        uploads[request.filename] = await request.read()
+
+    uploads = {}
+    server = aiotftp.Server(rrq, wrq, endpoint_pool=pool)
+    transport, _ = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1071))
+
+    await yield_(uploads)
+    transport.close()
+
+
+async def fetch(filename, loop):
+    url = 'tftp://127.0.0.1:1071/{}'.format(filename)
+    async with aiotftp.read(url, loop=loop) as response:
+        return await response.data()
+
+
+@pytest.mark.asyncio
+async def test_pool_concurrent_reads(pool, pooled_server, event_loop):
+    filenames = list(FILES) * 2
+    results = await asyncio.gather(
+        *(fetch(filename, event_loop) for filename in filenames))
+
+    assert results == [FILES[filename] for filename in filenames]
+    assert len(pool) <= 2
+
+
+@pytest.mark.asyncio
+async def test_pool_write(pool, pooled_server, event_loop):
+    url = 'tftp://127.0.0.1:1071/upload'
+    await aiotftp.write(url, data=b'x' * 1000, loop=event_loop)
+
+    await asyncio.sleep(0.1)
+    assert pooled_server['upload'] == b'x' * 1000
+
+
+@pytest.mark.asyncio
+async def test_pool_lease_and_evict(pool, event_loop):
+    peer = ('127.0.0.1', 9)
+    leases = [await pool.lease(asyncio.DatagramProtocol, (peer[0], port))
+              for port in range(5000, 5004)]
+
+    assert all(isinstance(t, LeasedTransport) for t, _ in leases)
+    assert len(pool) == 2
+    assert pool.sessions == 4
+
+    # A second transfer with the same peer has to go on the other socket
+    leases.append(await pool.lease(asyncio.DatagramProtocol, peer))
+    leases.append(await pool.lease(asyncio.DatagramProtocol, peer))
+    assert isinstance(leases[-1][0], LeasedTransport)
+    assert pool.sessions == 6
+
+    # Now every socket already talks to this peer and the pool is full,
+    # so the next transfer gets a dedicated endpoint instead
+    transport, _ = await pool.lease(asyncio.DatagramProtocol, peer)
+    assert not isinstance(transport, LeasedTransport)
+    transport.close()
+
+    for transport, _ in leases:
+        transport.close()
+
+    await asyncio.sleep(0.5)
+    assert len(pool) == 1
@@ -0,0 +1,137 @@
+import array
+import asyncio
+import gc
+
+import aiotftp
+from aiotftp.packet import Error, ErrorCode, Mode, Opcode, parse, Request
+from aiotftp.response import Response, StreamResponse
+import pytest
+
+
+class RecordingWriter:
+    def __init__(self, blksize):
+        self.blksize = blksize
+        self.blocks = []
+        self.output_size = 0
+
+    async def write(self, chunk):
+        self.blocks.append(chunk)
+        self.output_size += len(chunk)
+
+
+class RecordingTransport:
+    def close(self):
+        pass
+
+
+class Received(asyncio.DatagramProtocol):
+    def __init__(self, loop):
+        self.received = loop.create_future()
+
+    def datagram_received(self, data, addr):
+        if not self.received.done():
+            self.received.set_result(data)
+
+
+def prepared(response, blksize):
+    writer = RecordingWriter(blksize)
+    response._writer = writer
+    response.transport = RecordingTransport()
+    return writer
+
+
+def check_blocks(blocks, blksize, contents):
+    assert b''.join(bytes(block) for block in blocks) == contents
+    assert all(len(block) == blksize for block in blocks[:-1])
+    assert len(blocks[-1]) < blksize
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('size', [0, 1, 511, 512, 513, 5000, 5120])
+async def test_response_blocks(size, event_loop):
+    contents = bytes(range(256)) * 20
+    contents = contents[:size]
+    response = Response(contents)
+    writer = prepared(response, 512)
+
+    await response.write_eof()
+
+    check_blocks(writer.blocks, 512, contents)
+    assert len(writer.blocks) == size // 512 + 1
+    assert response.length == size
+
+
+@pytest.mark.asyncio
+async def test_response_zero_copy(event_loop):
+    contents = b'x' * 2000
+    response = Response(contents)
+    writer = prepared(response, 512)
+
+    await response.write_eof()
+
+    # Full blocks of immutable data are views, not copies
+    assert all(block.obj is contents for block in writer.blocks[:-1])
+
+
+@pytest.mark.asyncio
+async def test_response_itemsize(event_loop):
+    contents = array.array('I', range(1000))
+    response = Response(memoryview(contents))
+    writer = prepared(response, 512)
+    assert response.content_length == 4000
+
+    await response.write_eof()
+    check_blocks(writer.blocks, 512, contents.tobytes())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('sizes', [
+    [100, 100, 400, 1000],
+    [512, 512],
+    [1, 511, 0, 1024, 3],
+    [2000, 10, 502],
+])
+async def test_stream_response_writes(sizes, event_loop):
+    response = StreamResponse()
+    writer = prepared(response, 512)
+
+    contents = bytearray()
+    for n, size in enumerate(sizes):
+        chunk = bytearray([n]) * size
+        contents += chunk
+        await response.write(chunk)
+        # Reusing the caller's buffer mustn't change what was sent
+        chunk[:] = b'\xff' * size
+    await response.write_eof()
+
+    check_blocks(writer.blocks, 512, bytes(contents))
+    assert len(writer.blocks) == len(contents) // 512 + 1
+
+
+@pytest.mark.asyncio
+async def test_file_response_missing(tmp_path, event_loop):
+    async def rrq(request):
+        return aiotftp.FileResponse(str(tmp_path / request.filename))
+
+    errors = []
+    event_loop.set_exception_handler(lambda loop, context:
+                                     errors.append(context))
+
+    server = aiotftp.Server(rrq, None)
+    _, handler = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1082))
+    client, protocol = await event_loop.create_datagram_endpoint(
+        lambda: Received(event_loop), local_addr=('127.0.0.1', 0))
+    try:
+        request = Request(Opcode.RRQ, filename='missing', mode=Mode.OCTET)
+        client.sendto(bytes(request), ('127.0.0.1', 1082))
+        packet = parse(await protocol.received)
+        assert isinstance(packet, Error)
+        assert packet.code == ErrorCode.FILENOTFOUND
+    finally:
+        client.close()
+        await handler.shutdown(timeout=1)
+
+    gc.collect()
+    await asyncio.sleep(0)
+    assert errors == []
@@ -0,0 +1,43 @@
+from aiotftp.rtt import RTTEstimator
+import pytest
+
+
+def test_initial_rto_is_clamped():
+    assert RTTEstimator(2.0).rto == 2.0
+    assert RTTEstimator(0.01, minimum=0.1).rto == 0.1
+    assert RTTEstimator(60.0, maximum=10.0).rto == 10.0
+
+
+def test_first_sample():
+    rtt = RTTEstimator(2.0, minimum=0.0)
+    rtt.sample(0.1)
+    assert rtt.srtt == 0.1
+    assert rtt.rttvar == 0.05
+    assert rtt.rto == pytest.approx(0.3)
+
+
+def test_converges_on_stable_path():
+    rtt = RTTEstimator(2.0, minimum=0.0)
+    for _ in range(100):
+        rtt.sample(0.04)
+    assert rtt.srtt == pytest.approx(0.04)
+    assert rtt.rto == pytest.approx(0.04, rel=0.01)
+
+
+def test_backoff_and_progress():
+    rtt = RTTEstimator(0.5, maximum=3.0)
+    rtt.backoff()
+    assert rtt.rto == 1.0
+    rtt.backoff()
+    rtt.backoff()
+    assert rtt.rto == 3.0
+
+    rtt.progress()
+    assert rtt.rto == 0.5
+
+
+def test_fixed():
+    rtt = RTTEstimator.fixed(5)
+    rtt.sample(0.01)
+    rtt.backoff()
+    assert rtt.rto == 5
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+
+import aiotftp
+from aiotftp.logger import access_log
+from aiotftp.runner import Supervisor
+import pytest
+
+
+def make_server():
+    async def rrq(request):
+        return aiotftp.Response(str(os.getpid()).encode())
+
+    return aiotftp.Server(rrq, None)
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def records():
+    handler = Records()
+    access_log.addHandler(handler)
+    access_log.setLevel(logging.INFO)
+    yield handler.records
+    access_log.removeHandler(handler)
+
+
+@pytest.fixture
+def supervisor(records):
+    supervisor = Supervisor(make_server, '127.0.0.1', 1072, workers=2)
+    supervisor.start()
+    thread = threading.Thread(target=supervisor.supervise)
+    thread.start()
+
+    yield supervisor
+
+    supervisor.interrupt()
+    thread.join()
+    supervisor.stop()
+
+
+async def fetch(loop):
+    response = aiotftp.read('tftp://127.0.0.1:1072/pid', loop=loop)
+    async with response:
+        return int(await response.data())
+
+
+@pytest.mark.asyncio
+async def test_workers_serve(supervisor, records, event_loop):
+    # Give the workers a moment to bind before we send anything
+    await asyncio.sleep(0.5)
+
+    pids = set()
+    for _ in range(20):
+        pids.add(await asyncio.wait_for(fetch(event_loop), 5))
+
+    assert pids <= set(supervisor.pids)
+
+    for _ in range(20):
+        if len(records) == 20:
+            break
+        await asyncio.sleep(0.1)
+    assert len(records) == 20
+    assert all(record.request == 'pid' for record in records)
+    assert {record.process for record in records} <= set(supervisor.pids)
+
+
+@pytest.mark.asyncio
+async def test_worker_restarted(supervisor, event_loop):
+    victim = supervisor.pids[0]
+    os.kill(victim, signal.SIGKILL)
+
+    deadline = time.monotonic() + 5
+    while victim in supervisor.pids and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+    assert victim not in supervisor.pids
+    assert len(supervisor.pids) == 2
+
+    await asyncio.sleep(0.5)
+    assert await asyncio.wait_for(fetch(event_loop), 5) in supervisor.pids
@@ -0,0 +1,109 @@
+import socket
+
+from aiotftp.packet import encode_data, parse
+from aiotftp.protocol import OutboundDataProtocol
+from async_generator import yield_, async_generator
+import pytest
+
+
+class NoSocketTransport:
+    """A transport that doesn't expose its socket."""
+
+    def __init__(self):
+        self.sent = []
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def sendto(self, data, addr=None):
+        self.sent.append((data, addr))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+@async_generator
+async def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(1)
+    await yield_(sock)
+    sock.close()
+
+
+async def sender(receiver, loop, **kwargs):
+    tid = receiver.getsockname()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: OutboundDataProtocol(tid=tid, loop=loop), **kwargs)
+    protocol.windowsize = 4
+
+    sent = []
+    transport_sendto = transport.sendto
+
+    def sendto(data, addr=None):
+        sent.append(data)
+        transport_sendto(data, addr)
+
+    transport.sendto = sendto
+    return transport, protocol, sent
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('connected', [True, False])
+async def test_sendmsg(connected, receiver, event_loop):
+    if connected:
+        kwargs = {'remote_addr': receiver.getsockname()}
+    else:
+        kwargs = {'local_addr': ('127.0.0.1', 0)}
+    transport, protocol, sent = await sender(receiver, event_loop, **kwargs)
+
+    try:
+        assert protocol._sock is not None
+        assert protocol._connected == connected
+
+        payloads = [b'a' * 512, memoryview(b'b' * 1024)[:512]]
+        for payload in payloads:
+            await protocol.write(payload)
+
+        # A retransmission rewrites the shared header for each block
+        protocol._retransmit()
+
+        expected = [encode_data(1, payloads[0]), encode_data(2, payloads[1])]
+        assert [receiver.recv(1024) for _ in range(4)] == expected * 2
+        assert not sent
+    finally:
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_sendmsg_behind_queue(receiver, event_loop):
+    transport, protocol, sent = await sender(
+        receiver, event_loop, remote_addr=receiver.getsockname())
+
+    try:
+        # With datagrams already queued on the transport, blocks have to
+        # queue up behind them
+        transport.get_write_buffer_size = lambda: 1
+        await protocol.write(b'a' * 512)
+
+        assert sent == [encode_data(1, b'a' * 512)]
+        assert receiver.recv(1024) == sent[0]
+    finally:
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_no_socket_fallback(event_loop):
+    protocol = OutboundDataProtocol(tid=('127.0.0.1', 6969), loop=event_loop)
+    transport = NoSocketTransport()
+    protocol.connection_made(transport)
+    protocol.windowsize = 4
+
+    await protocol.write(b'a' * 512)
+    await protocol.write(b'b' * 512)
+
+    assert protocol._sock is None
+    assert [(parse(data).blockid, addr) for data, addr in transport.sent] \
+        == [(1, protocol.tid), (2, protocol.tid)]
+    protocol.connection_lost(None)
@@ -0,0 +1,226 @@
+import asyncio
+
+import aiotftp
+from aiotftp.packet import Mode, Opcode, Request
+from aiotftp.sessions import Session, SessionTable
+from async_generator import yield_, async_generator
+from async_timeout import timeout
+import pytest
+
+ADDR = ('127.0.0.1', 1078)
+
+
+class Client(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.received = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.received.append((data, addr))
+
+
+def test_session_table():
+    sessions = SessionTable()
+    first = Session(tid=('10.0.0.1', 1000), opcode=Opcode.RRQ,
+                    filename='a', started=0)
+    again = Session(tid=('10.0.0.1', 1000), opcode=Opcode.RRQ,
+                    filename='a', started=1)
+    other = Session(tid=('10.0.0.1', 1001), opcode=Opcode.WRQ,
+                    filename='b', started=1)
+
+    assert sessions.add(first)
+    assert not sessions.add(again)
+    assert sessions.add(other)
+    assert len(sessions) == 2
+    assert list(sessions) == [first, other]
+    assert sessions.duplicates == 1
+
+    sessions.discard(again)
+    assert sessions.get(first.tid) is first
+    sessions.discard(first)
+    assert first.tid not in sessions
+    assert len(sessions) == 1
+
+
+@pytest.mark.asyncio
+async def test_duplicate_requests(event_loop):
+    gate = asyncio.Event()
+    calls = []
+
+    async def rrq(request):
+        calls.append(request.filename)
+        await gate.wait()
+        return aiotftp.Response(b'x' * 100)
+
+    server = aiotftp.Server(rrq, None)
+    _, handler = await event_loop.create_datagram_endpoint(
+        server, local_addr=ADDR)
+    transport, client = await event_loop.create_datagram_endpoint(
+        Client, local_addr=('127.0.0.1', 0))
+
+    try:
+        request = bytes(Request(Opcode.RRQ, filename='boot.cfg',
+                                mode=Mode.OCTET))
+        for _ in range(3):
+            transport.sendto(request, ADDR)
+        async with timeout(1):
+            while handler.sessions.duplicates < 2:
+                await asyncio.sleep(0.01)
+
+        assert calls == ['boot.cfg']
+        [session] = handler.sessions
+        assert session.tid == transport.get_extra_info('sockname')
+        assert session.filename == 'boot.cfg'
+
+        gate.set()
+        async with timeout(1):
+            while not client.received:
+                await asyncio.sleep(0.01)
+        [(data, addr)] = client.received
+        assert data[:4] == b'\x00\x03\x00\x01'
+        transport.sendto(b'\x00\x04\x00\x01', addr)
+
+        async with timeout(2):
+            while len(handler.sessions):
+                await asyncio.sleep(0.01)
+        assert calls == ['boot.cfg']
+    finally:
+        transport.close()
+        await handler.shutdown(timeout=1)
+
+
+def session(port, filename='file', host='10.0.0.1'):
+    return Session(tid=(host, port), opcode=Opcode.RRQ, filename=filename,
+                   started=0)
+
+
+@pytest.fixture
+@async_generator
+async def gates(event_loop):
+    gates = {}
+
+    def start(session):
+        async def run():
+            started.append(session.filename)
+            await gates[session.filename].wait()
+
+        gates[session.filename] = asyncio.Event()
+        return run
+
+    started = []
+    start.started = started
+    start.release = lambda filename: gates[filename].set()
+    await yield_(start)
+
+    for gate in gates.values():
+        gate.set()
+    await settle()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_admission_limit(gates, event_loop):
+    sessions = SessionTable(max_sessions=2, max_queued=1, loop=event_loop)
+    pending = [session(port, 'file{}'.format(port)) for port in range(4)]
+
+    results = [sessions.add(s) and sessions.submit(s, gates(s))
+               for s in pending]
+    assert results == [True, True, True, False]
+    assert sessions.running == 2
+    assert sessions.queued == 1
+    assert sessions.rejected == 1
+    assert len(sessions) == 3
+    assert pending[3].tid not in sessions
+
+    await settle()
+    assert gates.started == ['file0', 'file1']
+
+    gates.release('file1')
+    await settle()
+    assert gates.started == ['file0', 'file1', 'file2']
+    assert sessions.running == 2
+    assert sessions.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_admission_priority(gates, event_loop):
+    def priority(session):
+        return session.filename.endswith('.bin')
+
+    sessions = SessionTable(max_sessions=1, priority=priority,
+                            loop=event_loop)
+    names = ['running.cfg', 'a.bin', 'b.cfg', 'c.bin', 'd.cfg']
+    for port, name in enumerate(names):
+        s = session(port, name)
+        assert sessions.add(s) and sessions.submit(s, gates(s))
+
+    for _ in names[:-1]:
+        await settle()
+        gates.release(gates.started[-1])
+    await settle()
+    assert gates.started == ['running.cfg', 'b.cfg', 'd.cfg', 'a.bin',
+                             'c.bin']
+
+
+@pytest.mark.asyncio
+async def test_admission_per_client(gates, event_loop):
+    sessions = SessionTable(max_per_client=1, loop=event_loop)
+    pending = [session(1, 'one'), session(2, 'two'),
+               session(3, 'other', host='10.0.0.2')]
+    for s in pending:
+        assert sessions.add(s) and sessions.submit(s, gates(s))
+
+    await settle()
+    assert gates.started == ['one', 'other']
+    assert pending[1].queued
+
+    gates.release('other')
+    await settle()
+    assert gates.started == ['one', 'other']
+
+    gates.release('one')
+    await settle()
+    assert gates.started == ['one', 'other', 'two']
+
+
+@pytest.mark.asyncio
+async def test_busy_error(event_loop):
+    gate = asyncio.Event()
+
+    async def rrq(request):
+        await gate.wait()
+        raise FileNotFoundError(request.filename)
+
+    server = aiotftp.Server(rrq, None, max_sessions=1, max_queued=0)
+    _, handler = await event_loop.create_datagram_endpoint(
+        server, local_addr=ADDR)
+    clients = [await event_loop.create_datagram_endpoint(
+        Client, local_addr=('127.0.0.1', 0)) for _ in range(2)]
+
+    try:
+        request = bytes(Request(Opcode.RRQ, filename='firmware.bin',
+                                mode=Mode.OCTET))
+        for transport, _ in clients:
+            transport.sendto(request, ADDR)
+
+        client = clients[1][1]
+        async with timeout(1):
+            while not client.received:
+                await asyncio.sleep(0.01)
+        [(data, addr)] = client.received
+        assert data[:4] == b'\x00\x05\x00\x00'
+        assert b'busy' in data
+        assert addr == ADDR
+        assert handler.sessions.rejected == 1
+        assert len(handler.sessions) == 1
+    finally:
+        gate.set()
+        for transport, _ in clients:
+            transport.close()
+        await handler.shutdown(timeout=1)
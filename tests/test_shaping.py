@@ -0,0 +1,149 @@
+import time
+
+import aiotftp
+from aiotftp.protocol import InboundDataProtocol, OutboundDataProtocol
+from aiotftp.shaping import Pacer, Shaper, TokenBucket
+from aiotftp.streams import StreamReader
+from async_generator import yield_, async_generator
+import pytest
+
+from .test_flow import PEER, SERVER, connect
+
+
+def test_token_bucket():
+    bucket = TokenBucket(1000, burst=100)
+    assert bucket.delay(0) == 0
+    bucket.take(150, 0)
+    # Back in credit by the resume quantum, 2ms at this rate
+    assert bucket.delay(0) == pytest.approx(0.052)
+    assert bucket.delay(0.03) == pytest.approx(0.022)
+    assert bucket.delay(0.052) == 0
+
+    # Never refills past the burst
+    bucket.take(0, 10)
+    bucket.take(101, 10)
+    assert bucket.delay(10) > 0
+
+    bucket.rate = None
+    bucket.take(10 ** 9, 10)
+    assert bucket.delay(10) == 0
+
+
+@pytest.mark.parametrize('rate', [0, -1])
+def test_rate_must_be_positive(rate):
+    with pytest.raises(ValueError):
+        TokenBucket(rate)
+
+    bucket = TokenBucket(1000)
+    with pytest.raises(ValueError):
+        bucket.rate = rate
+    assert bucket.rate == 1000
+
+    shaper = Shaper(per_client=1000)
+    with pytest.raises(ValueError):
+        shaper.per_client = rate
+    with pytest.raises(ValueError):
+        Shaper(per_session=rate)
+    assert shaper.per_client == 1000
+
+
+def test_pacer_strictest_bucket():
+    fast, slow = TokenBucket(10000, burst=100), TokenBucket(1000, burst=100)
+    pacer = Pacer(fast, (slow,))
+
+    assert pacer.reserve(200, 0) == 0
+    delay = pacer.reserve(200, 0)
+    assert delay == pytest.approx(slow.delay(0))
+    assert delay > fast.delay(0)
+
+
+def test_shaper_prefixes():
+    shaper = Shaper(rate=10 ** 6, per_client=1000, per_session=500)
+    one = shaper.session(('10.0.0.1', 1000))
+    two = shaper.session(('10.0.0.2', 1000))
+    other = shaper.session(('10.0.1.1', 1000))
+    v6 = shaper.session(('2001:db8::1', 1000, 0, 0))
+
+    assert shaper.client('10.0.0.99') is shaper.client('10.0.0.1')
+    assert shaper.client('10.0.1.1') is not shaper.client('10.0.0.1')
+    assert shaper.client('2001:db8::ffff') is not None
+
+    shaper.per_client = 2000
+    shaper.per_session = None
+    assert shaper.client('10.0.0.1').rate == 2000
+    assert one.bucket.rate is None
+
+    for pacer in (one, two, other, v6):
+        pacer.close()
+    assert shaper.client('10.0.0.1') is None
+    assert shaper.client('10.0.1.1') is None
+
+
+@pytest.mark.asyncio
+async def test_paced_sender(event_loop):
+    rate = 5 * 1024 * 1024
+    blksize = 1428
+    duration = 0.5
+
+    stream = StreamReader(limit=1024 * 1024, loop=event_loop)
+    receiver = InboundDataProtocol(stream, tid=PEER, loop=event_loop)
+    sender = OutboundDataProtocol(tid=SERVER,
+                                  pacer=Pacer(TokenBucket(rate)),
+                                  loop=event_loop)
+    connect(event_loop, sender, receiver)
+    options = {'blksize': blksize, 'windowsize': 16}
+    sender._apply_options(options)
+    receiver._apply_options(options)
+
+    async def consume():
+        async for _ in stream:
+            pass
+
+    consumer = event_loop.create_task(consume())
+    block = bytes(blksize)
+    sent = 0
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        await sender.write(block)
+        sent += blksize + 4
+    elapsed = time.monotonic() - start
+    await sender.write(b'')
+    await consumer
+
+    # Within a burst of the configured rate
+    assert sent <= rate * elapsed + TokenBucket(rate).burst + blksize
+    assert sent >= rate * elapsed * 0.9
+
+
+@pytest.fixture
+@async_generator
+async def shaped_server(event_loop):
+    async def rrq(request):
+        return aiotftp.Response(b'x' * 200000)
+
+    shaper = Shaper(per_session=1024 * 1024)
+    server = aiotftp.Server(rrq, None, shaper=shaper)
+    transport, _ = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1079))
+
+    await yield_(shaper)
+    transport.close()
+
+
+@pytest.mark.asyncio
+async def test_shaped_server(shaped_server, event_loop):
+    url = 'tftp://127.0.0.1:1079/firmware.bin'
+
+    async def fetch():
+        start = time.monotonic()
+        async with aiotftp.read(url, blksize=1428, windowsize=8,
+                                loop=event_loop) as response:
+            assert len(await response.data()) == 200000
+        return time.monotonic() - start
+
+    shaped = await fetch()
+    assert shaped > 0.15
+
+    # Unlimited again, at runtime
+    shaped_server.per_session = None
+    assert await fetch() < shaped / 2
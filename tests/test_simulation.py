@@ -0,0 +1,153 @@
+import asyncio
+import time
+
+import aiotftp
+from aiotftp.simulation import Profile, SimulatedLoop
+import pytest
+
+from .conftest import FILES
+
+LOSSY = Profile(loss=0.1, duplicate=0.05, reorder=0.1, delay=0.02,
+                jitter=0.01)
+
+
+@pytest.fixture
+def event_loop():
+    loop = SimulatedLoop(LOSSY, seed=1)
+    yield loop
+    loop.close()
+
+
+class Collect(asyncio.DatagramProtocol):
+    def __init__(self, loop):
+        self.received = []
+        self._loop = loop
+
+    def datagram_received(self, data, addr):
+        self.received.append((self._loop.time(), data))
+
+
+def transfer(profile, seed, size=200 * 1024):
+    payload = bytes(range(256)) * (size // 256)
+    loop = SimulatedLoop(profile, seed=seed)
+
+    async def rrq(request):
+        return aiotftp.Response(payload)
+
+    async def run():
+        server = aiotftp.Server(rrq, None, access_log=None)
+        _, handler = await loop.create_datagram_endpoint(
+            server, local_addr=('127.0.0.1', 69))
+        async with aiotftp.read('tftp://127.0.0.1/file', windowsize=4,
+                                loop=loop) as response:
+            assert await response.data() == payload
+        finished = loop.time()
+        await handler.shutdown(timeout=1)
+        return finished
+
+    try:
+        finished = loop.run_until_complete(run())
+        network = loop.network
+        return finished, network.sent, network.dropped, network.duplicated
+    finally:
+        loop.close()
+
+
+def test_repeatable():
+    first = transfer(LOSSY, seed=7)
+    assert first[2] > 0 and first[3] > 0
+    assert transfer(LOSSY, seed=7) == first
+    assert transfer(LOSSY, seed=8) != first
+
+
+def test_virtual_clock():
+    # A 4 MiB download at 64 KiB/s with a 250ms round trip and some
+    # loss is a minute or more of simulated time
+    profile = Profile(loss=0.01, delay=0.125, bandwidth=64 * 1024)
+    start = time.perf_counter()
+    finished, _, dropped, _ = transfer(profile, seed=1, size=4 * 1024 * 1024)
+
+    assert dropped > 0
+    assert finished > 64
+    assert time.perf_counter() - start < finished / 4
+
+
+@pytest.mark.asyncio
+async def test_lossy_transfers(server, event_loop):
+    url = 'tftp://127.0.0.1:1069/'
+    for filename, contents in FILES.items():
+        async with aiotftp.read(url + filename, loop=event_loop) as response:
+            assert await response.data() == contents
+        await aiotftp.write(url + filename, data=contents, loop=event_loop)
+        assert await server.wrq_files[filename] == contents
+
+    assert event_loop.network.dropped > 0
+
+
+@pytest.mark.asyncio
+async def test_link_profiles(event_loop):
+    network = event_loop.network
+    network.profile = Profile(delay=0.1)
+    network.links['10.0.0.1', '10.0.0.2'] = Profile(
+        bandwidth=1000, buffer=2000)
+
+    receiver, protocol = await event_loop.create_datagram_endpoint(
+        lambda: Collect(event_loop), local_addr=('10.0.0.2', 69))
+    sender, _ = await event_loop.create_datagram_endpoint(
+        asyncio.DatagramProtocol, local_addr=('10.0.0.1', 0))
+    local, _ = await event_loop.create_datagram_endpoint(
+        asyncio.DatagramProtocol, remote_addr=('10.0.0.2', 69))
+
+    start = event_loop.time()
+    for n in range(5):
+        sender.sendto(bytes([n]) * 1000, ('10.0.0.2', 69))
+    local.sendto(b'x')
+    await asyncio.sleep(10)
+
+    # The loopback address has the default profile
+    assert local.get_extra_info('sockname')[0] == '127.0.0.1'
+    assert protocol.received[0] == (start + 0.1, b'x')
+
+    # Each block takes a second to send, and two queued behind the
+    # first fill the buffer
+    arrivals = [(round(when - start, 6), data[0])
+                for when, data in protocol.received[1:]]
+    assert arrivals == [(1.0, 0), (2.0, 1), (3.0, 2)]
+    assert network.dropped == 2
+
+    for transport in (receiver, sender, local):
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_executor_takes_no_time(event_loop):
+    start = event_loop.time()
+    await asyncio.wait_for(
+        event_loop.run_in_executor(None, time.sleep, 0.2), timeout=0.1)
+    assert event_loop.time() == start
+
+
+def test_file_transfer(tmp_path):
+    payload = bytes(range(256)) * 1024
+    path = tmp_path / 'file'
+    path.write_bytes(payload)
+    loop = SimulatedLoop(Profile(delay=0.01), seed=1)
+
+    async def rrq(request):
+        return aiotftp.FileResponse(str(path))
+
+    async def run():
+        server = aiotftp.Server(rrq, None, access_log=None)
+        _, handler = await loop.create_datagram_endpoint(
+            server, local_addr=('127.0.0.1', 69))
+        try:
+            async with aiotftp.read('tftp://127.0.0.1/file',
+                                    loop=loop) as response:
+                return await response.data()
+        finally:
+            await handler.shutdown(timeout=1)
+
+    try:
+        assert loop.run_until_complete(run()) == payload
+    finally:
+        loop.close()
@@ -0,0 +1,122 @@
+import asyncio
+import io
+import os
+import tracemalloc
+
+from aiotftp.streams import StreamReader
+import pytest
+
+
+@pytest.fixture
+def stream(event_loop):
+    stream = StreamReader(loop=event_loop)
+    for chunk in (b'hello', b' ', b'world'):
+        stream.feed_data(chunk)
+    stream.feed_eof()
+    return stream
+
+
+@pytest.mark.asyncio
+async def test_read(stream):
+    assert await stream.read(0) == b''
+    assert await stream.read(3) == b'hel'
+    assert await stream.read(4) == b'lo w'
+    assert await stream.read() == b'orld'
+    assert await stream.read() == b''
+    assert await stream.read(3) == b''
+
+
+@pytest.mark.asyncio
+async def test_read_waits(event_loop):
+    stream = StreamReader(loop=event_loop)
+    event_loop.call_soon(stream.feed_data, b'abcdef')
+
+    assert await stream.read(4) == b'abcd'
+    assert await stream.read(4) == b'ef'
+
+
+@pytest.mark.asyncio
+async def test_readexactly(event_loop):
+    stream = StreamReader(loop=event_loop)
+    stream.feed_data(b'ab')
+    event_loop.call_soon(stream.feed_data, b'cdef')
+    event_loop.call_soon(stream.feed_eof)
+
+    assert await stream.readexactly(3) == b'abc'
+    with pytest.raises(asyncio.IncompleteReadError) as excinfo:
+        await stream.readexactly(5)
+    assert excinfo.value.partial == b'def'
+    assert excinfo.value.expected == 5
+
+
+@pytest.mark.asyncio
+async def test_readinto(stream):
+    buffer = bytearray(4)
+    assert await stream.readinto(buffer) == 4
+    assert buffer == b'hell'
+    assert await stream.readinto(memoryview(buffer)[1:]) == 3
+    assert buffer == b'ho w'
+    assert await stream.readinto(buffer) == 4
+    assert buffer == b'orld'
+    assert await stream.readinto(buffer) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('sizehint', [0, 4, 11, 100, lambda: 11])
+async def test_readall(sizehint, stream):
+    payload = await stream.readall(sizehint)
+    assert isinstance(payload, bytearray)
+    assert payload == b'hello world'
+
+
+@pytest.mark.asyncio
+async def test_readall_huge_sizehint(event_loop):
+    stream = StreamReader(limit=1024, loop=event_loop)
+    for _ in range(8):
+        stream.feed_data(b'x' * 512)
+    stream.feed_eof()
+
+    tracemalloc.start()
+    try:
+        payload = await stream.readall(1 << 40)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert payload == b'x' * 4096
+    assert peak < 64 * 1024
+
+
+@pytest.mark.asyncio
+async def test_copy_to_file(stream):
+    sink = io.BytesIO()
+    assert await stream.copy_to(sink) == 11
+    assert sink.getvalue() == b'hello world'
+
+
+@pytest.mark.asyncio
+async def test_copy_to_fd(stream, tmpdir):
+    path = str(tmpdir.join('copy'))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    try:
+        assert await stream.copy_to(fd) == 11
+    finally:
+        os.close(fd)
+
+    with open(path, 'rb') as fobj:
+        assert fobj.read() == b'hello world'
+
+
+@pytest.mark.asyncio
+async def test_copy_to_coroutine(stream):
+    class Sink:
+        def __init__(self):
+            self.chunks = []
+
+        async def write(self, data):
+            await asyncio.sleep(0)
+            self.chunks.append(data)
+
+    sink = Sink()
+    assert await stream.copy_to(sink) == 11
+    assert b''.join(sink.chunks) == b'hello world'
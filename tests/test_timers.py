@@ -0,0 +1,92 @@
+import asyncio
+import gc
+import weakref
+
+from aiotftp.timers import get_timer_queue
+import pytest
+
+
+@pytest.fixture
+def queue(event_loop):
+    return get_timer_queue(event_loop)
+
+
+def test_queue_per_loop(event_loop, queue):
+    assert get_timer_queue(event_loop) is queue
+
+    other = asyncio.new_event_loop()
+    try:
+        assert get_timer_queue(other) is not queue
+    finally:
+        other.close()
+
+
+def test_queues_released_with_loop():
+    loops = []
+    for _ in range(3):
+        loop = asyncio.new_event_loop()
+        get_timer_queue(loop).schedule(loop.time() + 1, lambda: None)
+        loop.close()
+        loops.append(weakref.ref(loop))
+    del loop
+    gc.collect()
+
+    assert [ref() for ref in loops] == [None] * 3
+
+
+@pytest.mark.asyncio
+async def test_fires_in_order(event_loop, queue):
+    fired = []
+    now = event_loop.time()
+    for delay in (0.03, 0.01, 0.02):
+        queue.schedule(now + delay, lambda delay=delay: fired.append(delay))
+
+    await asyncio.sleep(0.05)
+    assert fired == [0.01, 0.02, 0.03]
+
+
+@pytest.mark.asyncio
+async def test_reschedule(event_loop, queue):
+    fired = []
+    now = event_loop.time()
+    later = queue.schedule(now + 0.01, lambda: fired.append('later'))
+    sooner = queue.schedule(now + 0.04, lambda: fired.append('sooner'))
+
+    later.reschedule(now + 0.03)
+    sooner.reschedule(now + 0.02)
+    await asyncio.sleep(0.05)
+
+    assert fired == ['sooner', 'later']
+    assert not later.active and not sooner.active
+
+
+@pytest.mark.asyncio
+async def test_cancel(event_loop, queue):
+    fired = []
+    timer = queue.schedule(event_loop.time() + 0.01, lambda: fired.append(1))
+    timer.cancel()
+
+    await asyncio.sleep(0.02)
+    assert fired == []
+
+    timer.reschedule(event_loop.time() + 0.01)
+    await asyncio.sleep(0.02)
+    assert fired == [1]
+
+
+@pytest.mark.asyncio
+async def test_rescheduling_callback(event_loop, queue):
+    fired = []
+
+    def expired():
+        fired.append(event_loop.time())
+        timer.reschedule(event_loop.time() + 0.001)
+
+    timer = queue.schedule(event_loop.time() + 0.001, expired)
+    scheduled = len(event_loop._scheduled)
+    await asyncio.sleep(0.2)
+    timer.cancel()
+
+    # One loop timer for the queue, not one more per firing
+    assert len(fired) > 20
+    assert len(event_loop._scheduled) <= scheduled + 1
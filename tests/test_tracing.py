@@ -0,0 +1,147 @@
+import asyncio
+
+import aiotftp
+from aiotftp import tracing
+from aiotftp.packet import Error, ErrorCode, Mode, Opcode, Request
+from aiotftp.tracing import RingTracer
+from async_generator import yield_, async_generator
+from async_timeout import timeout
+import pytest
+
+from .conftest import FILES
+
+
+def test_ring_wraps():
+    tracer = RingTracer(capacity=4)
+    trace = tracer.start(('10.0.0.1', 1000), Opcode.RRQ, 'boot.cfg', 1.0)
+    for blockid in range(1, 6):
+        trace.event(tracing.SENT, 1.0 + blockid, blockid)
+
+    assert len(tracer) == 4
+    assert [record[3] for record in tracer.records()] == [2, 3, 4, 5]
+    assert tracer.sessions[0]['filename'] == 'boot.cfg'
+
+
+def test_summarize():
+    timeline = [
+        (tracing.REQUEST, 10.0, 1),
+        (tracing.START, 10.5, 0),
+        (tracing.HANDLER, 11.5, 0),
+        (tracing.ENDPOINT, 11.75, 0),
+        (tracing.SENT, 12.0, 1),
+        (tracing.ACKED, 12.25, 1),
+        (tracing.SENT, 12.25, 2),
+        (tracing.TIMEOUT, 14.25, 0),
+        (tracing.RESENT, 14.25, 2),
+        (tracing.ACKED, 14.5, 2),
+        (tracing.COMPLETE, 14.5, 600),
+    ]
+    records = [(7, time, kind, value) for kind, time, value in timeline]
+
+    summary = tracing.summarize(records)[7]
+    assert summary == {
+        'total': 4.5,
+        'queued': 0.5,
+        'handler': 1.0,
+        'endpoint': 0.25,
+        'negotiating': 0.25,
+        'transferring': 2.5,
+        'stalled': 2.0,
+        'blocks': 2,
+        'resent': 1,
+        'timeouts': 1,
+        'status': 'complete',
+    }
+
+
+@pytest.fixture
+@async_generator
+async def traced_server(event_loop):
+    async def rrq(request):
+        if request.filename == 'abandoned':
+            return aiotftp.Response(b'x' * 2000)
+        if request.filename not in FILES:
+            raise FileNotFoundError(request.filename)
+        return aiotftp.Response(FILES[request.filename])
+
+    async def wrq(request):
+        await request.read()
+
+    tracer = RingTracer(capacity=1024)
+    server = aiotftp.Server(rrq, wrq, tracer=tracer)
+    transport, handler = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1080))
+
+    await yield_(tracer)
+    await handler.shutdown(timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_traced_transfers(traced_server, event_loop, tmpdir):
+    url = 'tftp://127.0.0.1:1080/'
+    async with aiotftp.read(url + 'large_file', loop=event_loop) as response:
+        await response.data()
+    await aiotftp.write(url + 'upload', data=b'x' * 1000, loop=event_loop)
+    with pytest.raises(FileNotFoundError):
+        async with aiotftp.read(url + 'missing', loop=event_loop) as response:
+            await response.data()
+
+    # The upload handler finishes just after the client has its last ACK
+    async with timeout(1):
+        while sum(kind == tracing.COMPLETE
+                  for _, _, kind, _ in traced_server.records()) < 2:
+            await asyncio.sleep(0.01)
+
+    path = str(tmpdir.join('trace.bin'))
+    traced_server.dump(path)
+    records, sessions = tracing.load(path)
+    assert records == list(traced_server.records())
+
+    kinds = {}
+    for session_id, _, kind, _ in records:
+        kinds.setdefault(session_id, []).append(kind)
+    by_name = {sessions[session_id]['filename']: events
+               for session_id, events in kinds.items()}
+
+    assert by_name['large_file'][:4] == [tracing.REQUEST, tracing.START,
+                                         tracing.HANDLER, tracing.ENDPOINT]
+    assert by_name['large_file'].count(tracing.SENT) == 2
+    assert by_name['large_file'][-1] == tracing.COMPLETE
+    assert by_name['upload'].count(tracing.RECEIVED) == 2
+    assert tracing.ERROR in by_name['missing']
+
+    summaries = tracing.summarize(records)
+    statuses = {sessions[session_id]['filename']: summary['status']
+                for session_id, summary in summaries.items()}
+    assert statuses == {'large_file': 'complete', 'upload': 'complete',
+                        'missing': 'error'}
+
+    tracing.main([path])
+
+
+class Abandon(asyncio.DatagramProtocol):
+    """Request a file, then answer its first block with an error."""
+
+    def connection_made(self, transport):
+        self.transport = transport
+        request = Request(Opcode.RRQ, filename='abandoned', mode=Mode.OCTET)
+        transport.sendto(bytes(request), ('127.0.0.1', 1080))
+
+    def datagram_received(self, data, addr):
+        error = Error(ErrorCode.NOTDEFINED, message='Changed my mind')
+        self.transport.sendto(bytes(error), addr)
+        self.transport.close()
+
+
+@pytest.mark.asyncio
+async def test_traced_abort(traced_server, event_loop):
+    await event_loop.create_datagram_endpoint(
+        Abandon, local_addr=('127.0.0.1', 0))
+
+    async with timeout(1):
+        while not any(kind == tracing.ABORTED
+                      for _, _, kind, _ in traced_server.records()):
+            await asyncio.sleep(0.01)
+
+    summary, = tracing.summarize(traced_server.records()).values()
+    assert summary['status'] == 'aborted'
@@ -0,0 +1,206 @@
+import asyncio
+
+from aiotftp.packet import (Ack, Data, Error, ErrorCode, Mode, Opcode,
+                            OptionAck, parse, Request)
+from aiotftp.protocol import InboundDataProtocol
+from aiotftp.streams import StreamReader
+import aiotftp
+import pytest
+
+PEER = ('127.0.0.1', 6969)
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr=None):
+        self.sent.append(parse(data))
+
+    def close(self):
+        pass
+
+
+class WindowedClient(asyncio.DatagramProtocol):
+    """Acknowledge at RFC 7440 window boundaries, dropping some blocks."""
+
+    def __init__(self, request, loop, drop=()):
+        self.request = request
+        self.received = bytearray()
+        self.blksize = int(request.options['blksize'])
+        self.windowsize = int(request.options['windowsize'])
+        self.expected = 1
+        self.pending = 0
+        self.drop = set(drop)
+        self.oacks = []
+        self._waiter = loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.sendto(bytes(self.request), ('127.0.0.1', 1069))
+
+    def datagram_received(self, data, addr):
+        try:
+            packet = parse(data)
+            if isinstance(packet, OptionAck):
+                self.oacks.append(packet.options)
+                return self.send_ack(0, addr)
+
+            assert isinstance(packet, Data)
+            if packet.blockid in self.drop:
+                self.drop.remove(packet.blockid)
+                return
+
+            if packet.blockid != self.expected:
+                return self.send_ack(self.expected - 1, addr)
+
+            self.received.extend(packet.data)
+            self.expected += 1
+            self.pending += 1
+
+            last = len(packet.data) < self.blksize
+            if last or self.pending == self.windowsize:
+                self.pending = 0
+                self.send_ack(packet.blockid, addr)
+            if last:
+                self._waiter.set_result(self.received)
+                self.transport.close()
+        except Exception as exc:
+            self._waiter.set_exception(exc)
+            self.transport.close()
+
+    def send_ack(self, blockid, addr):
+        self.transport.sendto(bytes(Ack(blockid)), addr)
+
+    async def wait(self):
+        return await self._waiter
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('drop', [(), (1,), (3, 6)], ids=repr)
+async def test_read_windowed(filename, contents, drop, server, event_loop):
+    options = {'blksize': '8', 'windowsize': '4'}
+    rrq = Request(Opcode.RRQ, filename=filename, mode=Mode.OCTET,
+                  options=options)
+    _, protocol = await event_loop.create_datagram_endpoint(
+        lambda: WindowedClient(rrq, event_loop, drop=drop),
+        local_addr=('127.0.0.1', 0))
+
+    assert await protocol.wait() == contents
+    assert protocol.oacks == [options]
+
+
+@pytest.mark.asyncio
+async def test_read_client_windowed(filename, contents, server, event_loop):
+    url = 'tftp://127.0.0.1:1069/{}'.format(filename)
+
+    response = aiotftp.read(url, blksize=8, windowsize=4, loop=event_loop)
+    async with response:
+        assert await response.data() == contents
+
+
+@pytest.mark.asyncio
+async def test_write_windowed(filename, contents, server, event_loop):
+    url = 'tftp://127.0.0.1:1069/{}'.format(filename)
+
+    await aiotftp.write(url, data=contents, blksize=8, windowsize=4,
+                        loop=event_loop)
+    assert await server.wrq_files[filename] == contents
+
+
+@pytest.fixture
+def receiver(event_loop):
+    stream = StreamReader(loop=event_loop)
+    protocol = InboundDataProtocol(stream, tid=PEER, loop=event_loop)
+    protocol.connection_made(RecordingTransport())
+    protocol.start({'blksize': 8, 'windowsize': 4})
+    return protocol
+
+
+def feed(protocol, *blockids, size=8):
+    for blockid in blockids:
+        packet = Data(blockid=blockid, data=bytes([blockid]) * size)
+        protocol.datagram_received(bytes(packet), PEER)
+
+
+def test_receiver_acks_per_window(receiver):
+    feed(receiver, 1, 2, 3, 4, 5, 6, 7, 8, 9)
+    feed(receiver, 10, size=0)
+
+    assert receiver.transport.sent == [
+        OptionAck({'blksize': '8', 'windowsize': '4'}),
+        Ack(4), Ack(8), Ack(10)]
+    assert receiver.stream.is_eof()
+
+
+def test_receiver_requests_resend_once(receiver):
+    feed(receiver, 1, 3, 4, 2, 3)
+    assert receiver.transport.sent[1:] == [Ack(1)]
+
+    feed(receiver, 4, 5)
+    assert receiver.transport.sent[1:] == [Ack(1), Ack(5)]
+
+
+class AbortingClient(asyncio.DatagramProtocol):
+    """Answer the first window of DATA with an ERROR, then keep listening."""
+
+    def __init__(self, request, port):
+        self.request = request
+        self.port = port
+        self.after_error = []
+        self.aborted = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.sendto(bytes(self.request), ('127.0.0.1', self.port))
+
+    def datagram_received(self, data, addr):
+        packet = parse(data)
+        if self.aborted:
+            self.after_error.append(packet)
+        elif isinstance(packet, OptionAck):
+            self.transport.sendto(bytes(Ack(0)), addr)
+        elif packet.blockid == int(self.request.options['windowsize']):
+            self.aborted = True
+            error = Error(ErrorCode.NOTDEFINED, message='Aborted')
+            self.transport.sendto(bytes(error), addr)
+
+
+class RecordingEngine:
+    def __init__(self, loop):
+        self.transports = []
+        self._loop = loop
+
+    async def create_datagram_endpoint(self, protocol_factory, **kwargs):
+        transport, protocol = await self._loop.create_datagram_endpoint(
+            protocol_factory, **kwargs)
+        self.transports.append(transport)
+        return transport, protocol
+
+
+@pytest.mark.asyncio
+async def test_read_aborted_by_client(event_loop):
+    async def rrq(request):
+        return aiotftp.Response(b'x' * 20000)
+
+    engine = RecordingEngine(event_loop)
+    server = aiotftp.Server(rrq, None, max_rto=0.2, io_engine=engine)
+    _, handler = await event_loop.create_datagram_endpoint(
+        server, local_addr=('127.0.0.1', 1083))
+
+    rrq_packet = Request(Opcode.RRQ, filename='file', mode=Mode.OCTET,
+                         options={'windowsize': '4'})
+    client, protocol = await event_loop.create_datagram_endpoint(
+        lambda: AbortingClient(rrq_packet, 1083),
+        local_addr=('127.0.0.1', 0))
+    try:
+        # Long enough for several retransmission timeouts
+        await asyncio.sleep(1)
+    finally:
+        client.close()
+        await handler.shutdown(timeout=1)
+
+    assert protocol.aborted
+    assert protocol.after_error == []
+    transport, = engine.transports
+    assert transport.is_closing()